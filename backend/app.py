@@ -1,349 +1,527 @@
+import time
+_IMPORT_START = time.perf_counter()
+
 from flask import Flask, request, jsonify
 from flask_cors import CORS
-import base64
-import io
-import json
+from werkzeug.exceptions import RequestEntityTooLarge
+import functools
+import hmac
+import math
 import os
-import subprocess
+import shutil
 import tempfile
-from PIL import Image
+import threading
 from datetime import datetime
 
+from caluculate import CLASS_ID_TO_CODE, MIN_CONFIDENCE, build_hand, score_hand, tiles_list_to_string
+from inference_config import load_inference_config
+from inference_server import InferenceServer, SlotPoolExhausted
+from ingest import (MAX_REQUEST_BYTES, ImageRejected, ImageTooLarge, decode_bgr, finish_request,
+                    load_upload, memory_summary, open_upload, save_jpeg, start_request)
+from model_registry import ModelRegistry
+from profiling import ProfilerBusy, load_result, request_finished, request_started, stage, start_profile
+from session import SessionStore, WIND_TO_ENGLISH, apply_delta, new_state, normalize_wind, rescore
+
 app = Flask(__name__)
 CORS(app)
+# 要求本体の大きさの上限（超えた場合は読み込む前に 413 を返す）
+app.config['MAX_CONTENT_LENGTH'] = MAX_REQUEST_BYTES
+
+@app.before_request
+def check_content_length():
+    """
+    MAX_CONTENT_LENGTH の確認を表示関数より前に行う（入力ストリームを開くだけで、本体は読まない）
+
+    表示関数の中で request.json を読んだときに確認されると、except Exception で 500 にされてしまうため。
+    """
+    request.stream
+
+@app.errorhandler(RequestEntityTooLarge)
+def request_too_large(e):
+    return jsonify({'error': f'リクエストが大きすぎます（上限 {MAX_REQUEST_BYTES // (1024 * 1024)}MB）'}), 413
+
+# 要求を処理中のスレッドを記録する（プロファイルはこのスレッドだけを標本にする）
+app.before_request(request_started)
+app.teardown_request(lambda exc: request_finished())
+# 要求ごとに画像の取り込みで確保したバッファの大きさを見積もる
+app.before_request(start_request)
+
+@app.after_request
+def report_request_memory(response):
+    """画像を扱った要求は、画像バッファの見積もりのピークを応答ヘッダーとログに出す（実測ではない）"""
+    peak = finish_request()
+    if peak:
+        response.headers['X-Image-Buffer-Estimate-Bytes'] = str(peak)
+        print(f'🧮 画像バッファの見積もりのピーク: {peak / (1024 * 1024):.1f}MB ({request.path})')
+    return response
 
 # デバッグ用画像保存フォルダ
 DEBUG_IMAGES_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'debug_images')
 os.makedirs(DEBUG_IMAGES_DIR, exist_ok=True)
 
-def save_base64_image(image_data, filename):
-    """Base64画像データをファイルに保存"""
+# 単牌修正用のセッション（認識済みの手牌・ドラ・オプションを保持）
+SESSIONS = SessionStore()
+
+def warm_up_detector(model):
+    """
+    検出モデルを手牌・ドラ（設定の入力サイズ）と卓全体（table.TILE_SIZE のタイル）の大きさで温める
+
+    レジストリが新しく読み込んだモデルを採用モデルとして差し込む前にも呼ぶ。
+    """
+    from detector import warm_up
+    from table import BATCH_SIZE as TABLE_BATCH_SIZE, TILE_SIZE
+    
+    config = INFERENCE_CONFIG
+    shapes = warm_up(model, [config['imgsz']], sorted({1, int(config['batch_size'])}))
+    shapes.update(warm_up(model, [TILE_SIZE], sorted({1, TABLE_BATCH_SIZE})))
+    return shapes
+
+# 検出モデルのレジストリ（採用モデルの無停止切り替え・候補モデルのシャドー評価）
+REGISTRY = ModelRegistry(warm=warm_up_detector)
+
+# 管理API（モデル切り替えなど）の認証トークン。未設定の場合は管理APIを無効にする
+ADMIN_TOKEN = os.environ.get('ADMIN_TOKEN')
+
+# /api/payments で一度に計算する行数の上限
+MAX_PAYMENT_ROWS = 100000
+
+# 推論設定（inference_config.json）。リクエストごとに読み直さないよう起動時に一度だけ読み込む
+INFERENCE_CONFIG = load_inference_config()
+
+# 手牌認識エンジン（"yolo": 物体検出 / "segment": 列分割＋牌分類）
+RECOGNITION_ENGINE = os.environ.get('RECOGNITION_ENGINE', 'yolo')
+# 列分割エンジンの牌分類モデル
+CLS_MODEL_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'models', 'tile_cls.pt')
+
+# 推論プロセス（USE_INFERENCE_SERVER=1 の場合、モデルは専用プロセスが持ち、画像は共有メモリのスロットで渡す）
+INFERENCE = None
+
+# app.py の読み込み時間の目安（ミリ秒）。torch / ultralytics / cv2 は読み込み時ではなくウォームアップで読み込む
+IMPORT_BUDGET_MS = float(os.environ.get('IMPORT_BUDGET_MS', '1000'))
+
+# 起動時のウォームアップの状態（/api/ready で返す）
+READINESS = {'ready': False, 'stage': 'starting', 'import_ms': None, 'import_budget_ms': IMPORT_BUDGET_MS,
+             'import_over_budget': False, 'warmup_ms': None, 'shapes': {}, 'error': None}
+
+# ウォームアップ用の和了形（点数計算ライブラリの読み込みと初回計算を済ませる）
+WARMUP_HAND = ['1m', '2m', '3m', '4p', '5p', '6p', '7s', '8s', '9s', '2z', '2z', '2z', '5m', '5m']
+
+def warm_up_inference():
+    """
+    要求の処理で使うライブラリとモデルを読み込み、実際に推論する入力サイズ・バッチサイズごとに
+    ダミー推論してから準備完了にする
+
+    手牌・ドラ・単一牌（設定の入力サイズ）、卓全体（table.TILE_SIZE のタイル）、
+    列分割エンジンの牌分類（segment.CLS_IMGSZ）をすべてこのプロセス（または推論プロセス）で温める。
+    推論プロセスを使う場合、検出モデルは推論プロセスだけが読み込む（Webワーカーでは読み込まない）。
+    """
     try:
-        # base64デコード
-        if ',' in image_data:
-            image_data = image_data.split(',')[1]
-        
-        image_bytes = base64.b64decode(image_data)
-        image = Image.open(io.BytesIO(image_bytes))
-        
-        # 一時ファイルに保存
-        temp_path = os.path.join(tempfile.gettempdir(), filename)
-        image.save(temp_path, 'JPEG')
-        return temp_path
+        t0 = time.perf_counter()
+        READINESS['stage'] = 'imports'
+        import cv2  # noqa: F401  画像のデコード・切り出し
+        if INFERENCE is None:
+            import detector  # noqa: F401  torch / ultralytics
+        
+        READINESS['stage'] = 'scoring'
+        # /api/calculate と同じ経路（14枚の復元 → 点数計算）を一度通す
+        hand = build_hand([{'class_id': CLASS_ID_TO_CODE.index(code), 'confidence': 1.0,
+                            'bbox': [i * 50, 0, i * 50 + 45, 60]} for i, code in enumerate(WARMUP_HAND)])
+        score_hand(hand['tiles'], hand['win_tile'])
+        
+        shapes = {}
+        if INFERENCE is not None:
+            # 検出モデル（手牌・ドラ・卓全体のタイル）の読み込みとウォームアップは推論プロセス側で行う
+            READINESS['stage'] = 'inference_server'
+            while not INFERENCE.ready.wait(timeout=1.0):
+                pass
+        else:
+            # レジストリが読み込み時に warm_up_detector で温める
+            READINESS['stage'] = 'model'
+            version, _ = REGISTRY.active()
+            shapes.update(REGISTRY.status()['models'][version]['warmup'] or {})
+        if RECOGNITION_ENGINE == 'segment' and os.path.exists(CLS_MODEL_PATH):
+            # 列分割エンジンの牌分類モデルは推論プロセスを使う場合もこのプロセスで推論する
+            from detector import load_model, warm_up
+            from segment import CLS_IMGSZ, EXPECTED_SLOT_COUNTS
+            READINESS['stage'] = 'warmup'
+            shapes.update({f'cls_{k}': v for k, v in
+                           warm_up(load_model(CLS_MODEL_PATH), [CLS_IMGSZ], [max(EXPECTED_SLOT_COUNTS)]).items()})
+        READINESS['shapes'] = shapes
+        
+        READINESS['warmup_ms'] = round((time.perf_counter() - t0) * 1000, 1)
+        READINESS['stage'] = 'ready'
+        READINESS['ready'] = True
+        print(f"🔥 ウォームアップ完了: {READINESS['warmup_ms']}ms {READINESS['shapes']}")
+    except Exception as e:
+        READINESS['stage'] = 'failed'
+        READINESS['error'] = str(e)
+        print(f"🚨 ウォームアップ失敗: {e}")
+
+def start_inference_server():
+    """推論プロセスを起動する（Webワーカーを fork する前に呼ぶ）"""
+    global INFERENCE
+    import atexit
+    from table import TILE_SIZE
+    # 手牌・ドラの入力サイズと、卓全体（/api/table）のタイルの大きさを推論プロセスで温める
+    INFERENCE = InferenceServer(REGISTRY.active_path(), imgsz_list=[INFERENCE_CONFIG['imgsz'], TILE_SIZE]).start()
+    # fork したWebワーカーにも引き継がれるが、stop() は起動したプロセスでだけ働く
+    atexit.register(INFERENCE.stop)
+    print('🧠 推論プロセスを起動しました')
+
+def start_warmup():
+    """ウォームアップを別スレッドで開始する（その間も /api/health は応答する）"""
+    threading.Thread(target=warm_up_inference, daemon=True).start()
+
+def save_base64_image(image_data, filename, output_dir, max_side=None):
+    """
+    Base64画像データをリクエストごとの一時ディレクトリ output_dir に保存
+    （max_side を指定した場合は長辺 max_side まで縮小デコードする）
+    
+    Raises:
+        ImageRejected: 大きすぎる・読み込めない画像
+    """
+    image = load_upload(image_data, max_side=max_side)
+    try:
+        # 同時リクエストで同じファイル名が衝突しないよう、リクエストごとの一時ディレクトリに保存
+        return save_jpeg(image, os.path.join(output_dir, filename))
     except Exception as e:
         print(f"画像保存エラー: {e}")
         return None
 
-def save_debug_image(image_data, image_type):
-    """デバッグ用に画像を保存"""
+def save_debug_image(image_path, image_type):
+    """デバッグ用に保存済みの画像をコピー（デコードし直さない）"""
     try:
-        # base64デコード
-        if ',' in image_data:
-            image_data = image_data.split(',')[1]
-        
-        image_bytes = base64.b64decode(image_data)
-        image = Image.open(io.BytesIO(image_bytes))
-        
         # タイムスタンプ付きファイル名を生成
         timestamp = datetime.now().strftime("%Y%m%d_%H%M%S_%f")[:-3]  # ミリ秒まで
         filename = f"{timestamp}_{image_type}.jpg"
-        debug_path = os.path.join(DEBUG_IMAGES_DIR, filename)
-        
-        # デバッグフォルダに保存
-        image.save(debug_path, 'JPEG', quality=95)
+        shutil.copyfile(image_path, os.path.join(DEBUG_IMAGES_DIR, filename))
         print(f"🖼️ デバッグ画像保存: {filename}")
-        return debug_path
+        return os.path.join(DEBUG_IMAGES_DIR, filename)
     except Exception as e:
         print(f"🚨 デバッグ画像保存エラー: {e}")
         return None
 
-def run_process_script(image_path, output_dir):
-    """process.pyを実行して牌認識を行う"""
-    try:
-        # process.pyを実行
-        cmd = [
-            'python', 'process.py',
-            '--input', image_path,
-            '--output', output_dir
-        ]
-        
-        result = subprocess.run(cmd, capture_output=True, text=True, cwd=os.path.dirname(os.path.abspath(__file__)))
-        
-        if result.returncode != 0:
-            print(f"process.py実行エラー: {result.stderr}")
-            return None
-        
-        # 結果JSONファイルを探す
-        json_files = [f for f in os.listdir(output_dir) if f.endswith('.json')]
-        if not json_files:
-            return None
-        
-        json_path = os.path.join(output_dir, json_files[0])
-        with open(json_path, 'r', encoding='utf-8') as f:
-            return json.load(f)
-            
-    except Exception as e:
-        print(f"process.py実行エラー: {e}")
-        return None
+def image_error_response(e):
+    """ImageRejected のエラー応答（大きすぎる画像は 413）"""
+    return jsonify({'error': str(e)}), 413 if isinstance(e, ImageTooLarge) else 400
 
-def run_dora_script(image_path, output_dir):
-    """dora.pyを実行してドラ表示牌認識を行う"""
+def crop_region(image, rect, max_side):
+    """
+    正規化座標の範囲 {x, y, width, height}（0〜1）を切り出し、長辺が max_side を超える場合は縮小する
+    
+    Raises:
+        ValueError: 不正な範囲
+    """
+    import cv2
+    
     try:
-        # dora.pyを実行
-        cmd = [
-            'python', 'dora.py',
-            '--input', image_path,
-            '--output', output_dir
-        ]
-        
-        result = subprocess.run(cmd, capture_output=True, text=True, cwd=os.path.dirname(os.path.abspath(__file__)))
-        
-        if result.returncode != 0:
-            print(f"dora.py実行エラー: {result.stderr}")
-            return None
-        
-        # 結果JSONファイルを探す
-        json_files = [f for f in os.listdir(output_dir) if f.endswith('.json')]
-        if not json_files:
-            return None
-        
-        json_path = os.path.join(output_dir, json_files[0])
-        with open(json_path, 'r', encoding='utf-8') as f:
-            return json.load(f)
-            
-    except Exception as e:
-        print(f"dora.py実行エラー: {e}")
-        return None
+        x, y, w, h = (float(rect[k]) for k in ('x', 'y', 'width', 'height'))
+    except (KeyError, TypeError, ValueError):
+        raise ValueError(f'不正な切り出し範囲: {rect}')
+    height, width = image.shape[:2]
+    x1, y1 = max(0, int(x * width)), max(0, int(y * height))
+    x2, y2 = min(width, int((x + w) * width)), min(height, int((y + h) * height))
+    if x2 - x1 < 2 or y2 - y1 < 2:
+        raise ValueError(f'不正な切り出し範囲: {rect}')
+    crop = image[y1:y2, x1:x2]
+    scale = max_side / max(crop.shape[:2])
+    if scale < 1:
+        crop = cv2.resize(crop, (max(1, int(crop.shape[1] * scale)), max(1, int(crop.shape[0] * scale))),
+                          interpolation=cv2.INTER_AREA)
+    return crop
+
+def crop_uploaded_frames(frames_data, rects, max_side):
+    """
+    全体画像（連写の場合は複数フレーム）を1回ずつデコードし、手牌・ドラの範囲をサーバー側で切り出す
+    
+    Returns:
+        dict: {"hand": [BGR画像, ...], "dora": [...]}（範囲が指定されていない領域は含まない）
+    
+    Raises:
+        ImageRejected: 大きすぎる・読み込めない画像
+        ValueError: 不正な範囲
+    """
+    regions = {name: [] for name, rect in rects.items() if rect}
+    for frame_data in frames_data:
+        image = open_upload(frame_data)
+        # 切り出した範囲の長辺が max_side 以上残る大きさまで縮小してデコードする
+        image = decode_bgr(image, max_side=max(region_decode_side(rects[name], image.size, max_side)
+                                               for name in regions))
+        for name in regions:
+            regions[name].append(crop_region(image, rects[name], max_side))
+    return regions
 
-def run_calculate_script(hand_json_path, dora_json_path, options):
-    """caluculate.pyを実行して点数計算を行う"""
+def region_decode_side(rect, size, max_side):
+    """範囲 rect を長辺 max_side で切り出すのに必要な全体画像の長辺（範囲が不正な場合は元の大きさ）"""
+    width, height = size
     try:
-        # 一時JSONファイルを作成（hand_json_pathは既にJSONデータのリスト）
-        temp_json = os.path.join(tempfile.gettempdir(), 'temp_hand.json')
-        with open(temp_json, 'w', encoding='utf-8') as f:
-            json.dump(hand_json_path, f)
-        
-        # caluculate.pyを実行
-        cmd = [
-            'python', 'caluculate.py',
-            '--json', temp_json,
-            '--threshold', '0.5'
-        ]
-        
-        # オプションを追加
-        if options.get('riichi'):
-            cmd.append('--riichi')
-        if options.get('ron'):
-            cmd.append('--ron')
-        if options.get('closed'):
-            cmd.append('--closed')
-        
-        # 風の設定
-        if options.get('roundWind'):
-            cmd.extend(['--round_wind', options['roundWind']])
-        if options.get('playerWind'):
-            cmd.extend(['--seat_wind', options['playerWind']])
-        
-        # ドラ表示牌の設定
-        if dora_json_path:
-            print(f'🀅 ドラ表示牌処理開始: {len(dora_json_path)}枚の認識結果')
-            dora_codes = []
-            for i, detection in enumerate(dora_json_path):
-                confidence = detection.get('confidence', 0)
-                class_id = detection.get('class_id', 0)
-                print(f'  ドラ{i+1}: class_id={class_id}, confidence={confidence:.3f}')
-                
-                if confidence > 0.5:
-                    if 0 <= class_id < 40:  # 有効な牌の範囲
-                        tile_codes = [
-                            "1m","2m","3m","4m","5m","6m","7m","8m","9m",
-                            "1p","2p","3p","4p","5p","6p","7p","8p","9p",
-                            "1s","2s","3s","4s","5s","6s","7s","8s","9s",
-                            "1z","2z","3z","4z","5z","6z","7z",
-                            "0m","0p","0s"
-                        ]
-                        if class_id < len(tile_codes):
-                            tile_code = tile_codes[class_id]
-                            dora_codes.append(tile_code)
-                            print(f'    → 採用: {tile_code}')
-                        else:
-                            print(f'    → 無効なclass_id: {class_id}')
-                    else:
-                        print(f'    → class_id範囲外: {class_id}')
-                else:
-                    print(f'    → 信頼度不足: {confidence:.3f} < 0.5')
-            
-            if dora_codes:
-                print(f'📝 ドラコード配列: {dora_codes}')
-                dora_string = ''.join(dora_codes)
-                print(f'📝 結合結果: "{dora_string}"')
-                print(f'📝 結合後の長さ: {len(dora_string)}文字')
-                
-                cmd.extend(['--dora', dora_string])
-                print(f'✅ ドラ表示牌設定: {dora_string} ({len(dora_codes)}枚)')
-                
-                # コマンドライン引数を確認
-                print(f'📋 最終コマンド引数に含まれるドラ: --dora {dora_string}')
+        region_side = max(float(rect['width']) * width, float(rect['height']) * height)
+    except (KeyError, TypeError, ValueError):
+        return max(size)
+    if region_side <= max_side:
+        return max(size)
+    return int(math.ceil(max(size) * max_side / region_side))
+
+def save_debug_crop(image, image_type):
+    """サーバー側で切り出した画像をデバッグ用に保存"""
+    import cv2
+    
+    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S_%f")[:-3]  # ミリ秒まで
+    filename = f"{timestamp}_{image_type}.jpg"
+    with stage('image_encode'):
+        cv2.imwrite(os.path.join(DEBUG_IMAGES_DIR, filename), image, [cv2.IMWRITE_JPEG_QUALITY, 95])
+    print(f"🖼️ デバッグ画像保存: {filename}")
+
+def recognize_cropped(images, image_type, output_dir, hand=False, top_k=1):
+    """
+    切り出し済みの画像をウォームアップ済みのモデルで認識する（複数フレームの場合は連写合議）
+
+    推論プロセスがあれば共有メモリのスロット経由で、無ければこのプロセスの採用モデルで推論する
+    （リクエストごとにサブプロセスを起動して torch の読み込み・モデルの読み直しをしない）。
+    """
+    from consensus import fuse_frames
+    
+    save_debug_crop(images[0], image_type)
+    config = INFERENCE_CONFIG
+    top_k = 3 if len(images) > 1 else top_k
+    if len(images) > 1:
+        print(f'📸 連写モード: {len(images)}フレーム')
+    if hand and RECOGNITION_ENGINE == 'segment' and len(images) == 1:
+        return recognize_segment(images[0], image_type, output_dir, top_k=top_k)
+    if INFERENCE is not None:
+        # 推論プロセスへ共有メモリのスロット経由で渡す
+        t0 = time.perf_counter()
+        with stage('detector_subprocess'):
+            frames = INFERENCE.detect_many(images, imgsz=config['imgsz'], conf=config['conf'], top_k=top_k)
+        REGISTRY.mirror(images, frames, config['imgsz'], config['conf'], top_k=top_k,
+                        active_ms=(time.perf_counter() - t0) * 1000, hand=hand)
+    else:
+        with stage('yolo'):
+            frames = REGISTRY.predict(images, imgsz=config['imgsz'], conf=config['conf'], top_k=top_k, hand=hand)
+    if len(images) == 1:
+        return frames[0]
+    for i, dets in enumerate(frames, 1):
+        print(f"  フレーム{i}: {len(dets)}枚検出")
+    fused = fuse_frames(frames)
+    print(f"🗳️ 合議結果: {len(fused)}枚 ({len(frames)}フレーム)")
+    return fused
+
+def recognize_segment(image, image_type, output_dir, top_k=1):
+    """列分割＋牌分類エンジン（RECOGNITION_ENGINE=segment）で手牌を認識する（分割が曖昧な場合は採用モデルで検出）"""
+    import cv2
+    from segment import recognize_row
+    
+    image_path = os.path.join(output_dir, f'{image_type}.jpg')
+    with stage('image_encode'):
+        cv2.imwrite(image_path, image, [cv2.IMWRITE_JPEG_QUALITY, 95])
+    if INFERENCE is not None:
+        # 分割が曖昧な場合の検出は推論プロセスで行う
+        model, detect_many = None, INFERENCE.detect_many
+    else:
+        (_, model), detect_many = REGISTRY.active(), None
+    t0 = time.perf_counter()
+    with stage('yolo'):
+        detections, used_engine = recognize_row(image_path, CLS_MODEL_PATH, REGISTRY.active_path(),
+                                                top_k=top_k, det_model=model, config=INFERENCE_CONFIG,
+                                                detect_many=detect_many)
+    print(f"認識エンジン: {used_engine}")
+    if detections:
+        REGISTRY.mirror([image], [detections], INFERENCE_CONFIG['imgsz'], INFERENCE_CONFIG['conf'], top_k=top_k,
+                        active_ms=(time.perf_counter() - t0) * 1000, hand=True)
+    return detections
+
+def decode_base64_frames(frames_data, max_side):
+    """
+    Base64画像データ（連写の場合は複数フレーム）を一時ファイルを介さずBGR画像のリストにデコードする
+    
+    Raises:
+        ImageRejected: 大きすぎる・読み込めない画像
+    """
+    return [decode_bgr(open_upload(frame_data), max_side=max_side) for frame_data in frames_data]
+
+def dora_codes_from_detections(dora_detections):
+    """ドラ表示牌の認識結果から牌コードのリストを作成する"""
+    dora_codes = []
+    if not dora_detections:
+        print('ℹ️ ドラ表示牌データなし')
+        return dora_codes
+    
+    print(f'🀅 ドラ表示牌処理開始: {len(dora_detections)}枚の認識結果')
+    for i, detection in enumerate(dora_detections):
+        confidence = detection.get('confidence', 0)
+        class_id = detection.get('class_id', 0)
+        print(f'  ドラ{i+1}: class_id={class_id}, confidence={confidence:.3f}')
+        
+        if confidence > 0.5:
+            if 0 <= class_id < len(CLASS_ID_TO_CODE):
+                tile_code = CLASS_ID_TO_CODE[class_id]
+                dora_codes.append(tile_code)
+                print(f'    → 採用: {tile_code}')
             else:
-                print('⚠️ 有効なドラ表示牌なし')
+                print(f'    → 無効なclass_id: {class_id}')
         else:
-            print('ℹ️ ドラ表示牌データなし')
-        
-        result = subprocess.run(cmd, capture_output=True, text=True, cwd=os.path.dirname(os.path.abspath(__file__)))
-        
-        if result.returncode != 0:
-            print(f"caluculate.py実行エラー: {result.stderr}")
+            print(f'    → 信頼度不足: {confidence:.3f} < 0.5')
+    
+    if dora_codes:
+        print(f'📝 ドラコード配列: {dora_codes}')
+    else:
+        print('⚠️ 有効なドラ表示牌なし')
+    return dora_codes
+
+def calculate_hand(hand_detections, dora_codes, options):
+    """
+    手牌の検出結果から14枚を復元し、このプロセス内で点数計算する
+
+    点数計算ライブラリは起動時のウォームアップで読み込み済み。要求ごとの状態は引数と戻り値だけで受け渡す。
+
+    Returns:
+        dict | None: {"han", "fu", "cost", "yaku", "corrections", "tiles", "win_tile", "win_index", "waits"}。
+        手牌を復元できない・計算できない場合は None
+    """
+    with stage('hand_calculator'):
+        hand = build_hand(hand_detections, threshold=MIN_CONFIDENCE)
+        if hand is None:
             return None
         
-        # 結果を解析（標準出力から点数情報を抽出）
-        output_lines = result.stdout.strip().split('\n')
-        result_data = {
-            'han': 0,
-            'fu': 0,
-            'cost': {},
-            'yaku': [],
-            'raw_output': result.stdout
-        }
-        
-        print(f"caluculate.py出力: {result.stdout}")  # デバッグ用
-        
-        # JSON形式の出力を優先的に使用
-        for line in output_lines:
-            if line.startswith('JSON_RESULT: '):
-                try:
-                    json_str = line[13:]  # "JSON_RESULT: "を除去
-                    json_data = json.loads(json_str)
-                    
-                    # costが文字列の場合は辞書に変換
-                    if isinstance(json_data.get('cost'), str):
-                        try:
-                            # 文字列を辞書に変換
-                            cost_str = json_data['cost'].replace("'", '"')  # シングルクォートをダブルクォートに変換
-                            json_data['cost'] = json.loads(cost_str)
-                        except:
-                            pass
-                    
-                    result_data.update(json_data)
-                    return result_data
-                except Exception as e:
-                    print(f"JSON解析エラー: {e}")
-                    pass
-        
-        # JSON形式がない場合は従来の解析
-        for line in output_lines:
-            if '翻数:' in line:
-                try:
-                    han_text = line.split(':')[1].strip()
-                    result_data['han'] = int(han_text.replace('翻', ''))
-                except:
-                    pass
-            elif '符数:' in line:
-                try:
-                    fu_text = line.split(':')[1].strip()
-                    result_data['fu'] = int(fu_text.replace('符', ''))
-                except:
-                    pass
-            elif '支払い/合計点:' in line:
-                try:
-                    cost_text = line.split(':')[1].strip()
-                    result_data['cost'] = cost_text
-                except:
-                    pass
-            elif line.startswith('- '):
-                # 役の情報を抽出
-                yaku_name = line[2:].split(' (')[0]
-                result_data['yaku'].append(yaku_name)
-        
-        return result_data
-        
-    except Exception as e:
-        print(f"caluculate.py実行エラー: {e}")
+        dora_string = tiles_list_to_string(dora_codes) if dora_codes else ''
+        if dora_string:
+            print(f'✅ ドラ表示牌設定: {dora_string} ({len(dora_codes)}枚)')
+        result = score_hand(
+            hand['tiles'],
+            hand['win_tile'],
+            dora=dora_string,
+            riichi=options.get('riichi', False),
+            ron=options.get('ron', False),
+            closed=options.get('closed', False),
+            round_wind=options.get('roundWind', 'east'),
+            seat_wind=options.get('playerWind', 'east'),
+        )
+    if result is None:
         return None
+    
+    result.update({
+        'corrections': hand['corrections'],
+        'tiles': hand['tiles'],
+        'win_tile': hand['win_tile'],
+        'win_index': hand['win_index'],
+        'waits': hand['waits']
+    })
+    return result
 
 @app.route('/api/calculate', methods=['POST'])
 def calculate_score():
     try:
         data = request.json
         print('📥 ===== API計算リクエスト受信 =====')
+        if not isinstance(data, dict):
+            return jsonify({'error': 'リクエストはJSONオブジェクトで指定してください'}), 400
         
         # フロントエンドからのデータ取得
         hand_tiles_data = data.get('handTiles', [])
         dora_tiles_data = data.get('doraTiles', [])
+        # 単一アップロード: 全体画像（連写の場合は複数フレーム）＋手牌・ドラの正規化範囲
+        frames_data = data.get('frames') or ([data['image']] if data.get('image') else [])
+        hand_rect = data.get('handRect')
+        dora_rect = data.get('doraRect')
+        single_upload = bool(frames_data and hand_rect)
         riichi = data.get('riichi', False)
         win_type = data.get('winType', 'tsumo')
-        round_wind = data.get('roundWind', '東')
-        player_wind = data.get('playerWind', '東')
+        try:
+            # 風は '東' 形式にそろえて保持する（セッションの再計算も同じ対応表で英語に変換する）
+            round_wind = normalize_wind(data.get('roundWind', '東'))
+            player_wind = normalize_wind(data.get('playerWind', '東'))
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        
+        from consensus import check_burst_frames
+        try:
+            for frames in (frames_data, hand_tiles_data, dora_tiles_data):
+                check_burst_frames(frames)
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
         
         print(f'📋 受信パラメータ:')
-        print(f'  手牌画像: {len(hand_tiles_data)}枚')
-        print(f'  ドラ画像: {len(dora_tiles_data)}枚')
+        if single_upload:
+            print(f'  全体画像: {len(frames_data)}枚（サーバー側で切り出し）')
+        else:
+            print(f'  手牌画像: {len(hand_tiles_data)}枚')
+            print(f'  ドラ画像: {len(dora_tiles_data)}枚')
         print(f'  リーチ: {riichi}')
         print(f'  和了方法: {win_type}')
         print(f'  場風: {round_wind}')
         print(f'  自風: {player_wind}')
         
-        if not hand_tiles_data:
+        if not hand_tiles_data and not single_upload:
             print('❌ 手牌画像なし')
             return jsonify({'error': '手牌の画像がありません'}), 400
         
         # 一時ディレクトリを作成
         temp_dir = tempfile.mkdtemp()
+        # 検出モデルの入力サイズより大きい解像度ではデコードしない
+        max_side = INFERENCE_CONFIG['imgsz']
         
         try:
-            # 手牌画像を保存
-            hand_image_path = save_base64_image(hand_tiles_data[0], 'hand_tiles.jpg')
-            if not hand_image_path:
-                return jsonify({'error': '手牌画像の保存に失敗しました'}), 400
-            
-            # デバッグ用画像保存
-            save_debug_image(hand_tiles_data[0], 'hand_tiles')
-            
-            # 手牌認識を実行
-            print('🀄 手牌認識開始...')
-            hand_detections = run_process_script(hand_image_path, temp_dir)
-            if not hand_detections:
-                print('❌ 手牌認識失敗')
-                return jsonify({'error': '手牌の認識に失敗しました'}), 400
-            print(f'✅ 手牌認識完了: {len(hand_detections)}枚検出')
-            
-            # ドラ表示牌認識
             dora_detections = None
-            if dora_tiles_data:
-                print('🀅 ドラ表示牌認識開始...')
-                dora_image_path = save_base64_image(dora_tiles_data[0], 'dora_tiles.jpg')
-                if dora_image_path:
-                    # デバッグ用画像保存
-                    save_debug_image(dora_tiles_data[0], 'dora_tiles')
-                    dora_detections = run_dora_script(dora_image_path, temp_dir)
+            if single_upload:
+                try:
+                    regions = crop_uploaded_frames(frames_data, {'hand': hand_rect, 'dora': dora_rect},
+                                                   max_side=max_side)
+                except ImageRejected as e:
+                    return image_error_response(e)
+                except ValueError as e:
+                    return jsonify({'error': str(e)}), 400
+                
+                print('🀄 手牌認識開始...')
+                hand_detections = recognize_cropped(regions['hand'], 'hand_tiles', temp_dir, hand=True, top_k=3)
+                if not hand_detections:
+                    print('❌ 手牌認識失敗')
+                    return jsonify({'error': '手牌の認識に失敗しました'}), 400
+                print(f'✅ 手牌認識完了: {len(hand_detections)}枚検出')
+                
+                if regions.get('dora'):
+                    print('🀅 ドラ表示牌認識開始...')
+                    dora_detections = recognize_cropped(regions['dora'], 'dora_tiles', temp_dir)
                     if dora_detections:
                         print(f'✅ ドラ表示牌認識完了: {len(dora_detections)}枚検出')
                     else:
                         print('⚠️ ドラ表示牌認識失敗')
+                else:
+                    print('ℹ️ ドラ表示牌なし')
             else:
-                print('ℹ️ ドラ表示牌なし')
+                # 手牌認識を実行（複数フレームの場合は配列のまま連写合議）
+                print('🀄 手牌認識開始...')
+                hand_detections = recognize_cropped(decode_base64_frames(hand_tiles_data, max_side),
+                                                    'hand_tiles', temp_dir, hand=True, top_k=3)
+                if not hand_detections:
+                    print('❌ 手牌認識失敗')
+                    return jsonify({'error': '手牌の認識に失敗しました'}), 400
+                print(f'✅ 手牌認識完了: {len(hand_detections)}枚検出')
             
-            # 風の文字列を英語に変換
-            def convert_wind_to_english(wind_str):
-                wind_map = {
-                    '東': 'east',
-                    '南': 'south', 
-                    '西': 'west',
-                    '北': 'north'
-                }
-                return wind_map.get(wind_str, 'east')
+                # ドラ表示牌認識
+                if dora_tiles_data:
+                    print('🀅 ドラ表示牌認識開始...')
+                    dora_detections = recognize_cropped(decode_base64_frames(dora_tiles_data, max_side),
+                                                        'dora_tiles', temp_dir)
+                    if dora_detections:
+                        print(f'✅ ドラ表示牌認識完了: {len(dora_detections)}枚検出')
+                    else:
+                        print('⚠️ ドラ表示牌認識失敗')
+                else:
+                    print('ℹ️ ドラ表示牌なし')
             
             # 点数計算のオプション
             options = {
                 'riichi': riichi,
                 'ron': win_type == 'ron',
                 'closed': True,  # 常に門前として計算
-                'roundWind': convert_wind_to_english(round_wind),
-                'playerWind': convert_wind_to_english(player_wind)
+                'roundWind': WIND_TO_ENGLISH[round_wind],
+                'playerWind': WIND_TO_ENGLISH[player_wind]
             }
             
             # 点数計算を実行
             print('🧮 点数計算開始...')
-            result = run_calculate_script(hand_detections, dora_detections, options)
+            dora_codes = dora_codes_from_detections(dora_detections)
+            result = calculate_hand(hand_detections, dora_codes, options)
             if not result:
                 print('❌ 点数計算失敗')
                 return jsonify({'error': '点数計算に失敗しました'}), 400
@@ -361,11 +539,24 @@ def calculate_score():
                 'fu': result['fu'],
                 'cost': result['cost'],
                 'yaku': result['yaku'],
+                'corrections': result.get('corrections', []),
                 'recognized_hand_tiles': len(hand_detections),
-                'recognized_dora_tiles': len(dora_detections) if dora_detections else 0,
-                'raw_output': result['raw_output']
+                'recognized_dora_tiles': len(dora_detections) if dora_detections else 0
             }
             
+            # 以降の単牌修正のためにセッションを作成
+            if result.get('tiles'):
+                state = new_state(result['tiles'], result.get('win_index', len(result['tiles']) - 1), dora_codes, {
+                    'riichi': riichi,
+                    'winType': win_type,
+                    'roundWind': round_wind,
+                    'playerWind': player_wind
+                })
+                response['session_id'] = SESSIONS.create(state)
+                response['tiles'] = state['tiles']
+                response['win_index'] = state['win_index']
+                response['dora'] = state['dora']
+            
             print('📤 API応答データ:')
             print(f'  翻数: {response["han"]}')
             print(f'  符数: {response["fu"]}')
@@ -379,10 +570,277 @@ def calculate_score():
             import shutil
             shutil.rmtree(temp_dir, ignore_errors=True)
             
+    except SlotPoolExhausted as e:
+        print(f'🚦 推論待ちが上限に達しました: {e}')
+        return jsonify({'error': '混み合っています。しばらくしてから再度お試しください'}), 503
+    except ImageRejected as e:
+        print(f'🚫 画像を受け付けられません: {e}')
+        return image_error_response(e)
     except Exception as e:
         print(f'🚨 API計算エラー: {e}')
         return jsonify({'error': f'計算エラー: {str(e)}'}), 500
 
+def session_response(session_id, state, result):
+    """セッションの状態と再計算結果から応答データを作成する"""
+    return {
+        'session_id': session_id,
+        'han': result['han'],
+        'fu': result['fu'],
+        'cost': result['cost'],
+        'yaku': result['yaku'],
+        'tiles': state['tiles'],
+        'win_index': state['win_index'],
+        'dora': state['dora'],
+        'riichi': state['riichi'],
+        'winType': state['winType'],
+        'roundWind': state['roundWind'],
+        'playerWind': state['playerWind']
+    }
+
+@app.route('/api/session/<session_id>', methods=['GET'])
+def get_session(session_id):
+    """セッションの状態を返す"""
+    state = SESSIONS.get(session_id)
+    if state is None:
+        return jsonify({'error': 'セッションが見つかりません（期限切れの可能性があります）'}), 404
+    return jsonify(dict(state, session_id=session_id))
+
+@app.route('/api/session/<session_id>', methods=['POST'])
+def update_session(session_id):
+    """差分（牌の差し替え・リーチ/ロン・風・ドラ）を適用して再計算する"""
+    try:
+        lock = SESSIONS.lock(session_id)
+        if lock is None:
+            return jsonify({'error': 'セッションが見つかりません（期限切れの可能性があります）'}), 404
+        
+        delta = request.json or {}
+        print(f'✏️ セッション更新: {session_id} {delta}')
+        # 同じセッションへの同時更新で差分が失われないよう、読み取りから保存までを直列化する
+        with lock:
+            state = SESSIONS.get(session_id)
+            if state is None:
+                return jsonify({'error': 'セッションが見つかりません（期限切れの可能性があります）'}), 404
+            try:
+                new = apply_delta(state, delta)
+            except ValueError as e:
+                return jsonify({'error': str(e)}), 400
+            
+            with stage('hand_calculator'):
+                result = rescore(new)
+            if not result:
+                return jsonify({'error': '点数計算に失敗しました'}), 400
+            
+            SESSIONS.update(session_id, new)
+        return jsonify(session_response(session_id, new, result))
+        
+    except Exception as e:
+        print(f'🚨 セッション更新エラー: {e}')
+        return jsonify({'error': f'計算エラー: {str(e)}'}), 500
+
+@app.route('/api/session/<session_id>', methods=['DELETE'])
+def delete_session(session_id):
+    """セッションを破棄する"""
+    SESSIONS.delete(session_id)
+    return jsonify({'status': 'ok'})
+
+@app.route('/api/table', methods=['POST'])
+def recognize_table_endpoint():
+    """卓全体の写真（4人の手牌＋ドラ表示牌）を分割推論で認識し、各手牌を点数計算する"""
+    try:
+        from table import MAX_TABLE_SIDE, recognize_table
+        
+        data = request.json
+        image_data = data.get('image')
+        if not image_data:
+            return jsonify({'error': '画像データがありません'}), 400
+        try:
+            round_wind = WIND_TO_ENGLISH[normalize_wind(data.get('roundWind', '東'))]
+            seat_wind = WIND_TO_ENGLISH[normalize_wind(data.get('playerWind', '東'))]
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        
+        temp_dir = tempfile.mkdtemp()
+        try:
+            # 卓全体は分割推論するため、検出モデルの入力サイズではなく MAX_TABLE_SIDE まで縮小する
+            image_path = save_base64_image(image_data, 'table.jpg', temp_dir, max_side=MAX_TABLE_SIDE)
+            if not image_path:
+                return jsonify({'error': '画像の保存に失敗しました'}), 400
+            save_debug_image(image_path, 'table')
+            
+            print('🀄 卓全体の認識開始...')
+            # 推論プロセスがあればタイルをスロット経由で渡し、無ければウォームアップ済みの採用モデルで推論する
+            if INFERENCE is not None:
+                model, detect_many = None, INFERENCE.detect_many
+            else:
+                (_, model), detect_many = REGISTRY.active(), None
+            result = recognize_table(
+                image_path,
+                model=model,
+                detect_many=detect_many,
+                riichi=data.get('riichi', False),
+                ron=data.get('winType', 'tsumo') == 'ron',
+                round_wind=round_wind,
+                seat_wind=seat_wind
+            )
+            if result is None:
+                return jsonify({'error': '卓の認識に失敗しました'}), 400
+            
+            print(f'✅ 卓全体の認識完了: {len(result["hands"])}人分の手牌')
+            return jsonify(result)
+        finally:
+            shutil.rmtree(temp_dir, ignore_errors=True)
+        
+    except SlotPoolExhausted as e:
+        print(f'🚦 推論待ちが上限に達しました: {e}')
+        return jsonify({'error': '混み合っています。しばらくしてから再度お試しください'}), 503
+    except ImageRejected as e:
+        return image_error_response(e)
+    except Exception as e:
+        print(f'🚨 卓認識エラー: {e}')
+        return jsonify({'error': f'認識エラー: {str(e)}'}), 500
+
+@app.route('/api/payments', methods=['POST'])
+def payments_endpoint():
+    """
+    翻・符からの支払いを表引きでまとめて返す（集計・分析用）
+
+    {"han": [...], "fu": [...], "dealer": [...], "tsumo": [...], "honba": [...], "yakuman": [...]}
+    （各項目は配列またはすべての行に共通の値。han は必須、fu は省略時 30、それ以外は省略可）
+    """
+    import numpy as np
+    from payments import compute_payments
+
+    data = request.json or {}
+    if 'han' not in data:
+        return jsonify({'error': '翻数がありません'}), 400
+    args = {'han': data['han'], 'fu': data.get('fu', 30), 'dealer': data.get('dealer', False),
+            'tsumo': data.get('tsumo', False), 'honba': data.get('honba', 0), 'yakuman': data.get('yakuman', False)}
+    try:
+        # ブロードキャスト後の行数は計算する前に確かめる
+        rows = math.prod(np.broadcast_shapes(*(np.shape(value) for value in args.values())))
+        if rows > MAX_PAYMENT_ROWS:
+            return jsonify({'error': f'一度に計算できるのは{MAX_PAYMENT_ROWS}件までです'}), 400
+        result = compute_payments(**args)
+    except (TypeError, ValueError) as e:
+        return jsonify({'error': str(e)}), 400
+    return jsonify({key: value.tolist() for key, value in result.items()})
+
+def require_admin(view):
+    """管理APIの認証（Authorization: Bearer <ADMIN_TOKEN>）"""
+    @functools.wraps(view)
+    def wrapper(*args, **kwargs):
+        if not ADMIN_TOKEN:
+            return jsonify({'error': '管理APIは無効です（ADMIN_TOKEN 未設定）'}), 403
+        token = request.headers.get('Authorization', '').removeprefix('Bearer ').strip()
+        # 非ASCIIの文字を含むトークンでも比較できるようバイト列で比べる
+        if not hmac.compare_digest(token.encode(), ADMIN_TOKEN.encode()):
+            return jsonify({'error': '認証に失敗しました'}), 401
+        return view(*args, **kwargs)
+    return wrapper
+
+@app.route('/api/admin/models', methods=['GET'])
+@require_admin
+def list_models():
+    """登録済みのモデル・採用モデル・シャドー評価の集計を返す"""
+    return jsonify(REGISTRY.status())
+
+@app.route('/api/admin/models', methods=['POST'])
+@require_admin
+def load_model_version():
+    """モデルを読み込んで登録する（採用モデルは変えない）"""
+    data = request.json or {}
+    try:
+        REGISTRY.load(data.get('version'), data.get('path'))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    return jsonify(REGISTRY.status())
+
+@app.route('/api/admin/models/<version>', methods=['DELETE'])
+@require_admin
+def unload_model_version(version):
+    """読み込み済みのモデルを解放する"""
+    try:
+        REGISTRY.unload(version)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    return jsonify(REGISTRY.status())
+
+@app.route('/api/admin/models/<version>/activate', methods=['POST'])
+@require_admin
+def activate_model_version(version):
+    """採用モデルを無停止で切り替える"""
+    try:
+        previous = REGISTRY.activate(version)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    if INFERENCE is not None:
+        INFERENCE.swap(REGISTRY.active_path())
+    return jsonify(dict(REGISTRY.status(), previous=previous))
+
+@app.route('/api/admin/shadow', methods=['POST'])
+@require_admin
+def start_shadow():
+    """候補モデルのシャドー評価を始める（{"version": "v3", "rate": 0.1}）"""
+    data = request.json or {}
+    try:
+        REGISTRY.start_shadow(data.get('version'), float(data.get('rate', 0.1)))
+    except (TypeError, ValueError) as e:
+        return jsonify({'error': str(e)}), 400
+    return jsonify(REGISTRY.status())
+
+@app.route('/api/admin/shadow', methods=['DELETE'])
+@require_admin
+def stop_shadow():
+    """シャドー評価を終了し、最終の集計を返す"""
+    return jsonify({'shadow': REGISTRY.stop_shadow()})
+
+@app.route('/api/admin/profile', methods=['POST'])
+@require_admin
+def profile_worker():
+    """
+    このワーカーの指定秒数のプロファイルを始める（{"seconds": 10, "intervalMs": 5, "allThreads": false}）
+    
+    標本は専用のスレッドで取るので、計測の終了を待たずに 202 と pid を返す。
+    結果は GET /api/admin/profile/<pid> で取り出す
+    """
+    data = request.json or {}
+    try:
+        status = start_profile(float(data.get('seconds', 10)), interval_ms=float(data.get('intervalMs', 5)),
+                               all_threads=bool(data.get('allThreads', False)))
+    except (TypeError, ValueError) as e:
+        return jsonify({'error': str(e)}), 400
+    except ProfilerBusy as e:
+        return jsonify({'error': str(e)}), 409
+    return jsonify(status), 202
+
+@app.route('/api/admin/profile/<int:pid>', methods=['GET'])
+@require_admin
+def profile_result(pid):
+    """
+    ワーカー pid の最後のプロファイル結果（計測中は 202 と状態を返す）
+    
+    ?format=collapsed の場合は flamegraph 用の collapsed 形式のファイルを返す
+    """
+    result = load_result(pid)
+    if result is None:
+        return jsonify({'error': f'ワーカー {pid} のプロファイル結果がありません'}), 404
+    if result.get('running'):
+        return jsonify(result), 202
+    if 'error' in result:
+        return jsonify(result), 500
+    if request.args.get('format') == 'collapsed':
+        return result['collapsed'], 200, {
+            'Content-Type': 'text/plain; charset=utf-8',
+            'Content-Disposition': f'attachment; filename=profile_{pid}.collapsed'
+        }
+    return jsonify(result)
+
+@app.route('/api/admin/memory', methods=['GET'])
+@require_admin
+def memory_stats():
+    """直近の要求の画像バッファの見積もりのピーク（平均・p95・最大）と、このワーカーの最大常駐メモリ（実測）"""
+    return jsonify(memory_summary())
+
 @app.route('/api/recognize', methods=['POST'])
 def recognize_single_tile():
     """単一の牌を認識するエンドポイント"""
@@ -397,13 +855,9 @@ def recognize_single_tile():
         temp_dir = tempfile.mkdtemp()
         
         try:
-            # 画像を保存
-            image_path = save_base64_image(image_data, 'single_tile.jpg')
-            if not image_path:
-                return jsonify({'error': '画像の保存に失敗しました'}), 400
-            
-            # 牌認識を実行
-            detections = run_process_script(image_path, temp_dir)
+            # 牌認識を実行（ウォームアップ済みのモデルで推論する）
+            images = decode_base64_frames([image_data], INFERENCE_CONFIG['imgsz'])
+            detections = recognize_cropped(images, 'single_tile', temp_dir)
             if not detections:
                 return jsonify({'error': '牌の認識に失敗しました'}), 400
             
@@ -422,14 +876,49 @@ def recognize_single_tile():
             import shutil
             shutil.rmtree(temp_dir, ignore_errors=True)
         
+    except ImageRejected as e:
+        return image_error_response(e)
     except Exception as e:
         print(f"認識エラー: {e}")
         return jsonify({'error': f'認識エラー: {str(e)}'}), 500
 
+@app.route('/api/config', methods=['GET'])
+def get_config():
+    """フロントエンド向けのアップロード設定（領域ごとに有効な最大画素数など）"""
+    return jsonify({
+        # 切り出した手牌・ドラ範囲の長辺はこれ以上大きくしても推論時に縮小される
+        'maxRegionSide': INFERENCE_CONFIG['imgsz'],
+        'singleUpload': True
+    })
+
 @app.route('/api/health', methods=['GET'])
 def health_check():
     """ヘルスチェックエンドポイント"""
     return jsonify({'status': 'ok', 'message': '麻雀牌認識API is running'})
 
+@app.route('/api/ready', methods=['GET'])
+def readiness_check():
+    """準備完了チェック（モデルのウォームアップが終わるまでは 503 を返す）"""
+    status = 200 if READINESS['ready'] else 503
+    return jsonify(dict(READINESS, status='ready' if READINESS['ready'] else 'not_ready')), status
+
+READINESS['import_ms'] = round((time.perf_counter() - _IMPORT_START) * 1000, 1)
+READINESS['import_over_budget'] = READINESS['import_ms'] > IMPORT_BUDGET_MS
+if READINESS['import_over_budget']:
+    print(f"⚠️ 起動時の読み込みが目安を超えました: {READINESS['import_ms']}ms > {IMPORT_BUDGET_MS}ms")
+
+# WSGIサーバーから読み込まれた場合は読み込み直後に推論プロセスの起動・ウォームアップを始める
+# （推論プロセスの spawn で __mp_main__ として読み込まれた場合は除く）
+if __name__ not in ('__main__', '__mp_main__'):
+    if os.environ.get('USE_INFERENCE_SERVER') == '1':
+        start_inference_server()
+    if os.environ.get('WARMUP', '1') == '1':
+        start_warmup()
+
 if __name__ == '__main__':
+    # デバッグ用リローダーの監視プロセスでは起動しない
+    if os.environ.get('WERKZEUG_RUN_MAIN') == 'true':
+        if os.environ.get('USE_INFERENCE_SERVER') == '1':
+            start_inference_server()
+        start_warmup()
     app.run(debug=True, host='0.0.0.0', port=5001)
@@ -0,0 +1,131 @@
+import argparse
+import itertools
+import os
+import time
+
+import cv2
+import numpy as np
+
+from batch_recognize import iter_image_paths
+from detector import load_model, result_to_detections
+from inference_config import CONFIG_PATH, DEFAULT_CONFIG, save_inference_config
+from spatial import agreement
+
+# 参照結果を作る設定（現在の固定値）
+REFERENCE_IMGSZ = DEFAULT_CONFIG["imgsz"]
+
+
+def detect_all(model, images, imgsz, conf):
+    """画像を1枚ずつ推論した検出結果のリスト"""
+    return [result_to_detections(model.predict(source=image, imgsz=imgsz, conf=conf, verbose=False)[0])
+            for image in images]
+
+
+def measure(model, images, imgsz, conf, batch_size, rounds=1):
+    """
+    1つのモデルで順に推論し、スループットと1回の推論の遅延を測る
+
+    サービス（推論プロセス・サブプロセス）はどれも1プロセス1モデルで推論するため、
+    同じプロセス内のスレッドで torch のスレッドを分け合う並列ワーカーは計測しない。
+
+    Returns:
+        dict: {"images_per_sec", "p50_ms", "p95_ms"}
+    """
+    batches = [images[i:i + batch_size] for i in range(0, len(images), batch_size)] * rounds
+    latencies = []
+    start = time.perf_counter()
+    for batch in batches:
+        t0 = time.perf_counter()
+        model.predict(source=batch, imgsz=imgsz, conf=conf, verbose=False)
+        latencies.append((time.perf_counter() - t0) * 1000)
+    elapsed = time.perf_counter() - start
+    return {
+        "images_per_sec": round(len(images) * rounds / elapsed, 2),
+        "p50_ms": round(float(np.percentile(latencies, 50)), 1),
+        "p95_ms": round(float(np.percentile(latencies, 95)), 1)
+    }
+
+
+def autotune(sample, model_path="./models/best_v2.pt", max_images=32, imgsz_list=(640, 768, 960),
+             thread_list=None, batch_list=(1, 4, 8), conf=DEFAULT_CONFIG["conf"],
+             slo_ms=500.0, min_agreement=0.98, rounds=2):
+    """
+    入力サイズ・スレッド数・バッチサイズの組み合わせを計測し、
+    遅延の SLO（1回の推論の p95）と参照結果との一致率を満たす中で最もスループットの高い設定を選ぶ
+
+    Returns:
+        dict | None: 選んだ設定（計測値 "measured" 付き）。条件を満たす設定が無い場合は None
+    """
+    import torch
+
+    paths = list(itertools.islice(iter_image_paths(sample), max_images))
+    images = [img for img in (cv2.imread(p) for p in paths) if img is not None]
+    if not images:
+        print(f"❌ サンプル画像が見つかりません: {sample}")
+        return None
+    cores = os.cpu_count() or 1
+    thread_list = thread_list or sorted({t for t in (1, 2, 4, 8, 16, 32, cores) if t <= cores})
+    print(f"🔧 自動調整開始: サンプル{len(images)}枚, {cores}コア")
+
+    # 参照結果（現在の固定設定）と入力サイズごとの一致率
+    base_model = load_model(model_path)
+    reference = detect_all(base_model, images, REFERENCE_IMGSZ, conf)
+    accurate = []
+    for imgsz in imgsz_list:
+        score = agreement(reference, detect_all(base_model, images, imgsz, conf))
+        print(f"  imgsz={imgsz}: 一致率 {score * 100:.1f}%")
+        if score >= min_agreement:
+            accurate.append((imgsz, score))
+
+    best = None
+    for (imgsz, score), threads, batch_size in itertools.product(accurate, thread_list, batch_list):
+        torch.set_num_threads(threads)
+        # 初回推論の準備コストを計測から除く
+        base_model.predict(source=images[:batch_size], imgsz=imgsz, conf=conf, verbose=False)
+        stats = measure(base_model, images, imgsz, conf, batch_size, rounds=rounds)
+        ok = stats["p95_ms"] <= slo_ms
+        print(f"  imgsz={imgsz} threads={threads} batch={batch_size}: "
+              f"{stats['images_per_sec']} images/sec, p95 {stats['p95_ms']}ms {'✅' if ok else '❌'}")
+        if ok and (best is None or stats["images_per_sec"] > best["measured"]["images_per_sec"]):
+            best = {
+                "imgsz": imgsz,
+                "conf": conf,
+                "threads": threads,
+                "batch_size": batch_size,
+                "measured": dict(stats, agreement=round(score, 4), slo_ms=slo_ms, cores=cores)
+            }
+    return best
+
+
+def _int_list(text):
+    return [int(v) for v in text.split(",") if v]
+
+
+def main():
+    parser = argparse.ArgumentParser(description='推論設定（入力サイズ・スレッド数・バッチサイズ）の自動調整')
+    parser.add_argument('--sample', type=str, required=True, help='サンプル画像（ディレクトリ / globパターン / マニフェスト）')
+    parser.add_argument('--model', type=str, default='./models/best_v2.pt', help='モデルファイルのパス')
+    parser.add_argument('--output', type=str, default=CONFIG_PATH, help='書き出す設定ファイル')
+    parser.add_argument('--max_images', type=int, default=32, help='計測に使う画像数')
+    parser.add_argument('--imgsz', type=_int_list, default=[640, 768, 960], help='試す入力サイズ（カンマ区切り）')
+    parser.add_argument('--threads', type=_int_list, default=None, help='試すスレッド数（省略時は1〜コア数）')
+    parser.add_argument('--batch', type=_int_list, default=[1, 4, 8], help='試すバッチサイズ')
+    parser.add_argument('--slo_ms', type=float, default=500.0, help='1回の推論の p95 遅延の上限（ミリ秒）')
+    parser.add_argument('--min_agreement', type=float, default=0.98, help='参照結果との最低一致率')
+    args = parser.parse_args()
+
+    best = autotune(args.sample, model_path=args.model, max_images=args.max_images, imgsz_list=args.imgsz,
+                    thread_list=args.threads, batch_list=args.batch,
+                    slo_ms=args.slo_ms, min_agreement=args.min_agreement)
+    if best is None:
+        print("❌ 条件を満たす設定がありませんでした（設定ファイルは更新しません）")
+        return
+
+    save_inference_config(best, args.output)
+    print(f"✅ 最適設定: imgsz={best['imgsz']} threads={best['threads']} "
+          f"batch={best['batch_size']} ({best['measured']['images_per_sec']} images/sec)")
+    print(f"💾 設定を '{args.output}' に保存しました。")
+
+
+if __name__ == "__main__":
+    main()
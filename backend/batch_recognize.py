@@ -0,0 +1,275 @@
+import argparse
+import glob
+import json
+import os
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+import cv2
+
+from detector import load_model, result_to_detections
+from inference_config import load_inference_config
+
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".bmp", ".webp")
+
+# Parquet に書き出す際の1行グループあたりの行数
+PARQUET_ROW_GROUP = 10000
+
+
+def iter_image_paths(source):
+    """
+    入力指定から画像パスを順に返す
+
+    Args:
+        source: ディレクトリ（再帰的に探索）、glob パターン、
+                またはマニフェスト（1行1パスの .txt / "path" キーを持つ .jsonl）
+    """
+    if os.path.isdir(source):
+        for root, _, files in os.walk(source):
+            for name in sorted(files):
+                if name.lower().endswith(IMAGE_EXTENSIONS):
+                    yield os.path.join(root, name)
+    elif os.path.isfile(source) and source.endswith((".txt", ".jsonl")):
+        with open(source, "r", encoding="utf-8") as f:
+            for line in f:
+                line = line.strip()
+                if not line:
+                    continue
+                yield json.loads(line)["path"] if source.endswith(".jsonl") else line
+    else:
+        for path in sorted(glob.iglob(source, recursive=True)):
+            if path.lower().endswith(IMAGE_EXTENSIONS):
+                yield path
+
+
+def load_done_paths(jsonl_path):
+    """途中まで書き出した結果ファイルから処理済みのパスを読み込む（再開用）"""
+    done = set()
+    if os.path.exists(jsonl_path):
+        with open(jsonl_path, "r", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    done.add(json.loads(line)["path"])
+                except (ValueError, KeyError, TypeError):
+                    # 書き込み途中で中断された行・壊れた行は無視して再処理する
+                    continue
+    return done
+
+
+def trim_partial_line(jsonl_path):
+    """
+    中断で書きかけになった末尾の行を切り詰める（追記した最初の行が書きかけの行に連結されないように）
+
+    Returns:
+        int: 切り詰めたバイト数
+    """
+    if not os.path.exists(jsonl_path):
+        return 0
+    with open(jsonl_path, "rb+") as f:
+        size = f.seek(0, os.SEEK_END)
+        end = size
+        while end > 0:
+            f.seek(max(0, end - 65536))
+            chunk = f.read(end - max(0, end - 65536))
+            newline = chunk.rfind(b"\n")
+            if newline >= 0:
+                end = end - len(chunk) + newline + 1
+                break
+            end -= len(chunk)
+        if end < size:
+            f.truncate(end)
+    return size - end
+
+
+def prefetch_decode(paths, workers=4, prefetch=32):
+    """
+    画像のデコードを別スレッドで先読みしながら (パス, 画像) を順に返す
+
+    先読みする枚数は prefetch 枚までに制限する。
+    """
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        pending = deque()
+        for path in paths:
+            pending.append((path, pool.submit(cv2.imread, path)))
+            if len(pending) >= prefetch:
+                p, future = pending.popleft()
+                yield p, future.result()
+        while pending:
+            p, future = pending.popleft()
+            yield p, future.result()
+
+
+def batched(items, batch_size):
+    """要素を batch_size 件ずつのリストにまとめて返す"""
+    batch = []
+    for item in items:
+        batch.append(item)
+        if len(batch) == batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def infer_batches(batches, model, imgsz=960, conf=0.25):
+    """まとめた画像を1回の推論に通し、1枚ごとの結果レコードを返す"""
+    for batch in batches:
+        ok = [(path, image) for path, image in batch if image is not None]
+        for path, image in batch:
+            if image is None:
+                yield {"path": path, "error": "decode_failed"}
+        if not ok:
+            continue
+        results = model.predict(source=[image for _, image in ok], imgsz=imgsz, conf=conf, verbose=False)
+        for (path, image), result in zip(ok, results):
+            yield {
+                "path": path,
+                "width": int(image.shape[1]),
+                "height": int(image.shape[0]),
+                "detections": result_to_detections(result)
+            }
+
+
+def require_pyarrow():
+    """
+    Parquet 出力に必要な pyarrow が使えるか確かめる（長い処理の最後で失敗しないよう、処理を始める前に呼ぶ）
+
+    Raises:
+        RuntimeError: pyarrow が導入されていない
+    """
+    try:
+        import pyarrow  # noqa: F401
+        import pyarrow.parquet  # noqa: F401
+    except ImportError as e:
+        raise RuntimeError(f'Parquet 出力には pyarrow が必要です（pip install -r requirements.txt）: {e}')
+
+
+def write_parquet(jsonl_path, parquet_path, row_group_size=PARQUET_ROW_GROUP):
+    """
+    JSONL の結果を Parquet に変換する（pyarrow が必要）
+
+    row_group_size 行ずつ行グループとして書き出し、全行をメモリに載せない。
+    読めない行（書きかけ・"path" の無い行）は飛ばす。
+
+    Returns:
+        int: 飛ばした行数
+    """
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    schema = pa.schema([
+        ("path", pa.string()),
+        ("width", pa.int64()),
+        ("height", pa.int64()),
+        ("error", pa.string()),
+        ("detections", pa.string()),
+    ])
+    skipped = 0
+    with open(jsonl_path, "r", encoding="utf-8") as f, pq.ParquetWriter(parquet_path, schema) as writer:
+        rows = []
+        for line_no, line in enumerate(f, 1):
+            try:
+                r = json.loads(line)
+                rows.append({
+                    "path": r["path"],
+                    "width": r.get("width"),
+                    "height": r.get("height"),
+                    "error": r.get("error"),
+                    "detections": json.dumps(r.get("detections", []), ensure_ascii=False)
+                })
+            except (ValueError, KeyError, TypeError, AttributeError):
+                skipped += 1
+                print(f"⚠️ {line_no}行目を読み込めないためスキップします")
+                continue
+            if len(rows) == row_group_size:
+                writer.write_table(pa.Table.from_pylist(rows, schema=schema))
+                rows = []
+        if rows:
+            writer.write_table(pa.Table.from_pylist(rows, schema=schema))
+    return skipped
+
+
+def run_batch(source, output, model_path="./models/best_v2.pt", batch_size=16, workers=4,
+              imgsz=960, conf=0.25, report_every=500):
+    """
+    画像群をストリーミングでまとめて推論し、結果を1つの JSONL（または Parquet）に書き出す
+
+    既存の出力がある場合は処理済みの画像を飛ばして再開する。
+
+    Returns:
+        dict: {"processed", "skipped", "seconds", "images_per_sec"}
+              （Parquet 出力の場合は変換で読み飛ばした行数 "unreadable_lines" も含む）
+
+    Raises:
+        RuntimeError: Parquet 出力で pyarrow が導入されていない（推論を始める前に確かめる）
+    """
+    to_parquet = output.endswith(".parquet")
+    if to_parquet:
+        require_pyarrow()
+    jsonl_path = output + ".partial.jsonl" if to_parquet else output
+    if trim_partial_line(jsonl_path):
+        print("✂️ 中断で書きかけになった末尾の行を削除しました")
+    done = load_done_paths(jsonl_path)
+    if done:
+        print(f"♻️ 再開: {len(done)}枚は処理済みのためスキップします")
+
+    model = load_model(model_path)
+    paths = (p for p in iter_image_paths(source) if p not in done)
+    records = infer_batches(batched(prefetch_decode(paths, workers=workers), batch_size), model,
+                            imgsz=imgsz, conf=conf)
+
+    processed = 0
+    start = time.perf_counter()
+    with open(jsonl_path, "a", encoding="utf-8") as f:
+        for record in records:
+            f.write(json.dumps(record, ensure_ascii=False) + "\n")
+            processed += 1
+            if processed % report_every == 0:
+                f.flush()
+                elapsed = time.perf_counter() - start
+                print(f"  {processed}枚 ({processed / elapsed:.1f} images/sec)")
+    elapsed = time.perf_counter() - start
+
+    stats = {
+        "processed": processed,
+        "skipped": len(done),
+        "seconds": round(elapsed, 2),
+        "images_per_sec": round(processed / elapsed, 2) if elapsed > 0 else 0.0
+    }
+    if to_parquet:
+        stats["unreadable_lines"] = write_parquet(jsonl_path, output)
+        os.remove(jsonl_path)
+        if stats["unreadable_lines"]:
+            print(f"⚠️ Parquet への変換で {stats['unreadable_lines']}行を読み込めずに飛ばしました")
+    print(f"✅ 一括認識完了: {processed}枚 / {elapsed:.1f}秒 ({stats['images_per_sec']} images/sec)")
+    print(f"💾 結果を '{output}' に保存しました。")
+    return stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description='画像ディレクトリの一括牌認識スクリプト')
+    parser.add_argument('--input', type=str, required=True, help='ディレクトリ / globパターン / マニフェスト(.txt, .jsonl)')
+    parser.add_argument('--output', type=str, required=True, help='出力ファイル（.jsonl または .parquet）')
+    parser.add_argument('--model', type=str, default='./models/best_v2.pt', help='モデルファイルのパス')
+    parser.add_argument('--batch_size', type=int, help='1回の推論に渡す画像数（省略時は推論設定）')
+    parser.add_argument('--workers', type=int, default=4, help='デコード用スレッド数')
+    parser.add_argument('--imgsz', type=int, help='推論時の入力サイズ（省略時は推論設定）')
+    parser.add_argument('--conf', type=float, help='検出の信頼度しきい値（省略時は推論設定）')
+    args = parser.parse_args()
+
+    # 省略された値は推論設定（inference_config.json）に従う（--conf 0 などの 0 も指定として扱う）
+    config = load_inference_config()
+    try:
+        run_batch(args.input, args.output, model_path=args.model,
+                  batch_size=config["batch_size"] if args.batch_size is None else args.batch_size,
+                  workers=args.workers,
+                  imgsz=config["imgsz"] if args.imgsz is None else args.imgsz,
+                  conf=config["conf"] if args.conf is None else args.conf)
+    except RuntimeError as e:
+        print(f"🚨 {e}")
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
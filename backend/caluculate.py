@@ -1,25 +1,12 @@
-
 import json
 import argparse
-import sys
-import subprocess
-from collections import Counter, defaultdict
+from collections import Counter
+from functools import lru_cache
 from typing import Any, Dict, List, Tuple
 
 
-# === mahjongライブラリの存在確認 ===
-def ensure_mahjong(debug: bool=False):
-    try:
-        import mahjong  # noqa: F401
-        if debug:
-            print("[debug] mahjong は既に存在します")
-        return
-    except Exception:
-        subprocess.run([sys.executable, "-m", "pip", "install", "-q", "--upgrade", "mahjong"], check=True)
-        import mahjong  # noqa: F401
-
-
-# === mahjong モジュールの読み込み ===
+# === mahjong モジュールの読み込み（初回のみ。requirements.txt で導入済みであること） ===
+@lru_cache(maxsize=None)
 def _import_mahjong():
     from mahjong.hand_calculating.hand import HandCalculator
     from mahjong.tile import TilesConverter
@@ -31,6 +18,34 @@ def _import_mahjong():
     return HandCalculator, TilesConverter, (EAST, SOUTH, WEST, NORTH), HandConfig, OptionalRules
 
 
+# === 点数計算のルール（OptionalRules に設定する値。存在しない項目はライブラリの版によって無視される） ===
+OPTIONAL_RULES = {
+    "has_open_tanyao": True,    # 喰いタン可
+    "has_aka_dora": True,       # 赤ドラあり
+    "has_double_yakuman": True,
+    "kiriage": False,
+    "kazoe_limit": True,
+    "kiriage_limit": True,
+    "is_tsumo_loss": False,
+}
+
+
+def build_optional_rules():
+    """OPTIONAL_RULES を設定した OptionalRules を作る"""
+    OptionalRules = _import_mahjong()[4]
+    options = OptionalRules()  # 引数なしで作成（互換性のため）
+    for name, value in OPTIONAL_RULES.items():
+        if hasattr(options, name):
+            setattr(options, name, value)
+    return options
+
+
+# 採用する検出の信頼度の下限（これ未満の検出は手牌の復元に使わない。segment.py の分類経路とも共通）
+MIN_CONFIDENCE = 0.5
+# 赤ドラ（0m/0p/0s）の1色あたりの枚数上限
+AKA_LIMIT = 1
+
+
 # === class id → 牌コード ===
 CLASS_ID_TO_CODE = [
     "1m","2m","3m","4m","5m","6m","7m","8m","9m",
@@ -61,7 +76,7 @@ def get_confidence(d: Dict[str, Any]) -> float:
     return 0.0
 
 
-def counts_from_detections(dets: List[Dict[str, Any]], threshold=0.5):
+def counts_from_detections(dets: List[Dict[str, Any]], threshold=MIN_CONFIDENCE):
     counts = Counter()
     kept: List[Tuple[str, float, List[float]]] = []
     for d in dets:
@@ -105,149 +120,188 @@ def to_pretty_counts(counts: Counter) -> str:
     return "\n".join(lines) if lines else "(カウントなし)"
 
 
-def select_14_tiles(kept: List[Tuple[str, float, List[float]]]) -> List[str]:
-    kept_sorted = sorted(kept, key=lambda x: x[1], reverse=True)
-    result = []
-    per_normal_counts = defaultdict(int)
-    per_code_counts = defaultdict(int)
-    def base_five(code): return {"0m": "5m", "0p": "5p", "0s": "5s"}.get(code, code)
-    for code, _, _ in kept_sorted:
-        base = base_five(code)
-        if per_normal_counts[base] >= 4 or per_code_counts[code] >= 4:
-            continue
-        result.append(code)
-        per_normal_counts[base] += 1
-        per_code_counts[code] += 1
-        if len(result) == 14:
-            break
-    return result
-
-
 def tiles_list_to_string(tiles):
+    """牌コードのリストを "123m055p..." 形式にする（赤5は "0" のまま残し、5の位置に並べる）"""
     buckets = {"m": [], "p": [], "s": [], "z": []}
     for c in tiles:
-        n_str, suit = c[:-1], c[-1]
-        # 赤ドラの処理: 0を5に変換
-        if n_str == "0":
-            n_str = "5"
-        buckets[suit].append(int(n_str))
+        buckets[c[-1]].append(c[:-1])
     parts = []
     for s in ("m","p","s","z"):
         if buckets[s]:
-            parts.append("".join(str(n) for n in sorted(buckets[s])) + s)
+            parts.append("".join(sorted(buckets[s], key=lambda n: 5 if n == "0" else int(n))) + s)
     return "".join(parts)
 
 
 def safe_string_to_136_array(TilesConverter, tiles_str):
+    """
+    "123m055p..." 形式の文字列を136形式に変換する
+
+    "0" は赤5として赤ドラの牌に、普通の "5" は赤ドラ以外の5に変換する（has_aka_dora=True）。
+    """
     if not tiles_str:
         return []
-    
-    try:
-        return TilesConverter.string_to_136_array(tiles=tiles_str)
-    except TypeError:
-        man, pin, sou, honors = "", "", "", ""
-        tmp = ""
-        for ch in tiles_str:
-            if ch in "mpsz":
-                if ch == "m": 
-                    man += tmp
-                    tmp = ""
-                elif ch == "p": 
-                    pin += tmp
-                    tmp = ""
-                elif ch == "s": 
-                    sou += tmp
-                    tmp = ""
-                elif ch == "z": 
-                    honors += tmp
-                    tmp = ""
-            else:
-                tmp += ch
-        
-        return TilesConverter.string_to_136_array(man=man, pin=pin, sou=sou, honors=honors)
 
+    by_suit = {"m": "", "p": "", "s": "", "z": ""}
+    tmp = ""
+    for ch in tiles_str:
+        if ch in by_suit:
+            by_suit[ch] += tmp
+            tmp = ""
+        else:
+            tmp += ch
+    return TilesConverter.string_to_136_array(man=by_suit["m"], pin=by_suit["p"], sou=by_suit["s"],
+                                              honors=by_suit["z"], has_aka_dora=True)
+
+
+# === 役名（英語 → 日本語） ===
+YAKU_JAPANESE_MAP = {
+    "Menzen Tsumo": "門前清自摸和",
+    "Pinfu": "平和",
+    "Sanshoku Doujun": "三色同順",
+    "Junchan": "純全帯幺九",
+    "Dora": "ドラ",
+    "Aka Dora": "赤ドラ",
+    "Ittsu": "一通",
+    "Riichi": "立直",
+    "Ippatsu": "一発",
+    "Tanyao": "断幺九",
+    "Yakuhai": "役牌",
+    "Yakuhai (east)": "役牌（東）",
+    "Yakuhai (south)": "役牌（南）",
+    "Yakuhai (west)": "役牌（西）",
+    "Yakuhai (north)": "役牌（北）",
+    "Yakuhai (haku)": "役牌（白）",
+    "Yakuhai (hatsu)": "役牌（發）",
+    "Yakuhai (chun)": "役牌（中）",
+    "Sanshoku Doukou": "三色同刻",
+    "Sankantsu": "三槓子",
+    "Toitoi": "対々和",
+    "Chiitoitsu": "七対子",
+    "Honrou": "混老頭",
+    "Ryanpeikou": "二盃口",
+    "Chanta": "混全帯幺九",
+    "Sanankou": "三暗刻",
+    "Shousangen": "小三元",
+    "Honitsu": "混一色",
+    "Chinitsu": "清一色",
+    "Kokushi Musou": "国士無双",
+    "Suuankou": "四暗刻",
+    "Daisangen": "大三元",
+    "Tsuuiisou": "字一色",
+    "Chinroutou": "清老頭",
+    "Ryuuiisou": "緑一色",
+    "Suukantsu": "四槓子",
+    "Tenhou": "天和",
+    "Chiihou": "地和",
+    "Renhou": "人和"
+}
+
+
+def translate_yaku_name(english_name):
+    # ドラの場合は「ドラ」に変換
+    if english_name.startswith("Dora"):
+        if english_name == "Dora":
+            return "ドラ"
+        else:
+            # "Dora 1" などは「ドラ 1」に変換
+            return english_name.replace("Dora", "ドラ")
+    return YAKU_JAPANESE_MAP.get(english_name, english_name)
 
-def main():
-    ap = argparse.ArgumentParser()
-    ap.add_argument("--json", type=str, required=True)
-    ap.add_argument("--threshold", type=float, default=0.5)
-    ap.add_argument("--closed", action="store_true")
-    ap.add_argument("--ron", action="store_true")
-    ap.add_argument("--riichi", action="store_true")
-    ap.add_argument("--round_wind", type=str, default="east")
-    ap.add_argument("--seat_wind", type=str, default="east")
-    ap.add_argument("--dora", type=str, default="")
-    args, _ = ap.parse_known_args()
 
-    # 引数の確認
-    print("🔍 ===== 受信引数確認 =====")
-    print(f"  ドラ引数: '{args.dora}' (長さ: {len(args.dora)})")
-    print(f"  リーチ: {args.riichi}, 門前: {args.closed}, ロン: {args.ron}")
-    print(f"  場風: {args.round_wind}, 自風: {args.seat_wind}")
+def _yaku_name(y):
+    return getattr(y, "name", y.__class__.__name__)
 
-    ensure_mahjong()
-    HandCalculator, TilesConverter, (EAST, SOUTH, WEST, NORTH), HandConfig, OptionalRules = _import_mahjong()
 
-    with open(args.json, "r", encoding="utf-8") as f:
-        detections = json.load(f)
-    counts, kept = counts_from_detections(detections, threshold=args.threshold)
+def _yaku_han(y, is_closed: bool):
+    # 役インスタンスが han / han_closed / han_open のどれを持っているかに応じて返す
+    if hasattr(y, "han"):
+        return getattr(y, "han")
+    if is_closed and hasattr(y, "han_closed"):
+        return getattr(y, "han_closed")
+    if (not is_closed) and hasattr(y, "han_open"):
+        return getattr(y, "han_open")
+    return None
+
+
+def build_hand(detections: List[Dict[str, Any]], threshold=MIN_CONFIDENCE, search_budget_ms=200.0):
+    """
+    検出結果から並び順の14枚と和了牌を求める
+
+    Returns:
+        dict | None: spatial.ordered_hand の結果に "corrections" と "waits" を加えたもの。
+                     14枚に満たない場合は None
+    """
+    # 重なった枠をまとめ、牌の並び順に整列する
+    from spatial import (CLS, attach_candidates, detections_to_array, kept_to_array,
+                         ordered_hand, select_tiles, suppress_overlaps)
+    from hand_search import is_complete_hand, search_hand, find_waits
+    boxes, _ = suppress_overlaps(detections_to_array(detections, threshold=threshold))
+    counts = Counter(CLASS_ID_TO_CODE[int(c)] for c in boxes[:, CLS])
 
     print("🀄 ===== 存在する牌とその枚数 =====")
     print(to_pretty_counts(counts))
-    
-
 
-    if not kept:
+    if len(boxes) == 0:
         print("❌ 有効な検出がありません。")
-        return
+        return None
 
-    winning_tile_info = max(kept, key=lambda x: x[2][2])  # xmax
-    winning_tile = winning_tile_info[0]
-    print(f"🎯 自動判定されたあがり牌: {winning_tile}")
+    hand = ordered_hand(select_tiles(boxes), context=boxes)
+
+    # 和了形にならない場合は上位候補の組み合わせから補正を探す
+    corrections = []
+    if not is_complete_hand(hand["tiles"]):
+        print("🔎 和了形にならないため候補の組み合わせを探索します")
+        found = search_hand(attach_candidates(detections), min_confidence=threshold,
+                            time_budget_ms=search_budget_ms)
+        if found:
+            hand = ordered_hand(kept_to_array(found["kept"]), context=boxes)
+            corrections = found["corrections"]
+            print(f"✅ 補正探索成功 ({found['elapsed_ms']}ms)")
+            for c in corrections:
+                print(f"  - 補正: {c['from']} → {c['to'] or '除外'} (bbox: {c['bbox']})")
+        else:
+            print("⚠️ 和了形になる組み合わせが見つかりませんでした")
 
-    tiles14 = select_14_tiles(kept)
-    if len(tiles14) < 14:
-        print(f"⚠️ 枚数不足: {len(tiles14)}枚 (14枚未満)")
-        return
-    if winning_tile not in tiles14:
-        tiles14[-1] = winning_tile
+    print(f"🎯 自動判定されたあがり牌: {hand['win_tile']} ({'ツモ牌の隙間あり' if hand['has_gap'] else '右端の牌'})")
 
-    tiles_str = tiles_list_to_string(tiles14)
-    print(f"🧮 ===== 点数計算入力 =====")
-    print(f"🀄 手牌(14枚): {tiles_str}")
-    print(f"🎯 和了牌: {winning_tile}")
+    if len(hand["tiles"]) < 14:
+        print(f"⚠️ 枚数不足: {len(hand['tiles'])}枚 (14枚未満)")
+        return None
+
+    hand["corrections"] = corrections
+    hand["waits"] = find_waits(hand["concealed"])
+    print(f"⏳ 待ち: {' '.join(hand['waits']) if hand['waits'] else 'なし'}")
+    return hand
+
+
+def estimate_hand(tiles14: List[str], winning_tile: str, dora: str = "", riichi=False, ron=False,
+                  round_wind="east", seat_wind="east"):
+    """
+    14枚の牌コードと和了牌から mahjong の HandCalculator で点数を計算する
+
+    Returns:
+        HandResponse: mahjong の計算結果（計算できない場合は例外）
+    """
+    HandCalculator, TilesConverter, (EAST, SOUTH, WEST, NORTH), HandConfig, OptionalRules = _import_mahjong()
 
+    tiles_str = tiles_list_to_string(tiles14)
     tiles_136 = safe_string_to_136_array(TilesConverter, tiles_str)
     win_tile_136 = safe_string_to_136_array(TilesConverter, winning_tile)[0]
-    
-    # ドラインジケーターの変換
-    if args.dora:
-        print(f"🀅 ドラ表示牌設定: {args.dora} ({len(args.dora.replace('m', '').replace('p', '').replace('s', '').replace('z', ''))}枚)")
-        dora_indicators = safe_string_to_136_array(TilesConverter, args.dora)
-    else:
-        print("ℹ️ ドラ表示牌なし")
-        dora_indicators = []
+    # 和了牌は手牌の中の同じ牌（赤5は赤5、普通の5は普通の5）を指す
+    if win_tile_136 not in tiles_136:
+        win_tile_136 = next((t for t in tiles_136 if t // 4 == win_tile_136 // 4), win_tile_136)
+    dora_indicators = safe_string_to_136_array(TilesConverter, dora) if dora else []
 
     # --- OptionalRules を安全に設定 ---
-    options = OptionalRules()  # 引数なしで作成（互換性のため）
-    def set_opt(name, value):
-        if hasattr(options, name):
-            setattr(options, name, value)
-
-    set_opt("has_open_tanyao", True)   # 喰いタン可
-    set_opt("has_aka_dora", True)      # 赤ドラあり
-    set_opt("has_double_yakuman", True)
-    set_opt("kiriage", False)
-    set_opt("kazoe_limit", True)
-    set_opt("kiriage_limit", True)     # 無い版では無視される
-    set_opt("is_tsumo_loss", False)
+    options = build_optional_rules()
 
     # --- HandConfig 設定 ---
+    winds = {"east": EAST, "south": SOUTH, "west": WEST, "north": NORTH}
     config = HandConfig(
-        is_riichi=args.riichi,
-        is_tsumo=not args.ron,
-        player_wind={"east": EAST, "south": SOUTH, "west": WEST, "north": NORTH}[args.seat_wind.lower()],
-        round_wind={"east": EAST, "south": SOUTH, "west": WEST, "north": NORTH}[args.round_wind.lower()],
+        is_riichi=riichi,
+        is_tsumo=not ron,
+        player_wind=winds[seat_wind.lower()],
+        round_wind=winds[round_wind.lower()],
         options=options,
     )
 
@@ -264,23 +318,122 @@ def main():
     set_cfg("is_tenhou", False)
     set_cfg("is_chiihou", False)
     set_cfg("is_renhou", False)
-    set_cfg("is_dealer", args.seat_wind.lower() in ("east", "e", "東"))
+    set_cfg("is_dealer", seat_wind.lower() in ("east", "e", "東"))
 
     calc = HandCalculator()
+    return calc.estimate_hand_value(
+        tiles=tiles_136,
+        win_tile=win_tile_136,
+        melds=[],
+        dora_indicators=dora_indicators,
+        config=config
+    )
+
+
+def result_to_json(result, closed=False) -> Dict[str, Any]:
+    """mahjong の計算結果を API 用の辞書（han / fu / cost / yaku）に変換する"""
+    # costを適切な形式に変換
+    cost_dict = None
+    if result.cost:
+        if isinstance(result.cost, dict):
+            cost_dict = {
+                "main": result.cost.get("main"),
+                "additional": result.cost.get("additional")
+            }
+        elif hasattr(result.cost, 'main') and hasattr(result.cost, 'additional'):
+            cost_dict = {
+                "main": result.cost.main,
+                "additional": result.cost.additional
+            }
+        else:
+            # 辞書形式でない場合は文字列として扱う
+            cost_dict = str(result.cost)
+
+    # 役のリストを翻数付きで作成
+    yaku_with_han = []
+    if result.yaku:
+        for y in result.yaku:
+            yaku_name = translate_yaku_name(_yaku_name(y))
+            han_value = _yaku_han(y, is_closed=closed)
+            if han_value is not None:
+                yaku_with_han.append(f"{yaku_name} ({han_value}翻)")
+            else:
+                yaku_with_han.append(yaku_name)
+
+    return {
+        "han": result.han,
+        "fu": result.fu,
+        "cost": cost_dict,
+        "yaku": yaku_with_han
+    }
+
+
+def score_hand(tiles14: List[str], winning_tile: str, dora: str = "", riichi=False, ron=False,
+               closed=False, round_wind="east", seat_wind="east"):
+    """
+    プロセス内で点数計算を行う（/api/calculate とセッションでの再計算用）
+
+    Returns:
+        dict | None: {"han", "fu", "cost", "yaku"}。計算できない場合は None
+    """
+    try:
+        result = estimate_hand(tiles14, winning_tile, dora=dora, riichi=riichi, ron=ron,
+                               round_wind=round_wind, seat_wind=seat_wind)
+    except Exception as e:
+        print(f"🚨 点数計算エラー: {e}")
+        return None
+    if not result or getattr(result, "error", None):
+        print(f"❌ 点数計算不可: {getattr(result, 'error', None)}")
+        return None
+    return result_to_json(result, closed=closed)
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--json", type=str, required=True)
+    ap.add_argument("--threshold", type=float, default=MIN_CONFIDENCE)
+    ap.add_argument("--closed", action="store_true")
+    ap.add_argument("--ron", action="store_true")
+    ap.add_argument("--riichi", action="store_true")
+    ap.add_argument("--round_wind", type=str, default="east")
+    ap.add_argument("--seat_wind", type=str, default="east")
+    ap.add_argument("--dora", type=str, default="")
+    ap.add_argument("--search_budget_ms", type=float, default=200.0)
+    args, _ = ap.parse_known_args()
+
+    # 引数の確認
+    print("🔍 ===== 受信引数確認 =====")
+    print(f"  ドラ引数: '{args.dora}' (長さ: {len(args.dora)})")
+    print(f"  リーチ: {args.riichi}, 門前: {args.closed}, ロン: {args.ron}")
+    print(f"  場風: {args.round_wind}, 自風: {args.seat_wind}")
+
+    with open(args.json, "r", encoding="utf-8") as f:
+        detections = json.load(f)
+
+    hand = build_hand(detections, threshold=args.threshold, search_budget_ms=args.search_budget_ms)
+    if hand is None:
+        return
+    tiles14 = hand["tiles"]
+    winning_tile = hand["win_tile"]
+
+    tiles_str = tiles_list_to_string(tiles14)
+    print(f"🧮 ===== 点数計算入力 =====")
+    print(f"🀄 手牌(14枚): {tiles_str}")
+    print(f"🎯 和了牌: {winning_tile}")
+
+    # ドラインジケーターの確認
+    if args.dora:
+        print(f"🀅 ドラ表示牌設定: {args.dora} ({len(args.dora.replace('m', '').replace('p', '').replace('s', '').replace('z', ''))}枚)")
+    else:
+        print("ℹ️ ドラ表示牌なし")
+
     try:
-        result = calc.estimate_hand_value(
-            tiles=tiles_136,
-            win_tile=win_tile_136,
-            melds=[],
-            dora_indicators=dora_indicators,
-            config=config
-        )
+        result = estimate_hand(tiles14, winning_tile, dora=args.dora, riichi=args.riichi, ron=args.ron,
+                               round_wind=args.round_wind, seat_wind=args.seat_wind)
     except Exception as e:
         print(f"🚨 点数計算エラー: {e}")
         print(f"  手牌: {tiles_str}")
         print(f"  和了牌: {winning_tile}")
-        print(f"  tiles_136: {tiles_136}")
-        print(f"  win_tile_136: {win_tile_136}")
         return
 
     print("✅ ===== 点数計算結果 =====")
@@ -289,19 +442,6 @@ def main():
     if not result:
         print("❌ 結果がNoneです")
         return
-    
-    def _yaku_name(y):
-        return getattr(y, "name", y.__class__.__name__)
-
-    def _yaku_han(y, is_closed: bool):
-        # 役インスタンスが han / han_closed / han_open のどれを持っているかに応じて返す
-        if hasattr(y, "han"):
-            return getattr(y, "han")
-        if is_closed and hasattr(y, "han_closed"):
-            return getattr(y, "han_closed")
-        if (not is_closed) and hasattr(y, "han_open"):
-            return getattr(y, "han_open")
-        return None
 
     if result.yaku:
         print("🎌 役:")
@@ -324,90 +464,15 @@ def main():
     elif hasattr(result, 'yaku') and result.yaku:
         print(f"役: {result.yaku}")
 
-    # 役名を日本語に変換する辞書
-    yaku_japanese_map = {
-        "Menzen Tsumo": "門前清自摸和",
-        "Pinfu": "平和",
-        "Sanshoku Doujun": "三色同順",
-        "Junchan": "純全帯幺九",
-        "Dora": "ドラ",
-        "Aka Dora": "赤ドラ",
-        "Ittsu": "一通",
-        "Riichi": "立直",
-        "Ippatsu": "一発",
-        "Tanyao": "断幺九",
-        "Yakuhai": "役牌",
-        "Yakuhai (east)": "役牌（東）",
-        "Yakuhai (south)": "役牌（南）",
-        "Yakuhai (west)": "役牌（西）",
-        "Yakuhai (north)": "役牌（北）",
-        "Yakuhai (haku)": "役牌（白）",
-        "Yakuhai (hatsu)": "役牌（發）",
-        "Yakuhai (chun)": "役牌（中）",
-        "Sanshoku Doukou": "三色同刻",
-        "Sankantsu": "三槓子",
-        "Toitoi": "対々和",
-        "Chiitoitsu": "七対子",
-        "Honrou": "混老頭",
-        "Ryanpeikou": "二盃口",
-        "Chanta": "混全帯幺九",
-        "Sanankou": "三暗刻",
-        "Shousangen": "小三元",
-        "Honitsu": "混一色",
-        "Chinitsu": "清一色",
-        "Kokushi Musou": "国士無双",
-        "Suuankou": "四暗刻",
-        "Daisangen": "大三元",
-        "Tsuuiisou": "字一色",
-        "Chinroutou": "清老頭",
-        "Ryuuiisou": "緑一色",
-        "Suukantsu": "四槓子",
-        "Tenhou": "天和",
-        "Chiihou": "地和",
-        "Renhou": "人和"
-    }
-    
-    # 役名を日本語に変換
-    def translate_yaku_name(english_name):
-        # ドラの場合は「ドラ」に変換
-        if english_name.startswith("Dora"):
-            if english_name == "Dora":
-                return "ドラ"
-            else:
-                # "Dora 1" などは「ドラ 1」に変換
-                return english_name.replace("Dora", "ドラ")
-        return yaku_japanese_map.get(english_name, english_name)
-    
     # JSON形式でも出力（API用）
-    # costを適切な形式に変換
-    cost_dict = None
-    if result.cost:
-        if hasattr(result.cost, 'main') and hasattr(result.cost, 'additional'):
-            cost_dict = {
-                "main": result.cost.main,
-                "additional": result.cost.additional
-            }
-        else:
-            # 辞書形式でない場合は文字列として扱う
-            cost_dict = str(result.cost)
-    
-    # 役のリストを翻数付きで作成
-    yaku_with_han = []
-    if result.yaku:
-        for y in result.yaku:
-            yaku_name = translate_yaku_name(_yaku_name(y))
-            han_value = _yaku_han(y, is_closed=args.closed)
-            if han_value is not None:
-                yaku_with_han.append(f"{yaku_name} ({han_value}翻)")
-            else:
-                yaku_with_han.append(yaku_name)
-    
-    json_result = {
-        "han": result.han,
-        "fu": result.fu,
-        "cost": cost_dict,
-        "yaku": yaku_with_han
-    }
+    json_result = result_to_json(result, closed=args.closed)
+    json_result.update({
+        "corrections": hand["corrections"],
+        "tiles": tiles14,
+        "win_tile": winning_tile,
+        "win_index": hand["win_index"],
+        "waits": hand["waits"]
+    })
     print(f"JSON_RESULT: {json.dumps(json_result, ensure_ascii=False)}")
 
     print("\n※ 備考: mahjong 1.4.0 完全対応（HandConfig使用・OptionalRulesは安全設定）")
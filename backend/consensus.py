@@ -0,0 +1,125 @@
+import math
+from typing import Any, Dict, List
+
+import numpy as np
+
+from caluculate import CLASS_ID_TO_CODE, get_class_id, get_confidence
+from spatial import X1, X2, Y1, Y2, attach_candidates, detections_to_array, row_axis
+
+# 同じ牌とみなす位置のずれ（牌幅に対する割合）
+MATCH_TOLERANCE = 0.5
+
+# 連写で受け付けるフレーム数（このモジュールは torch / ultralytics を読み込まないので、
+# フレーム数の確認のためだけに読み込んでもよい）
+MIN_BURST_FRAMES = 3
+MAX_BURST_FRAMES = 5
+
+
+def check_burst_frames(frames):
+    """
+    連写のフレーム数が MIN_BURST_FRAMES〜MAX_BURST_FRAMES か確認する（1枚は通常の撮影として扱う）
+
+    Raises:
+        ValueError: フレームが配列でない、またはフレーム数が範囲外
+    """
+    if not isinstance(frames, list):
+        raise ValueError('フレームは配列で指定してください')
+    if len(frames) > 1 and not MIN_BURST_FRAMES <= len(frames) <= MAX_BURST_FRAMES:
+        raise ValueError(f'連写のフレーム数は{MIN_BURST_FRAMES}〜{MAX_BURST_FRAMES}枚です（{len(frames)}枚）')
+
+
+def _centers(arr):
+    """各枠の並び方向の中心座標を返す"""
+    lo, hi = (X1, X2) if row_axis(arr) == 0 else (Y1, Y2)
+    return (arr[:, lo] + arr[:, hi]) / 2
+
+
+def _estimate_shift(centers, ref_centers):
+    """フレーム間の手ぶれによる並び方向のずれを、最近傍の差の中央値で推定する"""
+    diffs = ref_centers[None, :] - centers[:, None]
+    nearest = diffs[np.arange(len(centers)), np.argmin(np.abs(diffs), axis=1)]
+    return float(np.median(nearest))
+
+
+def _bbox_at(ref_arr, center):
+    """基準フレームの列で並び方向の中心座標が center になる牌1枚分の枠を求める"""
+    axis = row_axis(ref_arr)
+    lo, hi = (X1, X2) if axis == 0 else (Y1, Y2)
+    across_lo, across_hi = (Y1, Y2) if axis == 0 else (X1, X2)
+    half = float(np.median(ref_arr[:, hi] - ref_arr[:, lo])) / 2
+    bbox = [0.0] * 4
+    bbox[lo], bbox[hi] = center - half, center + half
+    bbox[across_lo] = float(np.median(ref_arr[:, across_lo]))
+    bbox[across_hi] = float(np.median(ref_arr[:, across_hi]))
+    return bbox
+
+
+def fuse_frames(frames: List[List[Dict[str, Any]]], top_k=3) -> List[Dict[str, Any]]:
+    """
+    複数フレームの検出結果を位置合わせし、信頼度の投票で1つの手牌にまとめる
+
+    最も多く検出されたフレームを基準に、手ぶれによるずれを補正してから各フレームの枠を基準の牌に対応付ける。
+    牌ごとにクラス別の信頼度を合計し、最も票の多いクラスを採用する（信頼度は検出フレームでの平均）。
+    半数以上のフレームで検出された牌だけを残す。
+
+    Returns:
+        list: 検出結果と同じ形式の辞書のリスト（基準フレームの座標、"votes" と "candidates" 付き）
+    """
+    arrays = []
+    for dets in frames:
+        # 重なった枠をまとめ、各牌の候補クラスと信頼度を取り出す
+        tiles = attach_candidates(dets, top_k=top_k)
+        if not tiles:
+            continue
+        arr = detections_to_array(tiles)
+        scores = [{get_class_id(c): get_confidence(c) for c in t["candidates"]} for t in tiles]
+        arrays.append((arr, scores))
+    if not arrays:
+        return []
+
+    n_frames = len(arrays)
+    ref_arr, _ = max(arrays, key=lambda x: len(x[0]))
+    ref_centers = _centers(ref_arr)
+    lo, hi = (X1, X2) if row_axis(ref_arr) == 0 else (Y1, Y2)
+    tolerance = float(np.median(ref_arr[:, hi] - ref_arr[:, lo])) * MATCH_TOLERANCE
+
+    # 牌ごとの集計: 基準フレームでの位置、枠、クラス別の信頼度合計、検出フレーム数
+    slots = [{"center": c, "bbox": list(row[:4]), "votes": {}, "frames": 0}
+             for c, row in zip(ref_centers, ref_arr)]
+
+    for arr, scores in arrays:
+        centers = _centers(arr)
+        centers = centers + _estimate_shift(centers, ref_centers)
+        # 距離の近い組から順に1対1で対応付ける
+        pairs = sorted((abs(c - s["center"]), i, j) for i, c in enumerate(centers) for j, s in enumerate(slots))
+        used_i, used_j = set(), set()
+        for dist, i, j in pairs:
+            if dist > tolerance or i in used_i or j in used_j:
+                continue
+            used_i.add(i)
+            used_j.add(j)
+            for cid, conf in scores[i].items():
+                slots[j]["votes"][cid] = slots[j]["votes"].get(cid, 0.0) + conf
+            slots[j]["frames"] += 1
+        # 基準フレームで見落とされた牌は新しい牌として追加する
+        for i, c in enumerate(centers):
+            if i not in used_i:
+                slots.append({"center": c, "bbox": _bbox_at(ref_arr, c), "votes": dict(scores[i]), "frames": 1})
+
+    fused = []
+    min_frames = math.ceil(n_frames / 2)
+    for s in sorted(slots, key=lambda s: s["center"]):
+        if s["frames"] < min_frames or not s["votes"]:
+            continue
+        ranked = sorted(s["votes"].items(), key=lambda x: x[1], reverse=True)
+        cid, total = ranked[0]
+        fused.append({
+            "class_id": cid,
+            "name": CLASS_ID_TO_CODE[cid],
+            "confidence": round(total / s["frames"], 3),
+            "bbox": [int(v) for v in s["bbox"]],
+            "votes": s["frames"],
+            "candidates": [{"class_id": c, "confidence": round(v / s["frames"], 3)} for c, v in ranked[:top_k]]
+        })
+    return fused
+
@@ -0,0 +1,81 @@
+import time
+
+import numpy as np
+from ultralytics import YOLO
+
+from inference_config import apply_threads, load_inference_config
+from spatial import attach_candidates
+
+# 読み込み済みモデルのキャッシュ（同一プロセス内での再読み込みを避ける）
+_MODEL_CACHE = {}
+
+
+def load_model(model_path, cached=True):
+    """
+    YOLOモデルを読み込む（同じパスは一度だけ読み込む）
+
+    最初の読み込み時に推論設定（inference_config.json）のスレッド数を反映する。
+
+    Args:
+        model_path: モデルファイルのパス
+        cached: False の場合はキャッシュを使わず新しいインスタンスを作る（並列推論用）
+
+    Returns:
+        YOLO: 読み込んだモデル
+    """
+    model = _MODEL_CACHE.get(model_path) if cached else None
+    if model is None:
+        if not _MODEL_CACHE:
+            apply_threads(load_inference_config())
+        model = YOLO(model_path)
+        if cached:
+            _MODEL_CACHE[model_path] = model
+    return model
+
+
+def warm_up(model, imgsz_list, batch_sizes=(1,)):
+    """
+    ダミー画像で入力サイズ・バッチサイズの組み合わせごとに一度ずつ推論し、
+    初回推論の準備コスト（メモリ確保・カーネル選択など）を先に済ませる
+
+    Returns:
+        dict: {"<imgsz>x<batch>": 推論時間(ms)}
+    """
+    timings = {}
+    for imgsz in imgsz_list:
+        dummy = np.zeros((imgsz, imgsz, 3), dtype=np.uint8)
+        for batch_size in batch_sizes:
+            t0 = time.perf_counter()
+            model.predict(source=[dummy] * batch_size, imgsz=imgsz, verbose=False)
+            timings[f"{imgsz}x{batch_size}"] = round((time.perf_counter() - t0) * 1000, 1)
+    return timings
+
+
+def result_to_detections(result, top_k=1):
+    """
+    YOLOの推論結果1件を検出結果のリストに変換する
+
+    Args:
+        result: YOLOの推論結果
+        top_k: 1より大きい場合、同じ牌に重なった別クラスの枠を上位候補としてまとめる
+
+    Returns:
+        list: {"class_id", "name", "confidence", "bbox"} の辞書のリスト
+              （top_k > 1 の場合は "candidates" も含む）
+    """
+    detections = []
+    if result.boxes is not None:
+        for box in result.boxes:
+            cls_id = int(box.cls)
+            name = result.names[cls_id]
+            conf = float(box.conf)
+            x1, y1, x2, y2 = map(int, box.xyxy[0])
+            detections.append({
+                "class_id": cls_id,
+                "name": name,
+                "confidence": round(conf, 3),
+                "bbox": [x1, y1, x2, y2]
+            })
+    if top_k > 1:
+        detections = attach_candidates(detections, top_k)
+    return detections
@@ -1,22 +1,25 @@
-from ultralytics import YOLO
-import cv2
 import json
 import os
 import argparse
 import tempfile
 
-def recognize_dora_tiles(image_path, model_path="./models/best_v2.pt", output_dir=None):
+from detector import load_model, result_to_detections
+from inference_config import load_inference_config
+from model_registry import active_model_path
+
+def recognize_dora_tiles(image_path, model_path=None, output_dir=None):
     """
     ドラ表示牌を認識する関数
     
     Args:
         image_path: 入力画像のパス
-        model_path: モデルファイルのパス
+        model_path: モデルファイルのパス（Noneの場合はレジストリの採用モデル）
         output_dir: 出力ディレクトリ（Noneの場合は一時ディレクトリを使用）
     
     Returns:
         list: 認識結果のリスト
     """
+    model_path = model_path or active_model_path()
     if not os.path.exists(model_path):
         print(f"モデルファイル {model_path} が見つかりません。")
         return []
@@ -25,8 +28,9 @@ def recognize_dora_tiles(image_path, model_path="./models/best_v2.pt", output_di
         print(f"画像ファイル {image_path} が見つかりません。")
         return []
     
-    # モデルを読み込み
-    model = YOLO(model_path)
+    # モデルと推論設定を読み込み
+    model = load_model(model_path)
+    config = load_inference_config()
     
     # 出力ディレクトリの設定
     if output_dir is None:
@@ -38,25 +42,13 @@ def recognize_dora_tiles(image_path, model_path="./models/best_v2.pt", output_di
         # 推論実行
         results = model.predict(
             source=image_path, 
-            imgsz=960, 
-            conf=0.25, 
+            imgsz=config["imgsz"], 
+            conf=config["conf"], 
             verbose=False
         )
         
         # 結果をJSON形式で保存
-        detections = []
-        if results[0].boxes is not None:
-            for box in results[0].boxes:
-                cls_id = int(box.cls)
-                name = results[0].names[cls_id]
-                conf = float(box.conf)
-                x1, y1, x2, y2 = map(int, box.xyxy[0])
-                detections.append({
-                    "class_id": cls_id,
-                    "name": name,
-                    "confidence": round(conf, 3),
-                    "bbox": [x1, y1, x2, y2]
-                })
+        detections = result_to_detections(results[0])
         
         # 結果をJSONファイルに保存
         base_filename = os.path.splitext(os.path.basename(image_path))[0]
@@ -81,7 +73,7 @@ def main():
     parser = argparse.ArgumentParser(description='ドラ表示牌認識スクリプト')
     parser.add_argument('--input', type=str, required=True, help='入力画像のパス')
     parser.add_argument('--output', type=str, help='出力ディレクトリ（省略時は一時ディレクトリ）')
-    parser.add_argument('--model', type=str, default='./models/best_v2.pt', help='モデルファイルのパス')
+    parser.add_argument('--model', type=str, help='モデルファイルのパス（省略時はレジストリの採用モデル）')
     
     args = parser.parse_args()
     
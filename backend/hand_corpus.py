@@ -0,0 +1,293 @@
+import argparse
+import contextlib
+import importlib
+import json
+import os
+import random
+import time
+from collections import Counter
+from typing import Any, Dict, Iterator, List
+
+from caluculate import (CLASS_ID_TO_CODE, _import_mahjong, build_hand, build_optional_rules, result_to_json,
+                        score_hand, tiles_list_to_string)
+
+SUITS = "mps"
+HONORS = [f"{n}z" for n in range(1, 8)]
+TERMINALS_AND_HONORS = [f"{n}{s}" for s in SUITS for n in (1, 9)] + HONORS
+ALL_KINDS = [f"{n}{s}" for s in SUITS for n in range(1, 10)] + HONORS
+WINDS = ["east", "south", "west", "north"]
+
+# 生成する和了形の種類と割合
+KIND_WEIGHTS = {"regular": 0.8, "chiitoitsu": 0.15, "kokushi": 0.05}
+# 赤5に置き換える確率（各色の5ごと）
+AKA_RATE = 0.5
+# 検出結果の牌1枚の大きさ（ピクセル）
+TILE_W, TILE_H = 60, 80
+
+
+def _base(code):
+    return f"5{code[1]}" if code[0] == "0" else code
+
+
+def _regular(rng):
+    """4面子1雀頭の和了形（各牌4枚まで）"""
+    while True:
+        counts = Counter()
+        tiles = []
+        for _ in range(4):
+            if rng.random() < 0.7:
+                suit, start = rng.choice(SUITS), rng.randint(1, 7)
+                meld = [f"{start + i}{suit}" for i in range(3)]
+            else:
+                meld = [rng.choice(ALL_KINDS)] * 3
+            tiles += meld
+        tiles += [rng.choice(ALL_KINDS)] * 2
+        counts.update(tiles)
+        if max(counts.values()) <= 4:
+            return tiles
+
+
+def _chiitoitsu(rng):
+    return [k for k in rng.sample(ALL_KINDS, 7) for _ in range(2)]
+
+
+def _kokushi(rng):
+    return TERMINALS_AND_HONORS + [rng.choice(TERMINALS_AND_HONORS)]
+
+
+def _apply_aka(tiles, rng):
+    """各色の5のうち1枚を赤5（0m/0p/0s）に置き換える（4枚ある場合は必ず1枚が赤5）"""
+    tiles = list(tiles)
+    for suit in SUITS:
+        fives = [i for i, t in enumerate(tiles) if t == f"5{suit}"]
+        if fives and (len(fives) == 4 or rng.random() < AKA_RATE):
+            tiles[rng.choice(fives)] = f"0{suit}"
+    return tiles
+
+
+def random_hand(rng, index=0, kind=None) -> Dict[str, Any]:
+    """
+    ランダムな和了形（門前）を1つ作る
+
+    リーチ・ツモ・場風・自風・ドラ表示牌もランダムに決める。風は index ごとに16通りを順に使う。
+    ロン和了は役が無くならないよう常にリーチ付きにする（門前ツモは門前清自摸和が付く）。
+
+    Returns:
+        dict: {"kind", "tiles"(14枚), "win_tile", "dora"(表示牌), "riichi", "ron", "round_wind", "seat_wind"}
+    """
+    kind = kind or rng.choices(list(KIND_WEIGHTS), weights=list(KIND_WEIGHTS.values()))[0]
+    tiles = {"regular": _regular, "chiitoitsu": _chiitoitsu, "kokushi": _kokushi}[kind](rng)
+    tiles = _apply_aka(tiles, rng)
+    win_tile = rng.choice(tiles)
+
+    # ドラ表示牌（手牌と合わせて各牌4枚まで）
+    used = Counter(_base(t) for t in tiles)
+    dora = []
+    for _ in range(rng.randint(1, 5)):
+        candidates = [k for k in ALL_KINDS if used[k] < 4]
+        k = rng.choice(candidates)
+        used[k] += 1
+        dora.append(k)
+
+    ron = rng.random() < 0.5
+    return {
+        "kind": kind,
+        "tiles": sorted(tiles, key=lambda t: (t[1], int(_base(t)[0]))),
+        "win_tile": win_tile,
+        "dora": dora,
+        "riichi": ron or rng.random() < 0.5,
+        "ron": ron,
+        "round_wind": WINDS[index % 4],
+        "seat_wind": WINDS[(index // 4) % 4]
+    }
+
+
+def to_detections(hand, rng) -> List[Dict[str, Any]]:
+    """
+    手牌を検出結果の形式（counts_from_detections / build_hand の入力）に変換する
+
+    和了牌以外の13枚を左から並べ、和了牌はツモ牌の隙間を空けて右端に置く。
+    """
+    concealed = list(hand["tiles"])
+    concealed.remove(hand["win_tile"])
+    detections = []
+    x, y = 10, 20
+    for i, code in enumerate(concealed + [hand["win_tile"]]):
+        if i == len(concealed):
+            x += TILE_W // 2
+        jitter = rng.randint(-2, 2)
+        detections.append({
+            "class_id": CLASS_ID_TO_CODE.index(code),
+            "name": code,
+            "confidence": round(rng.uniform(0.85, 0.99), 3),
+            "bbox": [x, y + jitter, x + TILE_W - 2, y + TILE_H + jitter]
+        })
+        x += TILE_W
+    return detections
+
+
+def iter_corpus(count, seed=0) -> Iterator[Dict[str, Any]]:
+    """和了形と対応する検出結果を count 件順に返す"""
+    rng = random.Random(seed)
+    for i in range(count):
+        hand = random_hand(rng, index=i)
+        hand["detections"] = to_detections(hand, rng)
+        yield hand
+
+
+def read_corpus(path) -> Iterator[Dict[str, Any]]:
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            if line.strip():
+                yield json.loads(line)
+
+
+def reference_score(hand):
+    """
+    mahjong の HandCalculator を直接使った基準の点数計算（赤5は赤ドラとして扱う）
+
+    Returns:
+        dict: {"han", "fu", "cost", "yaku"} または {"error"}
+    """
+    HandCalculator, TilesConverter, (EAST, SOUTH, WEST, NORTH), HandConfig, OptionalRules = _import_mahjong()
+
+    def to_136(codes):
+        by_suit = {s: "".join(c[0] for c in codes if c[1] == s) for s in "mpsz"}
+        return TilesConverter.string_to_136_array(man=by_suit["m"], pin=by_suit["p"], sou=by_suit["s"],
+                                                  honors=by_suit["z"], has_aka_dora=True)
+
+    tiles_136 = to_136(hand["tiles"])
+    win_136 = to_136([hand["win_tile"]])[0]
+    # 和了牌は手牌の中の同じ牌（赤5は赤5、普通の5は普通の5）を指す
+    if win_136 not in tiles_136:
+        win_136 = next(t for t in tiles_136 if t // 4 == win_136 // 4)
+
+    winds = {"east": EAST, "south": SOUTH, "west": WEST, "north": NORTH}
+    # ルールは caluculate.estimate_hand と同じ設定にする
+    options = build_optional_rules()
+    config = HandConfig(is_riichi=hand["riichi"], is_tsumo=not hand["ron"],
+                        player_wind=winds[hand["seat_wind"]], round_wind=winds[hand["round_wind"]],
+                        options=options)
+    result = HandCalculator().estimate_hand_value(tiles=tiles_136, win_tile=win_136, melds=[],
+                                                  dora_indicators=to_136(hand["dora"]), config=config)
+    if result.error:
+        return {"error": result.error}
+    return result_to_json(result, closed=True)
+
+
+def caluculate_score(hand):
+    """caluculate.py と同じ経路（score_hand）での点数計算"""
+    return score_hand(hand["tiles"], hand["win_tile"], dora=tiles_list_to_string(hand["dora"]),
+                      riichi=hand["riichi"], ron=hand["ron"], closed=True,
+                      round_wind=hand["round_wind"], seat_wind=hand["seat_wind"]) or {"error": "failed"}
+
+
+def load_engine(spec):
+    """"module:function" 形式で指定された点数計算エンジン（hand の辞書を受け取る関数）を読み込む"""
+    module, _, name = spec.partition(":")
+    return getattr(importlib.import_module(module), name)
+
+
+def _summary(score):
+    if "error" in score:
+        return {"error": score["error"]}
+    cost = score.get("cost") or {}
+    return {"han": score["han"], "fu": score["fu"], "main": cost.get("main"), "additional": cost.get("additional")}
+
+
+def benchmark(hands, with_detections=True):
+    """
+    caluculate.py の経路の処理速度を測る
+
+    Args:
+        with_detections: True の場合は検出結果からの手牌復元（build_hand）も含める
+
+    Returns:
+        dict: {"hands", "seconds", "hands_per_sec"}
+    """
+    start = time.perf_counter()
+    n = 0
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        for hand in hands:
+            if with_detections:
+                built = build_hand(hand["detections"])
+                if built:
+                    score_hand(built["tiles"], built["win_tile"], dora=tiles_list_to_string(hand["dora"]),
+                               riichi=hand["riichi"], ron=hand["ron"], closed=True,
+                               round_wind=hand["round_wind"], seat_wind=hand["seat_wind"])
+            else:
+                caluculate_score(hand)
+            n += 1
+    elapsed = time.perf_counter() - start
+    return {"hands": n, "seconds": round(elapsed, 2), "hands_per_sec": round(n / elapsed, 1) if elapsed else 0.0}
+
+
+def differential(hands, engine, max_report=10):
+    """
+    点数計算エンジンと基準（HandCalculator 直接）の結果を比べる
+
+    Returns:
+        dict: {"hands", "mismatches", "by_kind": {種類: [件数, 不一致数]}, "examples": [...]}
+    """
+    total = 0
+    mismatches = 0
+    by_kind = {}
+    examples = []
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        for hand in hands:
+            total += 1
+            stats = by_kind.setdefault(hand["kind"], [0, 0])
+            stats[0] += 1
+            expected = _summary(reference_score(hand))
+            actual = _summary(engine(hand))
+            if expected != actual:
+                mismatches += 1
+                stats[1] += 1
+                if len(examples) < max_report:
+                    examples.append({"hand": {k: v for k, v in hand.items() if k != "detections"},
+                                     "expected": expected, "actual": actual})
+    return {"hands": total, "mismatches": mismatches, "by_kind": by_kind, "examples": examples}
+
+
+def main():
+    parser = argparse.ArgumentParser(description='和了形コーパスの生成・点数計算のベンチマークと差分検証')
+    parser.add_argument('--count', type=int, default=10000, help='生成する和了形の数')
+    parser.add_argument('--seed', type=int, default=0, help='乱数シード')
+    parser.add_argument('--output', type=str, help='生成したコーパスの出力先（.jsonl）')
+    parser.add_argument('--corpus', type=str, help='既存のコーパス（省略時はその場で生成）')
+    parser.add_argument('--bench', action='store_true', help='caluculate.py の経路の hands/sec を測る')
+    parser.add_argument('--diff', action='store_true', help='点数計算エンジンと HandCalculator の差分を検証する')
+    parser.add_argument('--engine', type=str, default='hand_corpus:caluculate_score',
+                        help='差分検証するエンジン（module:function、hand の辞書を受け取る）')
+    args = parser.parse_args()
+
+    def hands():
+        return read_corpus(args.corpus) if args.corpus else iter_corpus(args.count, seed=args.seed)
+
+    if args.output:
+        kinds = Counter()
+        with open(args.output, "w", encoding="utf-8") as f:
+            for hand in iter_corpus(args.count, seed=args.seed):
+                kinds[hand["kind"]] += 1
+                f.write(json.dumps(hand, ensure_ascii=False) + "\n")
+        print(f"💾 {args.count}件の和了形を '{args.output}' に保存しました。 {dict(kinds)}")
+
+    if args.bench:
+        full = benchmark(hands(), with_detections=True)
+        scoring = benchmark(hands(), with_detections=False)
+        print(f"⏱️ 検出結果から点数まで: {full['hands_per_sec']} hands/sec ({full['hands']}件, {full['seconds']}秒)")
+        print(f"⏱️ 点数計算のみ: {scoring['hands_per_sec']} hands/sec ({scoring['hands']}件, {scoring['seconds']}秒)")
+
+    if args.diff:
+        report = differential(hands(), load_engine(args.engine))
+        print(f"🔍 差分検証 ({args.engine}): {report['hands']}件中 {report['mismatches']}件不一致")
+        for kind, (n, bad) in report["by_kind"].items():
+            print(f"  - {kind}: {bad}/{n}")
+        for ex in report["examples"]:
+            print(f"  ✗ {json.dumps(ex, ensure_ascii=False)}")
+        if report["mismatches"]:
+            raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,155 @@
+import math
+import time
+from typing import Any, Dict, List, Tuple
+
+from mahjong.agari import Agari
+
+from caluculate import AKA_LIMIT, CLASS_ID_TO_CODE, MIN_CONFIDENCE, get_class_id, get_confidence
+
+# 候補の信頼度の下限（log(0) を避けるため）
+MIN_PROB = 1e-3
+
+
+def code_to_34(code: str) -> int:
+    """牌コード（"5m", "0p", "7z" など）を34種インデックスに変換する"""
+    n = int(code[0]) or 5
+    return {"m": 0, "p": 9, "s": 18, "z": 27}[code[1]] + n - 1
+
+
+def is_complete_hand(codes: List[str]) -> bool:
+    """14枚の牌コードが和了形（一般形・七対子・国士無双）か判定する"""
+    if len(codes) != 14:
+        return False
+    tiles_34 = [0] * 34
+    for c in codes:
+        tiles_34[code_to_34(c)] += 1
+    if max(tiles_34) > 4:
+        return False
+    return Agari().is_agari(tiles_34)
+
+
+def find_waits(concealed: List[str]) -> List[str]:
+    """13枚の手牌の待ち牌（加えると和了形になる牌）を求める"""
+    if len(concealed) != 13:
+        return []
+    tiles_34 = [0] * 34
+    for c in concealed:
+        tiles_34[code_to_34(c)] += 1
+    agari = Agari()
+    waits = []
+    for k in range(34):
+        if tiles_34[k] >= 4:
+            continue
+        tiles_34[k] += 1
+        if agari.is_agari(tiles_34):
+            waits.append(f"{k % 9 + 1}{'mpsz'[k // 9]}")
+        tiles_34[k] -= 1
+    return waits
+
+
+def _box_candidates(d: Dict[str, Any]) -> List[Tuple[str, float]]:
+    """検出1件の候補クラスを (牌コード, 信頼度) のリストで返す（同じ牌コードは信頼度の最大のみ）"""
+    raw = d.get("candidates") or [{"class_id": get_class_id(d), "confidence": get_confidence(d)}]
+    best: Dict[str, float] = {}
+    for c in raw:
+        cid = get_class_id(c)
+        if cid is None or cid < 0 or cid >= len(CLASS_ID_TO_CODE):
+            continue
+        code = CLASS_ID_TO_CODE[cid]
+        best[code] = max(best.get(code, 0.0), get_confidence(c), MIN_PROB)
+    return sorted(best.items(), key=lambda x: x[1], reverse=True)
+
+
+def search_hand(dets: List[Dict[str, Any]], min_confidence=MIN_CONFIDENCE, beam_width=256, time_budget_ms=200.0):
+    """
+    各検出枠の上位候補を組み合わせ、和了形になる最も尤もらしい14枚をビームサーチで探す
+
+    枠ごとに「候補クラスのいずれか」または「枠を除外する」を選び、
+    34種×4枚・赤ドラ1枚の上限で枝刈りする。同じ牌構成の状態はスコアの高い方のみ残す。
+
+    Args:
+        dets: 検出結果のリスト（"candidates" があれば上位候補として使用）
+        min_confidence: 探索対象にする枠の最低信頼度（build_hand で採用する下限と同じ）
+        beam_width: ビーム幅
+        time_budget_ms: 探索の制限時間（ミリ秒）。超えた場合は残りの枠をビーム幅1（その時点の最良の状態を
+                        貪欲に延ばす）で探索し、それまでに見つけた最良の組み合わせを返す
+
+    Returns:
+        dict | None: {"kept", "corrections", "score", "elapsed_ms", "timed_out"}。見つからない場合は None
+    """
+    start = time.perf_counter()
+    deadline = start + time_budget_ms / 1000.0
+
+    boxes = []
+    for d in dets:
+        cands = _box_candidates(d)
+        if cands and cands[0][1] >= min_confidence:
+            boxes.append((cands, d.get("bbox", [0, 0, 0, 0])))
+    if len(boxes) < 14:
+        return None
+
+    # 確信度の高い枠から順に確定させ、曖昧な枠を後半でまとめて分岐させる
+    order = sorted(range(len(boxes)), key=lambda i: boxes[i][0][0][1], reverse=True)
+
+    # 状態: (牌構成, 赤ドラ構成, 枚数) -> (スコア, 各枠の選択)
+    beam = {(tuple([0] * 34), (0, 0, 0), 0): (0.0, ())}
+    width = beam_width
+    for step, i in enumerate(order):
+        if width > 1 and time.perf_counter() > deadline:
+            print(f"⏱️ 補正探索が制限時間 {time_budget_ms}ms を超えました（残りの枠は最良の状態だけを延ばします）")
+            width = 1
+        cands, _ = boxes[i]
+        remaining = len(order) - step - 1
+        top_conf = cands[0][1]
+        drop_score = math.log(max(1.0 - top_conf, MIN_PROB))
+
+        next_beam = {}
+        for (counts, aka, n), (score, picks) in beam.items():
+            options = [(None, drop_score)] if n + remaining >= 14 else []
+            if n < 14:
+                options += [(code, math.log(conf)) for code, conf in cands]
+            for code, delta in options:
+                new_counts, new_aka, new_n = counts, aka, n
+                if code is not None:
+                    k = code_to_34(code)
+                    if counts[k] >= 4:
+                        continue
+                    new_counts = counts[:k] + (counts[k] + 1,) + counts[k + 1:]
+                    if code[0] == "0":
+                        a = "mps".index(code[1])
+                        if aka[a] >= AKA_LIMIT:
+                            continue
+                        new_aka = aka[:a] + (aka[a] + 1,) + aka[a + 1:]
+                    new_n = n + 1
+                key = (new_counts, new_aka, new_n)
+                new_score = score + delta
+                if key not in next_beam or next_beam[key][0] < new_score:
+                    next_beam[key] = (new_score, picks + ((i, code),))
+        beam = dict(sorted(next_beam.items(), key=lambda kv: kv[1][0], reverse=True)[:width])
+
+    for (counts, _, n), (score, picks) in sorted(beam.items(), key=lambda kv: kv[1][0], reverse=True):
+        if n != 14:
+            continue
+        if not Agari().is_agari(list(counts)):
+            continue
+
+        kept: List[Tuple[str, float, List[float]]] = []
+        corrections = []
+        for i, code in sorted(picks):
+            cands, bbox = boxes[i]
+            top_code, top_conf = cands[0]
+            if code is None:
+                corrections.append({"bbox": bbox, "from": top_code, "to": None, "confidence": top_conf})
+                continue
+            conf = dict(cands)[code]
+            kept.append((code, conf, bbox))
+            if code != top_code:
+                corrections.append({"bbox": bbox, "from": top_code, "to": code, "confidence": conf})
+        return {
+            "kept": kept,
+            "corrections": corrections,
+            "score": round(score, 4),
+            "elapsed_ms": round((time.perf_counter() - start) * 1000, 2),
+            "timed_out": width < beam_width,
+        }
+    return None
@@ -0,0 +1,45 @@
+import json
+import os
+
+# 自動調整（autotune.py）が書き出す推論設定ファイル
+CONFIG_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'inference_config.json')
+
+# 設定ファイルが無い場合の既定値（threads=0 は torch の既定スレッド数を使う）
+DEFAULT_CONFIG = {
+    "imgsz": 960,
+    "conf": 0.25,
+    "threads": 0,
+    "batch_size": 1
+}
+
+
+def load_inference_config(path=None):
+    """
+    推論設定を読み込む（ファイルが無い・壊れている場合は既定値）
+
+    Returns:
+        dict: imgsz / conf / threads / batch_size
+    """
+    path = path or os.environ.get('INFERENCE_CONFIG', CONFIG_PATH)
+    config = dict(DEFAULT_CONFIG)
+    if os.path.exists(path):
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                saved = json.load(f)
+            config.update({k: saved[k] for k in DEFAULT_CONFIG if k in saved})
+        except (OSError, ValueError) as e:
+            print(f"⚠️ 推論設定の読み込みに失敗しました（既定値を使用）: {e}")
+    return config
+
+
+def save_inference_config(config, path=CONFIG_PATH):
+    """推論設定を書き出す"""
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(config, f, ensure_ascii=False, indent=2)
+
+
+def apply_threads(config):
+    """推論設定のスレッド数を torch に反映する"""
+    if config.get("threads"):
+        import torch
+        torch.set_num_threads(int(config["threads"]))
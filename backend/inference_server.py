@@ -0,0 +1,259 @@
+import itertools
+import multiprocessing as mp
+import os
+import queue
+import time
+from multiprocessing import shared_memory
+
+import numpy as np
+
+# 共有メモリの画像スロット数（同時に推論待ちにできる画像の上限）
+SLOT_COUNT = 8
+# 1スロットに入る画像の最大の辺（切り出し済みの手牌・ドラ画像が収まる大きさ）
+MAX_SLOT_SIDE = 1920
+# 空きスロットを待つ時間と、推論結果を待つ時間（秒）
+ACQUIRE_TIMEOUT = 2.0
+RESULT_TIMEOUT = 30.0
+# 制御キューでモデルの切り替えを指示するメッセージの目印
+SWAP = "__swap__"
+
+
+class SlotPoolExhausted(RuntimeError):
+    """空きスロットが無く、待っても確保できなかった"""
+
+
+def _finish(replies, free, slot, request_id, detections):
+    """
+    要求の結果をスロットの応答キューに返し、スロットを空きに戻す
+
+    スロットを空きに戻すのは推論プロセスが画像を読み終えた後だけにする。
+    要求側がタイムアウトしても、推論中の画像が次の要求に上書きされることはない。
+    """
+    replies[slot].put((request_id, detections))
+    free.put(slot)
+
+
+def _serve(model_path, slot_names, requests, replies, free, ready, batch_size, imgsz_list=None):
+    """
+    推論プロセスの本体
+
+    制御キューから (要求ID, スロット番号, 画像の形, imgsz, conf, top_k) を受け取り、
+    スロットの共有メモリをそのまま numpy 配列として推論に渡す（コピーしない）。
+    待っている要求は batch_size 件までまとめて1回の推論にする。
+    imgsz_list の入力サイズ（省略時は設定の imgsz）ごとにウォームアップしてから受け付ける。
+    """
+    from detector import load_model, result_to_detections, warm_up
+    from inference_config import apply_threads, load_inference_config
+
+    config = load_inference_config()
+    apply_threads(config)
+    shms = [shared_memory.SharedMemory(name=name) for name in slot_names]
+    imgsz_list = imgsz_list or [config["imgsz"]]
+    model = load_model(model_path)
+    warm_up(model, imgsz_list, sorted({1, batch_size}))
+    ready.set()
+
+    try:
+        while True:
+            msg = requests.get()
+            if msg is None:
+                break
+            swap = None
+            pending = []
+            while True:
+                if msg[0] == SWAP:
+                    # 切り替えは手前の要求を処理し終えてから行う
+                    swap = msg[1]
+                    break
+                pending.append(msg)
+                if len(pending) >= batch_size:
+                    break
+                try:
+                    msg = requests.get_nowait()
+                except queue.Empty:
+                    break
+                if msg is None:
+                    requests.put(None)
+                    break
+
+            # 入力サイズと信頼度しきい値が同じ要求ごとにまとめて推論する
+            groups = {}
+            for m in pending:
+                groups.setdefault((m[3], m[4]), []).append(m)
+            for (imgsz, conf), group in groups.items():
+                frames = [np.ndarray(shape, dtype=np.uint8, buffer=shms[slot].buf) for _, slot, shape, _, _, _ in group]
+                try:
+                    results = model.predict(source=frames, imgsz=imgsz, conf=conf, verbose=False)
+                    replies_out = [(request_id, slot, result_to_detections(result, top_k=top_k))
+                                   for (request_id, slot, _, _, _, top_k), result in zip(group, results)]
+                except Exception as e:
+                    replies_out = [(request_id, slot, {"error": str(e)}) for request_id, slot, _, _, _, _ in group]
+                del frames
+                for request_id, slot, detections in replies_out:
+                    _finish(replies, free, slot, request_id, detections)
+
+            if swap:
+                model = load_model(swap, cached=False)
+                warm_up(model, imgsz_list, sorted({1, batch_size}))
+                print(f"🔀 推論プロセスのモデルを切り替えました: {swap}")
+    finally:
+        for shm in shms:
+            shm.close()
+
+
+class InferenceServer:
+    """
+    モデルを持つ推論プロセスと、共有メモリの画像スロットのプール
+
+    Webワーカーは空きスロットを確保して画像を直接書き込み、スロット番号と画像の形だけを
+    制御キューで推論プロセスに送る。結果（検出結果のリスト）はスロットごとの応答キューで受け取る。
+    依頼したスロットは推論プロセスが読み終えてから空きに戻す（要求側がタイムアウトしても同じ）。
+    start() はWebワーカーを fork する前（親プロセス）で呼ぶこと。stop() は作成したプロセスでだけ働く。
+    """
+
+    def __init__(self, model_path, slots=SLOT_COUNT, max_side=MAX_SLOT_SIDE, batch_size=None,
+                 start_method="spawn", imgsz_list=None):
+        from inference_config import load_inference_config
+
+        self.model_path = model_path
+        # 推論プロセスでウォームアップする入力サイズ（省略時は設定の imgsz）
+        self.imgsz_list = list(imgsz_list) if imgsz_list else None
+        self.max_side = max_side
+        self.batch_size = batch_size or max(1, int(load_inference_config()["batch_size"]))
+        self._ctx = mp.get_context(start_method)
+        self._shms = [shared_memory.SharedMemory(create=True, size=max_side * max_side * 3) for _ in range(slots)]
+        self._free = self._ctx.Queue()
+        for slot in range(slots):
+            self._free.put(slot)
+        self._requests = self._ctx.Queue()
+        self._replies = [self._ctx.Queue() for _ in range(slots)]
+        self.ready = self._ctx.Event()
+        self._ids = itertools.count()
+        self._process = None
+        # 共有メモリを作成したプロセス（fork したWebワーカーでは stop() しない）
+        self._owner_pid = os.getpid()
+
+    @property
+    def slot_count(self):
+        return len(self._replies)
+
+    def start(self):
+        self._process = self._ctx.Process(
+            target=_serve,
+            args=(self.model_path, [shm.name for shm in self._shms], self._requests,
+                  self._replies, self._free, self.ready, self.batch_size, self.imgsz_list),
+            daemon=True
+        )
+        self._process.start()
+        return self
+
+    def stop(self):
+        """
+        推論プロセスを止め、共有メモリを解放する
+
+        fork したWebワーカーに引き継がれた atexit からの呼び出しでは何もしない
+        （1つのワーカーの終了で、他のワーカーが使っている推論プロセスと共有メモリを止めないように）。
+        """
+        if os.getpid() != self._owner_pid:
+            return
+        if self._process is not None:
+            self._requests.put(None)
+            self._process.join(timeout=10)
+            self._process = None
+        for shm in self._shms:
+            shm.close()
+            shm.unlink()
+        self._shms = []
+
+    def swap(self, model_path):
+        """推論プロセスのモデルを切り替える（先に届いた要求は切り替え前のモデルで処理される）"""
+        self._requests.put((SWAP, model_path))
+
+    def acquire(self, timeout=ACQUIRE_TIMEOUT):
+        """
+        空きスロットを1つ確保する
+
+        Raises:
+            SlotPoolExhausted: timeout 秒待っても空きが無い
+        """
+        try:
+            return self._free.get(timeout=timeout)
+        except queue.Empty:
+            raise SlotPoolExhausted(f"空きスロットがありません（{self.slot_count}スロット使用中）")
+
+    def release(self, slot):
+        """推論を依頼していないスロットを空きに戻す（依頼したスロットは推論プロセスが戻す）"""
+        self._free.put(slot)
+
+    def frame(self, slot, shape):
+        """スロットの共有メモリを画像の形の numpy 配列として返す（書き込むと推論プロセスからも見える）"""
+        height, width = shape[:2]
+        if height > self.max_side or width > self.max_side or len(shape) != 3 or shape[2] != 3:
+            raise ValueError(f"スロットに入らない画像です: {shape}")
+        return np.ndarray((height, width, 3), dtype=np.uint8, buffer=self._shms[slot].buf)
+
+    def write(self, slot, image):
+        """
+        BGR画像をスロットに書き込み、画像の形を返す
+
+        cv2.imdecode は出力先の配列を指定できず、スロットに入るのはデコードしたフレームの切り出しのため、
+        デコード・切り出し済みの画像からスロットへの1回のコピーはここで行う（フレーム全体はコピーしない）。
+        """
+        np.copyto(self.frame(slot, image.shape), image)
+        return image.shape
+
+    def submit(self, slot, shape, imgsz, conf, top_k=1):
+        """スロットの画像の推論を依頼し、要求IDを返す"""
+        request_id = f"{os.getpid()}-{next(self._ids)}"
+        self._requests.put((request_id, slot, tuple(shape), imgsz, conf, top_k))
+        return request_id
+
+    def result(self, slot, request_id, timeout=RESULT_TIMEOUT):
+        """
+        依頼した推論の結果を待つ（以前にタイムアウトした要求の古い応答は読み捨てる）
+
+        タイムアウトしてもスロットは空きに戻さない（推論プロセスが読み終えた時点で戻る）。
+
+        Raises:
+            TimeoutError: timeout 秒以内に結果が返らない
+            RuntimeError: 推論プロセスでのエラー
+        """
+        deadline = time.monotonic() + timeout
+        while True:
+            remaining = deadline - time.monotonic()
+            try:
+                reply_id, detections = self._replies[slot].get(timeout=max(0.0, remaining))
+            except queue.Empty:
+                raise TimeoutError(f"推論結果が {timeout}秒以内に返りませんでした")
+            if reply_id != request_id:
+                continue
+            if isinstance(detections, dict) and "error" in detections:
+                raise RuntimeError(detections["error"])
+            return detections
+
+    def detect_many(self, images, imgsz, conf, top_k=1, timeout=RESULT_TIMEOUT):
+        """
+        複数の画像をそれぞれスロットに書き込んでまとめて推論を依頼し、画像ごとの検出結果を返す
+
+        スロット数より多い画像はスロット数ずつに分けて依頼する。
+
+        Raises:
+            SlotPoolExhausted: スロットを確保できない
+            TimeoutError: timeout 秒以内に結果が返らない
+        """
+        detections = []
+        for start in range(0, len(images), self.slot_count):
+            chunk = images[start:start + self.slot_count]
+            slots, requests = [], []
+            try:
+                for image in chunk:
+                    slots.append(self.acquire())
+                for slot, image in zip(slots, chunk):
+                    requests.append(self.submit(slot, self.write(slot, image), imgsz, conf, top_k))
+            finally:
+                # 依頼まで進まなかったスロットだけをここで戻す
+                for slot in slots[len(requests):]:
+                    self.release(slot)
+            detections += [self.result(slot, request_id, timeout=timeout)
+                           for slot, request_id in zip(slots, requests)]
+        return detections
@@ -0,0 +1,215 @@
+import base64
+import binascii
+import io
+import os
+import resource
+import threading
+from collections import deque
+
+import numpy as np
+from PIL import Image
+
+from profiling import stage
+
+# 1枚の画像（Base64デコード後）のバイト数の上限
+MAX_UPLOAD_BYTES = int(os.environ.get('MAX_UPLOAD_BYTES', str(20 * 1024 * 1024)))
+# 1回の要求本体（JSON）のバイト数の上限（連写の複数フレームを含む）
+MAX_REQUEST_BYTES = int(os.environ.get('MAX_REQUEST_BYTES', str(100 * 1024 * 1024)))
+# 画像の幅・高さと画素数の上限（ヘッダーだけを読んで、デコード前に確認する）
+MAX_IMAGE_SIDE = int(os.environ.get('MAX_IMAGE_SIDE', '10000'))
+MAX_IMAGE_PIXELS = int(os.environ.get('MAX_IMAGE_PIXELS', str(64 * 1000 * 1000)))
+# 要求ごとの画像バッファの見積もりのピークを保持する件数
+MEMORY_HISTORY = 1000
+
+_local = threading.local()
+_history = deque(maxlen=MEMORY_HISTORY)
+_history_lock = threading.Lock()
+
+
+class ImageRejected(ValueError):
+    """読み込めない画像"""
+
+
+class ImageTooLarge(ImageRejected):
+    """バイト数・解像度が上限を超える画像"""
+
+
+class ImageBufferEstimate:
+    """
+    1回の要求で画像の取り込みに確保したバッファの大きさの見積もり（現在値とピーク）
+
+    Base64 文字列・圧縮データ・デコード後の画素のバイト数を足し引きした値で、実測ではない。
+    request.json の辞書、PIL / OpenCV 内部の作業領域、子プロセスのメモリは含まない
+    （プロセス全体の実測は memory_summary の process_maxrss_mb を見る）。
+    """
+
+    def __init__(self):
+        self.current = 0
+        self.peak = 0
+
+    def add(self, nbytes):
+        self.current += nbytes
+        self.peak = max(self.peak, self.current)
+
+    def release(self, nbytes):
+        self.current -= nbytes
+
+
+def _meter():
+    meter = getattr(_local, 'meter', None)
+    if meter is None:
+        meter = _local.meter = ImageBufferEstimate()
+    return meter
+
+
+def start_request():
+    """要求の処理を始める（このスレッドの画像バッファの見積もりをやり直す）"""
+    _local.meter = ImageBufferEstimate()
+
+
+def finish_request():
+    """
+    要求の処理を終え、画像の取り込みに確保したバッファの見積もりのピーク（バイト）を返す
+
+    画像を扱わなかった要求は 0 を返し、集計にも含めない。
+    """
+    meter = getattr(_local, 'meter', None)
+    _local.meter = None
+    if meter is None or meter.peak == 0:
+        return 0
+    with _history_lock:
+        _history.append(meter.peak)
+    return meter.peak
+
+
+def memory_summary():
+    """画像を扱った直近の要求の画像バッファの見積もりのピークと、このプロセスの最大常駐メモリ（実測）"""
+    with _history_lock:
+        peaks = np.array(_history, dtype=np.float64) / (1024 * 1024)
+    return {
+        "requests": int(peaks.size),
+        "image_buffer_estimate_mb": {
+            "mean": round(float(peaks.mean()), 1),
+            "p95": round(float(np.percentile(peaks, 95)), 1),
+            "max": round(float(peaks.max()), 1)
+        } if peaks.size else None,
+        # Linux の ru_maxrss は KB 単位
+        "process_maxrss_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1)
+    }
+
+
+def open_upload(image_data):
+    """
+    Base64画像データ（data URL 可）のヘッダーだけを読み、大きさを確認した画像を返す（画素はまだデコードしない）
+
+    Raises:
+        ImageTooLarge: バイト数・幅・高さ・画素数が上限を超える
+        ImageRejected: 画像として読めない
+    """
+    # 要求本体に含まれる Base64 文字列（1文字1バイト）も見積もりに含める
+    _meter().add(len(image_data))
+    if ',' in image_data:
+        image_data = image_data.split(',', 1)[1]
+    # Base64 は4文字で3バイト。デコードする前に大きさを確かめる
+    if len(image_data) * 3 // 4 > MAX_UPLOAD_BYTES:
+        raise ImageTooLarge(f'画像のサイズが大きすぎます（上限 {MAX_UPLOAD_BYTES // (1024 * 1024)}MB）')
+    try:
+        with stage('base64_decode'):
+            image_bytes = base64.b64decode(image_data)
+        image = Image.open(io.BytesIO(image_bytes))
+    except (binascii.Error, ValueError, OSError) as e:
+        raise ImageRejected(f'画像を読み込めません: {e}')
+    _meter().add(len(image_bytes))
+
+    width, height = image.size
+    if max(width, height) > MAX_IMAGE_SIDE or width * height > MAX_IMAGE_PIXELS:
+        raise ImageTooLarge(f'画像の解像度が大きすぎます: {width}x{height}（上限 長辺{MAX_IMAGE_SIDE}px）')
+    return image
+
+
+def decode(image, max_side=None):
+    """
+    open_upload の画像を RGB でデコードする
+
+    max_side を指定した場合、JPEG は縮小デコード（1/2, 1/4, 1/8）で長辺が max_side 以上の最小の大きさに
+    直接デコードし、残りを縮小する。元の解像度の画素は確保しない。
+
+    Raises:
+        ImageRejected: 画像が壊れていてデコードできない
+    """
+    meter = _meter()
+    encoded = image.fp.getbuffer().nbytes if isinstance(image.fp, io.BytesIO) else 0
+    with stage('image_decode'):
+        if max_side and max(image.size) > max_side:
+            scale = max_side / max(image.size)
+            image.draft('RGB', (int(np.ceil(image.size[0] * scale)), int(np.ceil(image.size[1] * scale))))
+        try:
+            decoded = image.convert('RGB')
+        except OSError as e:
+            raise ImageRejected(f'画像をデコードできません: {e}')
+        meter.add(decoded.width * decoded.height * 3)
+        # デコードし終えた圧縮データは不要
+        image.close()
+        meter.release(encoded)
+        if max_side and max(decoded.size) > max_side:
+            before = decoded.width * decoded.height * 3
+            decoded.thumbnail((max_side, max_side), Image.LANCZOS)
+            meter.add(decoded.width * decoded.height * 3)
+            meter.release(before)
+    return decoded
+
+
+def decode_bgr(image, max_side=None):
+    """
+    open_upload の画像を OpenCV の BGR 画像（numpy配列）としてデコードする
+
+    max_side を指定した場合、JPEG は縮小デコード（1/2, 1/4, 1/8）で長辺が max_side 以上の最小の大きさに
+    直接デコードし、残りを縮小する。
+
+    Raises:
+        ImageRejected: 画像が壊れていてデコードできない
+    """
+    # cv2 の読み込みは起動時ではなくウォームアップ（または最初の要求）で行う
+    import cv2
+
+    meter = _meter()
+    if not isinstance(image.fp, io.BytesIO):
+        raise ImageRejected('画像をデコードできません')
+    data = image.fp.getbuffer()
+    encoded = data.nbytes
+    flags = cv2.IMREAD_COLOR
+    if max_side and image.format == 'JPEG':
+        for factor, reduced in ((8, cv2.IMREAD_REDUCED_COLOR_8), (4, cv2.IMREAD_REDUCED_COLOR_4),
+                                (2, cv2.IMREAD_REDUCED_COLOR_2)):
+            if max(image.size) / factor >= max_side:
+                flags = reduced
+                break
+    with stage('image_decode'):
+        bgr = cv2.imdecode(np.frombuffer(data, dtype=np.uint8), flags)
+        # デコードし終えた圧縮データは不要
+        data.release()
+        image.close()
+        if bgr is None:
+            raise ImageRejected('画像をデコードできません')
+        meter.add(bgr.nbytes)
+        meter.release(encoded)
+        scale = max_side / max(bgr.shape[:2]) if max_side else 1
+        if scale < 1:
+            before = bgr.nbytes
+            bgr = cv2.resize(bgr, (max(1, int(bgr.shape[1] * scale)), max(1, int(bgr.shape[0] * scale))),
+                             interpolation=cv2.INTER_AREA)
+            meter.add(bgr.nbytes)
+            meter.release(before)
+    return bgr
+
+
+def load_upload(image_data, max_side=None):
+    """Base64画像データを大きさを確認してから RGB でデコードする（max_side は decode と同じ）"""
+    return decode(open_upload(image_data), max_side=max_side)
+
+
+def save_jpeg(image, path, quality=95):
+    """RGB画像を JPEG で保存する"""
+    with stage('image_encode'):
+        image.save(path, 'JPEG', quality=quality)
+    return path
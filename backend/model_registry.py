@@ -0,0 +1,443 @@
+import fcntl
+import json
+import os
+import random
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+BACKEND_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# バージョン名 → モデルファイルと、現在の採用バージョンを記録するファイル
+# （process.py / dora.py もここから採用中のモデルを読む）
+REGISTRY_PATH = os.environ.get('MODEL_REGISTRY', os.path.join(BACKEND_DIR, 'models', 'registry.json'))
+DEFAULT_REGISTRY = {"active": "v2", "models": {"v2": "models/best_v2.pt"}, "generation": 0, "shadow": None}
+# 管理APIから読み込めるモデルファイルの置き場所（これ以外のパスは pickle を含むため読み込まない）
+MODELS_DIR = os.path.join(BACKEND_DIR, 'models')
+
+# シャドー評価で同時に待たせる推論の上限（超えた分は標本にしない）と、保持する計測値の件数
+SHADOW_MAX_PENDING = 4
+SHADOW_HISTORY = 1000
+# シャドー評価の集計を書き出すファイル（registry.json と同じ場所）と、書き出す最短の間隔（秒）
+SHADOW_STATS_FILE = 'shadow_stats.json'
+SHADOW_STATS_INTERVAL = 1.0
+
+
+def _resolve(path):
+    return path if os.path.isabs(path) else os.path.join(BACKEND_DIR, path)
+
+
+def load_registry(path=None):
+    """モデル一覧と採用バージョンを読み込む（ファイルが無い場合は既定値）"""
+    path = path or REGISTRY_PATH
+    if os.path.exists(path):
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    return json.loads(json.dumps(DEFAULT_REGISTRY))
+
+
+def save_registry(registry, path=None):
+    """モデル一覧と採用バージョンを書き出す（書き込み途中のファイルを読まれないよう置き換えで保存）"""
+    path = path or REGISTRY_PATH
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp = path + '.tmp'
+    with open(tmp, 'w', encoding='utf-8') as f:
+        json.dump(registry, f, ensure_ascii=False, indent=2)
+    os.replace(tmp, path)
+
+
+def model_file(path):
+    """
+    登録するモデルファイルの絶対パス
+
+    Raises:
+        ValueError: MODELS_DIR の外のファイル
+    """
+    resolved = os.path.realpath(_resolve(path))
+    if os.path.commonpath([resolved, os.path.realpath(MODELS_DIR)]) != os.path.realpath(MODELS_DIR):
+        raise ValueError(f'モデルファイルは models/ 以下に置いてください: {path}')
+    return resolved
+
+
+def active_model_path(path=None):
+    """採用中のモデルファイルのパス"""
+    registry = load_registry(path)
+    return _resolve(registry["models"][registry["active"]])
+
+
+class ShadowStats:
+    """候補モデルのシャドー評価の集計（採用中モデルとの一致率・推論時間の差）"""
+
+    def __init__(self, version, rate):
+        self.version = version
+        self.rate = rate
+        self.started = time.time()
+        self.samples = 0
+        self.skipped = 0
+        self.errors = 0
+        self.hand_samples = 0
+        self.hand_matches = 0
+        self.tile_agreement = deque(maxlen=SHADOW_HISTORY)
+        self.latency_diff_ms = deque(maxlen=SHADOW_HISTORY)
+
+    def summary(self):
+        return {
+            "version": self.version,
+            "rate": self.rate,
+            "seconds": round(time.time() - self.started, 1),
+            "samples": self.samples,
+            "skipped": self.skipped,
+            "errors": self.errors,
+            "tile_agreement": round(float(np.mean(self.tile_agreement)), 4) if self.tile_agreement else None,
+            "hand_agreement": round(self.hand_matches / self.hand_samples, 4) if self.hand_samples else None,
+            "hand_samples": self.hand_samples,
+            "latency_diff_ms": {
+                "mean": round(float(np.mean(self.latency_diff_ms)), 1),
+                "p95": round(float(np.percentile(self.latency_diff_ms, 95)), 1)
+            } if self.latency_diff_ms else None
+        }
+
+
+class SerializedModel:
+    """
+    モデルの predict を1スレッドずつに直列化するラッパー（それ以外の属性は元のモデルのものを返す）
+
+    ultralytics の YOLO は predict のたびに同じ predictor の状態（前処理・バッチ）を書き換えるため、
+    1つのインスタンスを複数の要求スレッドから同時に推論させない。
+    """
+
+    def __init__(self, model):
+        self.model = model
+        self._lock = threading.Lock()
+
+    def predict(self, *args, **kwargs):
+        with self._lock:
+            return self.model.predict(*args, **kwargs)
+
+    def __getattr__(self, name):
+        return getattr(self.model, name)
+
+
+def _hand_key(detections):
+    """最終的な手牌（14枚と和了牌）。和了形にならない場合は None"""
+    from caluculate import build_hand
+
+    hand = build_hand(detections)
+    return (tuple(sorted(hand["tiles"])), hand["win_tile"]) if hand else None
+
+
+class ModelRegistry:
+    """
+    複数バージョンの検出モデルを並べて読み込み、採用モデルを無停止で切り替えるレジストリ
+
+    推論は呼び出し時点の採用モデルで行う（切り替え中の要求は切り替え前のモデルで最後まで処理する）。
+    採用モデル・登録一覧・シャドー評価の設定は registry.json に世代番号付きで保存し、
+    各ワーカーは参照のたびに更新時刻を確認して、他のワーカーでの変更を読み直す。
+
+    シャドー評価中は、開始したワーカー（registry.json の "owner"）だけが候補モデルを読み込み、
+    受けた切り出し画像の一部（rate の割合）を候補モデルにも推論させ、応答を返した後に別スレッドで
+    採用モデルとの一致率（牌単位・手牌単位）と推論時間の差を記録する。集計は SHADOW_STATS_FILE に書き出し、
+    どのワーカーからも参照できる。
+
+    読み込んだモデルは SerializedModel で包み（同じモデルの推論は1スレッドずつ）、warm を渡した場合は
+    warm(model) でウォームアップしてから一覧に差し込む。他のワーカーで採用モデルが切り替わった場合は、
+    新しいモデルを別スレッドで読み込み・ウォームアップし終えるまで、それまでのモデルで推論する。
+    """
+
+    def __init__(self, registry_path=None, warm=None):
+        self.registry_path = registry_path or REGISTRY_PATH
+        # 読み込んだモデルを一覧に差し込む前に呼ぶウォームアップ（{"<imgsz>x<batch>": ms} を返す）
+        self.warm = warm
+        self.stats_path = os.path.join(os.path.dirname(self.registry_path), SHADOW_STATS_FILE)
+        self._models = {}
+        self._warmup = {}
+        self._serving = None
+        self._loading = set()
+        self._lock = threading.Lock()
+        self._mtime = None
+        self._generation = None
+        self._shadow = None
+        self._shadow_config = None
+        self._stats_written = 0.0
+        self._pending = 0
+        self._executor = ThreadPoolExecutor(max_workers=1)
+        self._apply(load_registry(self.registry_path))
+
+    def _apply(self, registry):
+        """registry.json の内容をこのワーカーの状態に反映する（ロックを持って呼ぶ）"""
+        self._generation = registry.get("generation", 0)
+        self._paths = dict(registry["models"])
+        self._active = registry["active"]
+        self._shadow_config = registry.get("shadow")
+        owned = self._shadow_config is not None and self._shadow_config.get("owner") == os.getpid()
+        if self._shadow is not None and not (owned and self._shadow.version == self._shadow_config["version"]):
+            # 他のワーカーで終了・採用された評価の候補モデルは解放する
+            if self._shadow.version != self._active:
+                self._models.pop(self._shadow.version, None)
+                self._warmup.pop(self._shadow.version, None)
+            self._shadow = None
+
+    def _refresh(self):
+        """他のワーカーが registry.json を更新していれば読み直す（ロックを持って呼ぶ）"""
+        try:
+            mtime = os.stat(self.registry_path).st_mtime_ns
+        except FileNotFoundError:
+            return
+        if mtime == self._mtime:
+            return
+        registry = load_registry(self.registry_path)
+        self._mtime = mtime
+        if registry.get("generation", 0) != self._generation:
+            self._apply(registry)
+
+    def _update(self, change):
+        """
+        registry.json をファイルロックの下で読み直して change(registry) を適用し、世代番号を上げて保存する
+
+        ロックを持って呼ぶ。
+        """
+        os.makedirs(os.path.dirname(self.registry_path), exist_ok=True)
+        with open(self.registry_path + '.lock', 'w') as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            registry = load_registry(self.registry_path)
+            change(registry)
+            registry["generation"] = registry.get("generation", 0) + 1
+            save_registry(registry, self.registry_path)
+            self._mtime = os.stat(self.registry_path).st_mtime_ns
+        self._apply(registry)
+
+    def load(self, version, path=None):
+        """
+        モデルを読み込んで一覧に加える（採用モデルは変えない）
+
+        Raises:
+            ValueError: 未登録のバージョンでパスが無い・models/ の外のファイル・ファイルが無い
+        """
+        from detector import load_model
+
+        with self._lock:
+            self._refresh()
+            path = path or self._paths.get(version)
+        if not version or not path:
+            raise ValueError(f'未登録のモデルです: {version}')
+        resolved = model_file(path)
+        if not os.path.exists(resolved):
+            raise ValueError(f'モデルファイルが見つかりません: {path}')
+        # 読み込み・ウォームアップは時間がかかるためロックの外で行い、完了後に差し込む
+        model = SerializedModel(load_model(resolved, cached=False))
+        warmup = self.warm(model) if self.warm else {}
+        with self._lock:
+            self._models[version] = model
+            self._warmup[version] = warmup
+            if self._paths.get(version) != path:
+                def change(registry):
+                    registry["models"][version] = path
+                self._update(change)
+        print(f"📦 モデル読み込み: {version} ({path})")
+        return model
+
+    def activate(self, version):
+        """採用モデルを切り替える（未読み込みの場合は先に読み込む）"""
+        if version not in self._models:
+            self.load(version)
+        with self._lock:
+            self._refresh()
+            previous = self._active
+
+            def change(registry):
+                registry["active"] = version
+                # シャドー評価中の候補を採用した場合は評価を終える
+                if (registry.get("shadow") or {}).get("version") == version:
+                    registry["shadow"] = None
+            self._update(change)
+        print(f"🔀 採用モデル切り替え: {previous} → {version}")
+        return previous
+
+    def unload(self, version):
+        """
+        読み込み済みのモデルを解放する
+
+        Raises:
+            ValueError: 採用中・シャドー評価中のモデル
+        """
+        with self._lock:
+            self._refresh()
+            if version == self._active:
+                raise ValueError(f'採用中のモデルは解放できません: {version}')
+            if self._shadow is not None and self._shadow.version == version:
+                raise ValueError(f'シャドー評価中のモデルは解放できません: {version}')
+            self._warmup.pop(version, None)
+            return self._models.pop(version, None) is not None
+
+    def active(self):
+        """
+        採用中の (バージョン, モデル)
+
+        採用モデルがまだ読み込まれていない場合、それまで返していたモデルがあれば別スレッドで読み込みを始めて
+        それを返す（要求の処理中に読み込み・ウォームアップを待たない）。初回だけはその場で読み込む。
+        """
+        with self._lock:
+            self._refresh()
+            version = self._active
+            model = self._models.get(version)
+            if model is None and self._serving is not None:
+                if version not in self._loading:
+                    self._loading.add(version)
+                    threading.Thread(target=self._load_in_background, args=(version,), daemon=True).start()
+                return self._serving
+        if model is None:
+            model = self.load(version)
+        with self._lock:
+            self._serving = (version, model)
+        return version, model
+
+    def _load_in_background(self, version):
+        """他のワーカーで採用されたモデルを読み込み・ウォームアップする（以降の active() から使われる）"""
+        try:
+            self.load(version)
+        except Exception as e:
+            print(f"🚨 モデル読み込みエラー: {version} ({e})")
+        finally:
+            with self._lock:
+                self._loading.discard(version)
+
+    def active_path(self):
+        with self._lock:
+            self._refresh()
+            return _resolve(self._paths[self._active])
+
+    def start_shadow(self, version, rate):
+        """
+        候補モデルのシャドー評価を始める（候補モデルはこのワーカーだけが読み込み、このワーカーの要求から標本を取る）
+        """
+        if not 0 < rate <= 1:
+            raise ValueError(f'不正な標本の割合: {rate}')
+        with self._lock:
+            self._refresh()
+            if version == self._active:
+                raise ValueError(f'採用中のモデルはシャドー評価できません: {version}')
+        if version not in self._models:
+            self.load(version)
+        with self._lock:
+            def change(registry):
+                registry["shadow"] = {"version": version, "rate": rate, "owner": os.getpid()}
+            self._update(change)
+            self._shadow = ShadowStats(version, rate)
+            self._write_stats(force=True)
+        print(f"👥 シャドー評価開始: {version} (標本 {rate * 100:.0f}%)")
+
+    def stop_shadow(self):
+        """シャドー評価を終了し、最終の集計を返す（評価中のワーカー以外から呼んだ場合は最後に書き出された集計）"""
+        with self._lock:
+            self._refresh()
+            if self._shadow_config is None:
+                return None
+            summary = self._shadow.summary() if self._shadow else self._read_stats()
+
+            def change(registry):
+                registry["shadow"] = None
+            self._update(change)
+        return summary
+
+    def status(self):
+        with self._lock:
+            self._refresh()
+            shadow = None
+            if self._shadow_config is not None:
+                shadow = self._shadow.summary() if self._shadow else self._read_stats()
+                shadow = dict(shadow or {}, owner=self._shadow_config.get("owner"))
+            return {
+                "active": self._active,
+                "generation": self._generation,
+                "models": {v: {"path": p, "loaded": v in self._models, "warmup": self._warmup.get(v)}
+                           for v, p in self._paths.items()},
+                "shadow": shadow
+            }
+
+    def _write_stats(self, force=False):
+        """シャドー評価の集計を書き出す（他のワーカーの status() 用。ロックを持って呼ぶ）"""
+        now = time.monotonic()
+        if self._shadow is None or (not force and now - self._stats_written < SHADOW_STATS_INTERVAL):
+            return
+        self._stats_written = now
+        tmp = self.stats_path + f'.{os.getpid()}.tmp'
+        with open(tmp, 'w', encoding='utf-8') as f:
+            json.dump(self._shadow.summary(), f, ensure_ascii=False)
+        os.replace(tmp, self.stats_path)
+
+    def _read_stats(self):
+        """他のワーカーが書き出したシャドー評価の集計（無い・壊れている場合は None）"""
+        try:
+            with open(self.stats_path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def predict(self, images, imgsz, conf, top_k=1, hand=False):
+        """
+        採用モデルで画像ごとの検出結果を返す（シャドー評価中は標本を候補モデルにも回す）
+
+        Args:
+            hand: 手牌の画像の場合 True（手牌単位の一致も記録する）
+        """
+        from detector import result_to_detections
+
+        _, model = self.active()
+        t0 = time.perf_counter()
+        results = model.predict(source=list(images), imgsz=imgsz, conf=conf, verbose=False)
+        frames = [result_to_detections(r, top_k=top_k) for r in results]
+        self.mirror(images, frames, imgsz, conf, top_k=top_k,
+                    active_ms=(time.perf_counter() - t0) * 1000, hand=hand)
+        return frames
+
+    def mirror(self, images, active_frames, imgsz, conf, top_k=1, active_ms=None, hand=False):
+        """
+        採用モデルの結果が出た画像を、標本に選ばれた場合だけ候補モデルにも回す（応答は待たない）
+
+        Args:
+            active_ms: 採用モデルの推論時間（不明な場合は推論時間の差を記録しない）
+        """
+        with self._lock:
+            self._refresh()
+            stats = self._shadow
+            if stats is None or random.random() >= stats.rate:
+                return
+            if self._pending >= SHADOW_MAX_PENDING:
+                stats.skipped += 1
+                return
+            self._pending += 1
+            model = self._models[stats.version]
+        self._executor.submit(self._run_shadow, stats, model, list(images), active_frames,
+                              imgsz, conf, top_k, active_ms, hand)
+
+    def _run_shadow(self, stats, model, images, active_frames, imgsz, conf, top_k, active_ms, hand):
+        from detector import result_to_detections
+        from spatial import agreement
+
+        try:
+            t0 = time.perf_counter()
+            results = model.predict(source=images, imgsz=imgsz, conf=conf, verbose=False)
+            shadow_ms = (time.perf_counter() - t0) * 1000
+            frames = [result_to_detections(r, top_k=top_k) for r in results]
+
+            score = agreement(active_frames, frames)
+            hand_matches = [_hand_key(a) == _hand_key(s) for a, s in zip(active_frames, frames)] if hand else []
+            with self._lock:
+                stats.samples += 1
+                stats.tile_agreement.append(score)
+                stats.hand_samples += len(hand_matches)
+                stats.hand_matches += sum(hand_matches)
+                if active_ms is not None:
+                    stats.latency_diff_ms.append(shadow_ms - active_ms)
+                if stats is self._shadow:
+                    self._write_stats()
+        except Exception as e:
+            print(f"🚨 シャドー評価エラー: {e}")
+            with self._lock:
+                stats.errors += 1
+        finally:
+            with self._lock:
+                self._pending -= 1
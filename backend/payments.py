@@ -0,0 +1,121 @@
+import argparse
+from functools import lru_cache
+
+import numpy as np
+
+from caluculate import _import_mahjong, build_optional_rules
+
+# 表に持つ符（20〜110符と七対子の25符。130符までを範囲にする）
+FU_VALUES = [20, 25] + list(range(30, 140, 10))
+# 表に持つ翻数の上限（役満6倍 = 78翻）
+MAX_HAN = 78
+# 満貫以上の名前（基本点 → 名前）
+LIMIT_NAMES = ["", "mangan", "haneman", "baiman", "sanbaiman", "yakuman", "double_yakuman",
+               "triple_yakuman", "quadruple_yakuman", "quintuple_yakuman", "sextuple_yakuman"]
+_LIMIT_BY_BASE = {2000: 1, 3000: 2, 4000: 3, 6000: 4, 8000: 5, 16000: 6, 24000: 7, 32000: 8, 40000: 9, 48000: 10}
+
+# 符 → 表の列番号（表に無い符は -1）
+_FU_INDEX = np.full(FU_VALUES[-1] + 1, -1, dtype=np.int64)
+_FU_INDEX[FU_VALUES] = np.arange(len(FU_VALUES))
+
+
+@lru_cache(maxsize=None)
+def payment_table():
+    """
+    caluculate.py と同じ OptionalRules（切り上げ満貫・数え役満の扱い）で支払い表を作る
+
+    mahjong の ScoresCalculator を (役満か, 翻, 符, 親か, ツモか) の全組み合わせで一度ずつ呼び出して表にする。
+
+    Returns:
+        tuple: (支払い表 [役満か, 翻, 符の列, 親か, ツモか, (main, additional)], 満貫以上の種類 [役満か, 翻, 符の列])
+    """
+    from mahjong.hand_calculating.scores import ScoresCalculator
+
+    HandConfig = _import_mahjong()[3]
+    options = build_optional_rules()
+    calc = ScoresCalculator()
+    configs = {}
+    for dealer in (0, 1):
+        for tsumo in (0, 1):
+            config = HandConfig(is_tsumo=bool(tsumo), options=options)
+            config.is_dealer = bool(dealer)
+            configs[dealer, tsumo] = config
+
+    table = np.zeros((2, MAX_HAN + 1, len(FU_VALUES), 2, 2, 2), dtype=np.int64)
+    limits = np.zeros((2, MAX_HAN + 1, len(FU_VALUES)), dtype=np.int64)
+    for yakuman in (0, 1):
+        for han in range(1, MAX_HAN + 1):
+            for f, fu in enumerate(FU_VALUES):
+                for (dealer, tsumo), config in configs.items():
+                    cost = calc.calculate_scores(han, fu, config, is_yakuman=bool(yakuman))
+                    table[yakuman, han, f, dealer, tsumo] = (cost["main"], cost["additional"])
+                # 子のロンの支払いは基本点の4倍
+                limits[yakuman, han, f] = _LIMIT_BY_BASE.get(int(table[yakuman, han, f, 0, 0, 0]) // 4, 0)
+    return table, limits
+
+
+def compute_payments(han, fu, dealer=False, tsumo=False, honba=0, yakuman=False):
+    """
+    翻・符・親/子・ツモ/ロン・本場の配列から支払いをまとめて求める（引数は numpy のブロードキャストに従う）
+
+    Args:
+        han: 翻数（役満の場合は 13 × 倍数）
+        fu: 符（FU_VALUES のいずれか。満貫以上では支払いに影響しない）
+        yakuman: 役満の場合 True（数え役満の上限を適用しない）
+
+    Returns:
+        dict: {"main", "additional", "total", "limit"} の配列
+              main / additional は mahjong の cost と同じ意味（ロンは main のみ、ツモは main が親、additional が子の支払い）。
+              本場は ロン 300点、ツモ 1人100点 ずつ加える。limit は満貫以上の名前（満貫未満は空文字）
+
+    Raises:
+        ValueError: 翻が 1 未満、または表に無い符
+    """
+    table, limits = payment_table()
+    han, fu, dealer, tsumo, honba, yakuman = np.broadcast_arrays(
+        np.asarray(han, dtype=np.int64), np.asarray(fu, dtype=np.int64),
+        np.asarray(dealer, dtype=bool), np.asarray(tsumo, dtype=bool),
+        np.asarray(honba, dtype=np.int64), np.asarray(yakuman, dtype=bool))
+
+    if np.any(han < 1):
+        raise ValueError(f'不正な翻数があります: {int(np.sum(han < 1))}件')
+    h = np.minimum(han, MAX_HAN)
+    # 表の範囲外の符は切り詰めずに不正な符として扱う
+    in_range = (fu >= 0) & (fu <= FU_VALUES[-1])
+    f = np.where(in_range, _FU_INDEX[np.where(in_range, fu, 0)], -1)
+    if np.any(f < 0):
+        raise ValueError(f'不正な符があります: {int(np.sum(f < 0))}件')
+
+    y = yakuman.astype(np.int64)
+    d = dealer.astype(np.int64)
+    t = tsumo.astype(np.int64)
+    main = table[y, h, f, d, t, 0] + np.where(tsumo, 100, 300) * honba
+    additional = np.where(tsumo, table[y, h, f, d, t, 1] + 100 * honba, 0)
+    # ツモ: 親の和了は子3人が additional、子の和了は親が main・子2人が additional を払う
+    total = np.where(tsumo, np.where(dealer, 3 * additional, main + 2 * additional), main)
+    return {
+        "main": main,
+        "additional": additional,
+        "total": total,
+        "limit": np.array(LIMIT_NAMES)[limits[y, h, f]]
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='翻・符からの支払い計算（表引き）')
+    parser.add_argument('--han', type=int, required=True)
+    parser.add_argument('--fu', type=int, default=30)
+    parser.add_argument('--dealer', action='store_true')
+    parser.add_argument('--tsumo', action='store_true')
+    parser.add_argument('--honba', type=int, default=0)
+    parser.add_argument('--yakuman', action='store_true')
+    args = parser.parse_args()
+
+    p = compute_payments(args.han, args.fu, dealer=args.dealer, tsumo=args.tsumo, honba=args.honba,
+                         yakuman=args.yakuman)
+    limit = f" ({p['limit']})" if p['limit'] else ""
+    print(f"💰 main: {p['main']}, additional: {p['additional']}, 合計: {p['total']}{limit}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,22 +1,30 @@
-from ultralytics import YOLO
-import cv2
 import json
 import os
 import argparse
 import tempfile
 
-def recognize_hand_tiles(image_path, model_path="./models/best_v2.pt", output_dir=None):
+from detector import load_model, result_to_detections
+from inference_config import load_inference_config
+from model_registry import active_model_path
+from segment import recognize_row
+
+def recognize_hand_tiles(image_path, model_path=None, output_dir=None,
+                         engine="yolo", cls_model_path="./models/tile_cls.pt", top_k=1):
     """
     手牌を認識する関数
     
     Args:
         image_path: 入力画像のパス
-        model_path: モデルファイルのパス
+        model_path: モデルファイルのパス（Noneの場合はレジストリの採用モデル）
         output_dir: 出力ディレクトリ（Noneの場合は一時ディレクトリを使用）
+        engine: 認識エンジン（"yolo": 物体検出 / "segment": 列分割＋牌分類、曖昧な場合はYOLOに切り替え）
+        cls_model_path: 牌分類モデルのパス（engine="segment" の場合に使用）
+        top_k: 1牌あたりに保持する候補クラス数（和了形の補正探索で使用）
     
     Returns:
         list: 認識結果のリスト
     """
+    model_path = model_path or active_model_path()
     if not os.path.exists(model_path):
         print(f"モデルファイル {model_path} が見つかりません。")
         return []
@@ -25,9 +33,6 @@ def recognize_hand_tiles(image_path, model_path="./models/best_v2.pt", output_di
         print(f"画像ファイル {image_path} が見つかりません。")
         return []
     
-    # モデルを読み込み
-    model = YOLO(model_path)
-    
     # 出力ディレクトリの設定
     if output_dir is None:
         output_dir = tempfile.mkdtemp()
@@ -35,28 +40,25 @@ def recognize_hand_tiles(image_path, model_path="./models/best_v2.pt", output_di
         os.makedirs(output_dir, exist_ok=True)
     
     try:
-        # 推論実行
-        results = model.predict(
-            source=image_path, 
-            imgsz=960, 
-            conf=0.25, 
-            verbose=False
-        )
-        
-        # 結果をJSON形式で保存
-        detections = []
-        if results[0].boxes is not None:
-            for box in results[0].boxes:
-                cls_id = int(box.cls)
-                name = results[0].names[cls_id]
-                conf = float(box.conf)
-                x1, y1, x2, y2 = map(int, box.xyxy[0])
-                detections.append({
-                    "class_id": cls_id,
-                    "name": name,
-                    "confidence": round(conf, 3),
-                    "bbox": [x1, y1, x2, y2]
-                })
+        # 推論設定は一度だけ読み込む
+        config = load_inference_config()
+        if engine == "segment":
+            # 列分割＋牌分類の高速経路
+            detections, used_engine = recognize_row(image_path, cls_model_path, model_path, top_k=top_k,
+                                                    config=config)
+            print(f"認識エンジン: {used_engine}")
+        else:
+            # モデルを読み込み
+            model = load_model(model_path)
+            
+            # 推論実行
+            results = model.predict(
+                source=image_path, 
+                imgsz=config["imgsz"], 
+                conf=config["conf"], 
+                verbose=False
+            )
+            detections = result_to_detections(results[0], top_k=top_k)
         
         # 結果をJSONファイルに保存
         base_filename = os.path.splitext(os.path.basename(image_path))[0]
@@ -81,7 +83,10 @@ def main():
     parser = argparse.ArgumentParser(description='手牌認識スクリプト')
     parser.add_argument('--input', type=str, required=True, help='入力画像のパス')
     parser.add_argument('--output', type=str, help='出力ディレクトリ（省略時は一時ディレクトリ）')
-    parser.add_argument('--model', type=str, default='./models/best_v2.pt', help='モデルファイルのパス')
+    parser.add_argument('--model', type=str, help='モデルファイルのパス（省略時はレジストリの採用モデル）')
+    parser.add_argument('--engine', type=str, default='yolo', choices=['yolo', 'segment'], help='認識エンジン')
+    parser.add_argument('--cls_model', type=str, default='./models/tile_cls.pt', help='牌分類モデルのパス（--engine segment 用）')
+    parser.add_argument('--top_k', type=int, default=1, help='1牌あたりに保持する候補クラス数（2以上で重なった枠を候補にまとめる）')
 
     args = parser.parse_args()
     
@@ -89,7 +94,10 @@ def main():
     detections = recognize_hand_tiles(
         image_path=args.input,
         model_path=args.model,
-        output_dir=args.output
+        output_dir=args.output,
+        engine=args.engine,
+        cls_model_path=args.cls_model,
+        top_k=args.top_k
     )
     
     if detections:
@@ -0,0 +1,201 @@
+import contextlib
+import json
+import os
+import sys
+import tempfile
+import threading
+import time
+from collections import Counter
+
+# 1回の計測の最大時間（秒）と、標本を取る間隔の範囲（ミリ秒）
+MAX_PROFILE_SECONDS = 60
+MIN_INTERVAL_MS = 1
+MAX_INTERVAL_MS = 1000
+
+# 計測結果の保存先（どのワーカーが受けた要求からでも、計測したワーカーの結果を取り出せるようにする）
+PROFILE_DIR = os.environ.get('PROFILE_DIR', os.path.join(tempfile.gettempdir(), 'mahjong_profiles'))
+
+# 計測中のセッション（計測していない間は None。stage はこれだけを見て何もしない）
+_SESSION = None
+_SESSION_LOCK = threading.Lock()
+# 要求を処理中のスレッド（計測の前から処理中の要求も標本にできるよう、計測の有無によらず記録する）
+_IN_FLIGHT = set()
+
+
+class ProfilerBusy(RuntimeError):
+    """このワーカーで別の計測が実行中"""
+
+
+class ProfileSession:
+    """1回の計測の記録（スタックの標本と段階ごとの処理時間）"""
+
+    def __init__(self, all_threads=False):
+        self.all_threads = all_threads
+        self.stacks = Counter()
+        self.samples = 0
+        self.stages = {}
+        self._lock = threading.Lock()
+
+    def add_stage(self, name, ms):
+        with self._lock:
+            stats = self.stages.setdefault(name, [0, 0.0, 0.0])
+            stats[0] += 1
+            stats[1] += ms
+            stats[2] = max(stats[2], ms)
+
+    def stage_summary(self):
+        with self._lock:
+            return {name: {"count": n, "total_ms": round(total, 1), "mean_ms": round(total / n, 2),
+                           "max_ms": round(peak, 1)}
+                    for name, (n, total, peak) in sorted(self.stages.items(), key=lambda kv: -kv[1][1])}
+
+    def sample(self, own_ident):
+        """全スレッドの現在のスタックを1回記録する（all_threads でない場合は処理中の要求のスレッドだけ）"""
+        names = {t.ident: t.name for t in threading.enumerate()}
+        targets = None if self.all_threads else _IN_FLIGHT.copy()
+        for ident, frame in sys._current_frames().items():
+            if ident == own_ident or (targets is not None and ident not in targets):
+                continue
+            self.stacks[_collapse(frame, names.get(ident, str(ident)))] += 1
+        self.samples += 1
+
+    def collapsed(self):
+        """flamegraph.pl / speedscope で読める collapsed 形式（"root;caller;callee 回数" の行）"""
+        return "".join(f"{stack} {n}\n" for stack, n in self.stacks.most_common())
+
+
+def _collapse(frame, thread_name):
+    parts = []
+    while frame is not None:
+        code = frame.f_code
+        parts.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+        frame = frame.f_back
+    parts.append(thread_name)
+    return ";".join(reversed(parts))
+
+
+class stage:
+    """
+    処理段階の時間を計る（with stage("yolo"): ...）
+
+    計測していない間は時刻も取らないので、常に埋め込んでおいてよい。
+    """
+    __slots__ = ("name", "t0")
+
+    def __init__(self, name):
+        self.name = name
+        self.t0 = None
+
+    def __enter__(self):
+        if _SESSION is not None:
+            self.t0 = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        session = _SESSION
+        if self.t0 is not None and session is not None:
+            session.add_stage(self.name, (time.perf_counter() - self.t0) * 1000)
+
+
+def request_started():
+    """要求の処理を始めたスレッドを記録する（set への追加だけなので常に呼んでよい）"""
+    _IN_FLIGHT.add(threading.get_ident())
+
+
+def request_finished():
+    _IN_FLIGHT.discard(threading.get_ident())
+
+
+def result_path(pid):
+    return os.path.join(PROFILE_DIR, f'profile_{int(pid)}.json')
+
+
+def _save(result):
+    """計測の状態・結果を書き出す（書き込み途中のファイルを読まれないよう置き換えで保存）"""
+    os.makedirs(PROFILE_DIR, exist_ok=True)
+    path = result_path(result["pid"])
+    tmp = path + '.tmp'
+    with open(tmp, 'w', encoding='utf-8') as f:
+        json.dump(result, f, ensure_ascii=False)
+    os.replace(tmp, path)
+
+
+def load_result(pid):
+    """ワーカー pid の最後の計測の状態・結果（無い場合は None）"""
+    try:
+        with open(result_path(pid), 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def start_profile(seconds, interval_ms=5, all_threads=False):
+    """
+    seconds 秒間、このプロセスのスレッドのスタックを interval_ms ごとに標本にし、段階ごとの処理時間も集計する
+
+    標本は専用のスレッドで取り、この関数はすぐに戻る（呼び出した要求のスレッドで待たないので、
+    同期ワーカーでも計測中に他の要求を処理できる）。結果は終わり次第 PROFILE_DIR に書き出し、load_result で取り出す。
+    計測はこのプロセス内だけで、推論プロセスや caluculate.py などの子プロセスの中は含まない（段階の時間には含まれる）。
+
+    Returns:
+        dict: 計測の状態 {"pid", "running": True, "seconds", "interval_ms", "started_at"}
+
+    Raises:
+        ValueError: 範囲外の時間・間隔
+        ProfilerBusy: 別の計測が実行中
+    """
+    global _SESSION
+
+    if not 0 < seconds <= MAX_PROFILE_SECONDS:
+        raise ValueError(f'計測時間は{MAX_PROFILE_SECONDS}秒以内で指定してください: {seconds}')
+    if not MIN_INTERVAL_MS <= interval_ms <= MAX_INTERVAL_MS:
+        raise ValueError(f'標本の間隔は{MIN_INTERVAL_MS}〜{MAX_INTERVAL_MS}ミリ秒で指定してください: {interval_ms}')
+    if not _SESSION_LOCK.acquire(blocking=False):
+        raise ProfilerBusy('別の計測が実行中です')
+
+    try:
+        status = {"pid": os.getpid(), "running": True, "seconds": seconds, "interval_ms": interval_ms,
+                  "started_at": time.time()}
+        _save(status)
+        session = ProfileSession(all_threads=all_threads)
+        _SESSION = session
+        threading.Thread(target=_run, args=(session, seconds, interval_ms), name='profiler', daemon=True).start()
+    except BaseException:
+        _SESSION = None
+        _SESSION_LOCK.release()
+        raise
+    print(f"🔬 プロファイル開始: {seconds}秒 ({interval_ms}msごと)")
+    return status
+
+
+def _run(session, seconds, interval_ms):
+    """計測用のスレッド。標本を取り終えたら結果を書き出してロックを返す"""
+    global _SESSION
+
+    try:
+        own_ident = threading.get_ident()
+        start = time.perf_counter()
+        deadline = start + seconds
+        try:
+            while time.perf_counter() < deadline:
+                session.sample(own_ident)
+                time.sleep(interval_ms / 1000)
+        finally:
+            _SESSION = None
+        elapsed = time.perf_counter() - start
+        print(f"🔬 プロファイル終了: {session.samples}標本")
+        _save({
+            "pid": os.getpid(),
+            "running": False,
+            "seconds": round(elapsed, 2),
+            "interval_ms": interval_ms,
+            "samples": session.samples,
+            "stages": session.stage_summary(),
+            "collapsed": session.collapsed()
+        })
+    except Exception as e:
+        print(f"🚨 プロファイル失敗: {e}")
+        with contextlib.suppress(OSError):
+            _save({"pid": os.getpid(), "running": False, "error": str(e)})
+    finally:
+        _SESSION_LOCK.release()
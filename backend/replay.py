@@ -0,0 +1,217 @@
+import argparse
+import contextlib
+import json
+import multiprocessing as mp
+import os
+import sys
+import threading
+import time
+from collections import Counter
+from typing import Any, Dict, Iterator, Tuple
+
+from caluculate import score_hand, tiles_list_to_string
+
+# 結果を待っている和了の上限（ワーカー数 × この数）。ログを先読みしすぎないようにする
+PENDING_PER_WORKER = 64
+# 集計で表示する不一致の例の数
+MAX_EXAMPLES = 10
+
+
+def read_log(path) -> Iterator[Tuple[int, Dict[str, Any]]]:
+    """
+    対局ログ（1行1和了の JSONL）を (行番号, 和了) の順に返す
+
+    和了の形式は hand_corpus.py のコーパスと同じ:
+        {"tiles": [14枚], "win_tile", "dora": [表示牌] または "3m4p", "riichi", "ron",
+         "round_wind", "seat_wind", "recorded": {"han", "fu", "points"}（手書きの記録。省略可）}
+    JSON として読めない行は {"error"} として返す。"-" の場合は標準入力から読む。
+    """
+    f = sys.stdin if path == "-" else open(path, "r", encoding="utf-8")
+    try:
+        for line_no, line in enumerate(f, 1):
+            if not line.strip():
+                continue
+            try:
+                yield line_no, json.loads(line)
+            except json.JSONDecodeError as e:
+                yield line_no, {"error": f"JSONの読み込みに失敗しました: {e}"}
+    finally:
+        if f is not sys.stdin:
+            f.close()
+
+
+def total_points(cost, ron):
+    """和了者が受け取る点数（本場は含めない）。ツモは main が親、additional が子1人の支払い"""
+    if not isinstance(cost, dict) or cost.get("main") is None:
+        return None
+    if ron:
+        return cost["main"]
+    return cost["main"] + 2 * (cost.get("additional") or 0)
+
+
+def score_record(item):
+    """
+    1和了を caluculate.score_hand で点数計算し、記録と比べた結果を返す（赤5は赤ドラとして扱う）
+
+    Returns:
+        dict: {"line", "id", "han", "fu", "points", "yaku", "recorded", "mismatch"} または {"line", "id", "error"}
+    """
+    line_no, record = item
+    if not isinstance(record, dict):
+        return {"line": line_no, "id": None, "error": f"和了はJSONオブジェクトで指定してください: {type(record).__name__}"}
+    out = {"line": line_no, "id": record.get("id")}
+    if "error" in record:
+        return dict(out, error=record["error"])
+    recorded = record.get("recorded")
+    if recorded is not None and not isinstance(recorded, dict):
+        return dict(out, error=f"recorded はJSONオブジェクトで指定してください: {type(recorded).__name__}")
+    try:
+        dora = record.get("dora") or ""
+        if not isinstance(dora, str):
+            dora = tiles_list_to_string(dora)
+        score = score_hand(record["tiles"], record["win_tile"], dora=dora,
+                           riichi=record.get("riichi", False), ron=record.get("ron", False),
+                           closed=record.get("closed", True),
+                           round_wind=record.get("round_wind", "east"), seat_wind=record.get("seat_wind", "east"))
+    except (KeyError, TypeError, ValueError) as e:
+        return dict(out, error=f"不正な和了です: {e}")
+    if not score:
+        return dict(out, error="点数計算に失敗しました")
+
+    out.update(han=score["han"], fu=score["fu"], points=total_points(score["cost"], record.get("ron", False)),
+               yaku=score["yaku"])
+    if recorded:
+        out["recorded"] = recorded
+        # 記録にある項目だけを比べる
+        out["mismatch"] = sorted(k for k in ("han", "fu", "points") if k in recorded and recorded[k] != out[k])
+    return out
+
+
+def _init_worker():
+    # score_hand のログ出力で端末が埋まらないようにする
+    sys.stdout = open(os.devnull, "w")
+
+
+def _bounded(items, semaphore):
+    """semaphore を確保できた分だけ items を渡す（Pool が入力を先読みしすぎないようにする）"""
+    for item in items:
+        semaphore.acquire()
+        yield item
+
+
+def replay(records, workers=None, chunksize=16):
+    """
+    和了を順に点数計算し、結果を入力と同じ順で返す（ジェネレーター）
+
+    workers が 2 以上の場合はプロセスプールで並列に計算する。
+    結果を待っている和了は workers × PENDING_PER_WORKER 件までに抑えるので、ログの大きさによらずメモリは一定。
+
+    Args:
+        records: read_log の出力
+        workers: プロセス数（省略時は CPU 数、1 の場合はこのプロセスで計算）
+    """
+    workers = workers or os.cpu_count() or 1
+    if workers == 1:
+        with open(os.devnull, "w") as devnull:
+            for item in records:
+                with contextlib.redirect_stdout(devnull):
+                    result = score_record(item)
+                yield result
+        return
+
+    semaphore = threading.Semaphore(max(workers * PENDING_PER_WORKER, chunksize * workers * 2))
+    with mp.get_context().Pool(workers, initializer=_init_worker) as pool:
+        for result in pool.imap(score_record, _bounded(records, semaphore), chunksize=chunksize):
+            semaphore.release()
+            yield result
+
+
+class ReplayStats:
+    """点数計算の結果の集計（役の出現回数・平均点・記録との不一致）"""
+
+    def __init__(self):
+        self.hands = 0
+        self.scored = 0
+        self.errors = 0
+        self.points = 0
+        self.yaku = Counter()
+        self.han = Counter()
+        self.checked = 0
+        self.mismatches = 0
+        self.mismatch_fields = Counter()
+        self.examples = []
+
+    def add(self, result):
+        self.hands += 1
+        if "error" in result:
+            self.errors += 1
+            return
+        self.scored += 1
+        self.points += result["points"] or 0
+        self.han[result["han"]] += 1
+        # "立直 (1翻)" → "立直"
+        self.yaku.update(y.rsplit(" (", 1)[0] for y in result["yaku"])
+        if "mismatch" in result:
+            self.checked += 1
+            if result["mismatch"]:
+                self.mismatches += 1
+                self.mismatch_fields.update(result["mismatch"])
+                if len(self.examples) < MAX_EXAMPLES:
+                    self.examples.append(result)
+
+    def summary(self):
+        return {
+            "hands": self.hands,
+            "scored": self.scored,
+            "errors": self.errors,
+            "average_points": round(self.points / self.scored, 1) if self.scored else None,
+            "han": dict(sorted(self.han.items())),
+            "yaku": dict(self.yaku.most_common()),
+            "checked": self.checked,
+            "mismatches": self.mismatches,
+            "mismatch_fields": dict(self.mismatch_fields),
+            "examples": self.examples
+        }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='対局ログの和了を再計算し、手書きの記録と照合する')
+    parser.add_argument('log', type=str, help='対局ログ（1行1和了の .jsonl、"-" で標準入力）')
+    parser.add_argument('--output', type=str, help='和了ごとの計算結果の出力先（.jsonl、計算した順に書き出す）')
+    parser.add_argument('--workers', type=int, default=None, help='プロセス数（省略時はCPU数）')
+    parser.add_argument('--chunksize', type=int, default=16, help='1回にワーカーへ渡す和了の数')
+    parser.add_argument('--summary', type=str, help='集計結果の出力先（.json）')
+    args = parser.parse_args()
+
+    stats = ReplayStats()
+    start = time.perf_counter()
+    with contextlib.ExitStack() as stack:
+        out = stack.enter_context(open(args.output, "w", encoding="utf-8")) if args.output else None
+        for result in replay(read_log(args.log), workers=args.workers, chunksize=args.chunksize):
+            stats.add(result)
+            if out:
+                out.write(json.dumps(result, ensure_ascii=False) + "\n")
+    elapsed = time.perf_counter() - start
+
+    summary = stats.summary()
+    print(f"🀄 {summary['hands']}件の和了を再計算しました（{elapsed:.1f}秒, {summary['hands'] / max(elapsed, 1e-9):.0f} hands/sec）")
+    print(f"  - 計算できた和了: {summary['scored']}件, エラー: {summary['errors']}件")
+    print(f"  - 平均点: {summary['average_points']}")
+    print(f"  - 翻数の分布: {summary['han']}")
+    print("  - 役の出現回数:")
+    for name, n in list(summary["yaku"].items())[:20]:
+        print(f"      {name}: {n} ({n / summary['scored'] * 100:.1f}%)")
+    if summary["checked"]:
+        print(f"🔍 記録との照合: {summary['checked']}件中 {summary['mismatches']}件不一致 {summary['mismatch_fields']}")
+        for ex in summary["examples"]:
+            print(f"  ✗ {ex['line']}行目: 記録 {ex['recorded']} / 再計算 han={ex['han']} fu={ex['fu']} points={ex['points']}")
+    if args.output:
+        print(f"💾 和了ごとの結果を '{args.output}' に保存しました。")
+    if args.summary:
+        with open(args.summary, "w", encoding="utf-8") as f:
+            json.dump(summary, f, ensure_ascii=False, indent=2)
+        print(f"💾 集計結果を '{args.summary}' に保存しました。")
+
+
+if __name__ == "__main__":
+    main()
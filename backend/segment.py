@@ -0,0 +1,165 @@
+import cv2
+import numpy as np
+import os
+
+from caluculate import CLASS_ID_TO_CODE, MIN_CONFIDENCE
+from inference_config import load_inference_config
+
+# 牌の縦横比（幅 / 高さ）。分割幅の推定が出来ない場合に使用する
+TILE_ASPECT = 0.75
+# 1牌幅に対する許容誤差（これを超える区間があれば分割は曖昧とみなす）
+SLOT_WIDTH_TOLERANCE = 0.25
+# 手牌として想定する牌数
+EXPECTED_SLOT_COUNTS = (13, 14)
+# 牌分類モデルの入力サイズ
+CLS_IMGSZ = 96
+
+
+def _runs(mask):
+    """True が連続する区間を (開始, 終了) のリストで返す"""
+    padded = np.concatenate(([False], mask, [False]))
+    edges = np.flatnonzero(padded[1:] != padded[:-1])
+    return list(zip(edges[0::2], edges[1::2]))
+
+
+def segment_tile_row(image, expected_counts=EXPECTED_SLOT_COUNTS):
+    """
+    1列に並んだ手牌画像を投影解析で牌ごとの枠に分割する
+
+    Args:
+        image: BGR画像（numpy配列）
+        expected_counts: 許容する牌数
+
+    Returns:
+        list | None: [x1, y1, x2, y2] のリスト（左から順）。分割が曖昧な場合は None
+    """
+    gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+    blur = cv2.GaussianBlur(gray, (5, 5), 0)
+    _, mask = cv2.threshold(blur, 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU)
+    fg = mask > 0
+
+    # 横方向の投影で牌の帯（上下端）を求める
+    row_profile = fg.mean(axis=1)
+    if row_profile.max() <= 0:
+        return None
+    rows = np.flatnonzero(row_profile > row_profile.max() * 0.5)
+    top, bottom = int(rows[0]), int(rows[-1]) + 1
+    band_h = bottom - top
+    if band_h < image.shape[0] * 0.2:
+        return None
+
+    # 縦方向の投影で牌の区間を求める
+    col_profile = fg[top:bottom].mean(axis=0)
+    col_profile = np.convolve(col_profile, np.ones(3) / 3, mode="same")
+    runs = _runs(col_profile > col_profile.max() * 0.5)
+
+    # 細すぎる区間はノイズとして除外する
+    runs = [(s, e) for s, e in runs if e - s >= band_h * 0.2]
+    if not runs:
+        return None
+
+    # 1牌分の幅を推定（単独の牌と思われる区間の中央値、無ければ縦横比から）
+    widths = np.array([e - s for s, e in runs], dtype=float)
+    single = widths[(widths >= band_h * 0.5) & (widths <= band_h * 1.0)]
+    unit = float(np.median(single)) if single.size else band_h * TILE_ASPECT
+
+    slots = []
+    for (start, end), width in zip(runs, widths):
+        n = int(round(width / unit))
+        if n == 0 or abs(width / unit - n) > SLOT_WIDTH_TOLERANCE:
+            return None
+        step = width / n
+        for i in range(n):
+            x1 = int(round(start + step * i))
+            x2 = int(round(start + step * (i + 1)))
+            slots.append([x1, top, x2, bottom])
+
+    if len(slots) not in expected_counts:
+        return None
+    return slots
+
+
+def _class_id_for(name):
+    """分類モデルのクラス名を検出モデルと同じ class_id に揃える（牌コードでないクラス名は None）"""
+    if name in CLASS_ID_TO_CODE:
+        return CLASS_ID_TO_CODE.index(name)
+    return None
+
+
+def classify_slots(image, slots, model_path, imgsz=CLS_IMGSZ, top_k=1):
+    """
+    分割した牌の切り出しをまとめて1回の推論で分類する
+
+    クラス名が牌コードでない枠は、分類モデルの番号を別の牌と取り違えないよう結果に含めない。
+
+    Returns:
+        list: 検出結果と同じ形式の辞書のリスト（top_k > 1 の場合は "candidates" も含む）
+    """
+    from detector import load_model
+
+    model = load_model(model_path)
+    crops = [image[y1:y2, x1:x2] for x1, y1, x2, y2 in slots]
+    results = model.predict(source=crops, imgsz=imgsz, verbose=False)
+
+    detections = []
+    for slot, result in zip(slots, results):
+        idx = int(result.probs.top1)
+        name = result.names[idx]
+        class_id = _class_id_for(name)
+        if class_id is None:
+            print(f"⚠️ 牌コードでないクラス '{name}' の枠を除外します: {list(slot)}")
+            continue
+        detection = {
+            "class_id": class_id,
+            "name": name,
+            "confidence": round(float(result.probs.top1conf), 3),
+            "bbox": list(slot)
+        }
+        if top_k > 1:
+            candidates = [(_class_id_for(result.names[int(i)]), float(c))
+                          for i, c in zip(result.probs.top5, result.probs.top5conf)]
+            detection["candidates"] = [
+                {"class_id": cid, "confidence": round(c, 3)} for cid, c in candidates if cid is not None
+            ][:top_k]
+        detections.append(detection)
+    return detections
+
+
+def recognize_row(image_path, cls_model_path, det_model_path, min_confidence=MIN_CONFIDENCE, top_k=1,
+                  det_model=None, config=None, detect_many=None):
+    """
+    分割＋分類の高速経路で手牌を認識する。分割が曖昧な場合はYOLO検出に切り替える
+
+    分類の信頼度が min_confidence 未満の牌、または牌コードに対応しない牌が1枚でもあれば YOLO 検出に切り替える
+    （既定値は手牌の復元で採用する下限と同じ。下回った牌は復元時に捨てられるため）
+    det_model を渡した場合は det_model_path を読み込まずにそのモデルで検出する（読み込み済みの採用モデル用）
+    config は読み込み済みの推論設定（省略時のみ inference_config.json を読む）
+    detect_many を渡した場合は YOLO 検出をそれ（推論プロセス）で行い、このプロセスで検出モデルを読み込まない
+
+    Returns:
+        tuple: (検出結果のリスト, 使用したエンジン名 "segment" / "yolo")
+    """
+    image = cv2.imread(image_path)
+    slots = None
+    if image is not None and os.path.exists(cls_model_path):
+        slots = segment_tile_row(image)
+
+    if slots is not None:
+        detections = classify_slots(image, slots, cls_model_path, top_k=top_k)
+        if len(detections) < len(slots):
+            print("⚠️ 分類できない牌があるため YOLO 検出に切り替えます")
+        elif min(d["confidence"] for d in detections) >= min_confidence:
+            return detections, "segment"
+        else:
+            print("⚠️ 分類の信頼度が低いため YOLO 検出に切り替えます")
+    else:
+        print("⚠️ 手牌の分割が曖昧なため YOLO 検出に切り替えます")
+
+    config = config or load_inference_config()
+    if detect_many is not None:
+        return detect_many([image], imgsz=config["imgsz"], conf=config["conf"], top_k=top_k)[0], "yolo"
+    from detector import load_model, result_to_detections
+
+    model = det_model or load_model(det_model_path)
+    results = model.predict(source=image_path, imgsz=config["imgsz"], conf=config["conf"], verbose=False)
+    return result_to_detections(results[0], top_k=top_k), "yolo"
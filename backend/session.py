@@ -0,0 +1,200 @@
+import threading
+import time
+import uuid
+from collections import OrderedDict
+
+from caluculate import CLASS_ID_TO_CODE, score_hand, tiles_list_to_string
+
+# セッションの有効期限（秒）と最大保持数
+SESSION_TTL_SECONDS = 30 * 60
+MAX_SESSIONS = 1000
+
+WIND_TO_ENGLISH = {'東': 'east', '南': 'south', '西': 'west', '北': 'north'}
+ENGLISH_TO_WIND = {english: wind for wind, english in WIND_TO_ENGLISH.items()}
+
+
+def normalize_wind(value):
+    """
+    風の指定（'東' または 'east'）をセッションに保持する形式（'東'）にそろえる
+
+    Raises:
+        ValueError: 不正な風
+    """
+    if isinstance(value, str):
+        if value in WIND_TO_ENGLISH:
+            return value
+        if value.lower() in ENGLISH_TO_WIND:
+            return ENGLISH_TO_WIND[value.lower()]
+    raise ValueError(f'不正な風: {value}')
+
+
+class SessionStore:
+    """
+    認識済みの手牌・ドラ・オプションを保持する有効期限付きのストア
+
+    最後に参照されてから ttl 秒経過したセッションは破棄し、
+    max_sessions を超えた場合は最も古いものから破棄する。
+    同じセッションへの読み取り→更新は lock(sid) で直列化する。
+    """
+
+    def __init__(self, ttl=SESSION_TTL_SECONDS, max_sessions=MAX_SESSIONS):
+        self.ttl = ttl
+        self.max_sessions = max_sessions
+        self._sessions = OrderedDict()
+        self._lock = threading.Lock()
+        self._session_locks = {}
+
+    def _purge(self, now):
+        while self._sessions:
+            sid, (expires, _) = next(iter(self._sessions.items()))
+            if expires > now and len(self._sessions) <= self.max_sessions:
+                break
+            del self._sessions[sid]
+            self._session_locks.pop(sid, None)
+
+    def create(self, state):
+        sid = uuid.uuid4().hex
+        now = time.monotonic()
+        with self._lock:
+            self._sessions[sid] = (now + self.ttl, state)
+            self._session_locks[sid] = threading.Lock()
+            self._purge(now)
+        return sid
+
+    def get(self, sid):
+        now = time.monotonic()
+        with self._lock:
+            self._purge(now)
+            entry = self._sessions.get(sid)
+            if entry is None:
+                return None
+            self._sessions[sid] = (now + self.ttl, entry[1])
+            self._sessions.move_to_end(sid)
+            return entry[1]
+
+    def update(self, sid, state):
+        now = time.monotonic()
+        with self._lock:
+            if sid not in self._sessions:
+                return False
+            self._sessions[sid] = (now + self.ttl, state)
+            self._sessions.move_to_end(sid)
+            return True
+
+    def lock(self, sid):
+        """セッションごとのロックを返す（存在しない場合は None）"""
+        with self._lock:
+            return self._session_locks.get(sid)
+
+    def delete(self, sid):
+        with self._lock:
+            self._session_locks.pop(sid, None)
+            return self._sessions.pop(sid, None) is not None
+
+    def __len__(self):
+        with self._lock:
+            return len(self._sessions)
+
+
+def new_state(tiles, win_index, dora_codes, options):
+    """
+    セッションに保持する状態を作成する（風は normalize_wind の形式で保持する）
+
+    Raises:
+        ValueError: 不正な風
+    """
+    return {
+        'tiles': list(tiles),
+        'win_index': win_index,
+        'dora': list(dora_codes),
+        'riichi': bool(options.get('riichi', False)),
+        'winType': options.get('winType', 'tsumo'),
+        'roundWind': normalize_wind(options.get('roundWind', '東')),
+        'playerWind': normalize_wind(options.get('playerWind', '東')),
+    }
+
+
+def _list_field(delta, key):
+    """差分の配列の項目（省略時は空）"""
+    value = delta.get(key, [])
+    if not isinstance(value, list):
+        raise ValueError(f'{key} は配列で指定してください')
+    return value
+
+
+def _is_index(value, length):
+    """value が 0 以上 length 未満の整数か（True/False は位置として扱わない）"""
+    return isinstance(value, int) and not isinstance(value, bool) and 0 <= value < length
+
+
+def apply_delta(state, delta):
+    """
+    差分リクエストを状態に適用した新しい状態を返す
+
+    対応する差分:
+        replaceTiles: [{"index": i, "tile": "5m"}, ...]  i番目の牌を差し替え
+        winIndex: 和了牌の位置
+        riichi / winType / roundWind / playerWind: /api/calculate と同じ値（風は '東' または 'east'）
+        addDora: ["1z", ...]  ドラ表示牌を追加
+        removeDora: [i, ...]  i番目のドラ表示牌を削除（重複した位置は1回だけ削除）
+
+    Raises:
+        ValueError: 不正な差分
+    """
+    if not isinstance(delta, dict):
+        raise ValueError('差分はJSONオブジェクトで指定してください')
+    state = dict(state, tiles=list(state['tiles']), dora=list(state['dora']))
+
+    for r in _list_field(delta, 'replaceTiles'):
+        if not isinstance(r, dict):
+            raise ValueError(f'不正な牌の差し替え: {r}')
+        index, tile = r.get('index'), r.get('tile')
+        if not _is_index(index, len(state['tiles'])):
+            raise ValueError(f'不正な牌の位置: {index}')
+        if tile not in CLASS_ID_TO_CODE:
+            raise ValueError(f'不正な牌コード: {tile}')
+        state['tiles'][index] = tile
+
+    if 'winIndex' in delta:
+        index = delta['winIndex']
+        if not _is_index(index, len(state['tiles'])):
+            raise ValueError(f'不正な和了牌の位置: {index}')
+        state['win_index'] = index
+
+    if 'riichi' in delta:
+        state['riichi'] = bool(delta['riichi'])
+    if 'winType' in delta:
+        if delta['winType'] not in ('tsumo', 'ron'):
+            raise ValueError(f'不正な和了方法: {delta["winType"]}')
+        state['winType'] = delta['winType']
+    for key in ('roundWind', 'playerWind'):
+        if key in delta:
+            state[key] = normalize_wind(delta[key])
+
+    remove = _list_field(delta, 'removeDora')
+    for i in remove:
+        if not _is_index(i, len(state['dora'])):
+            raise ValueError(f'不正なドラ表示牌の位置: {i}')
+    for i in sorted(set(remove), reverse=True):
+        del state['dora'][i]
+    for tile in _list_field(delta, 'addDora'):
+        if tile not in CLASS_ID_TO_CODE:
+            raise ValueError(f'不正な牌コード: {tile}')
+        state['dora'].append(tile)
+
+    return state
+
+
+def rescore(state):
+    """保持している状態をプロセス内で再計算する"""
+    tiles = state['tiles']
+    return score_hand(
+        tiles,
+        tiles[state['win_index']],
+        dora=tiles_list_to_string(state['dora']),
+        riichi=state['riichi'],
+        ron=state['winType'] == 'ron',
+        closed=True,
+        round_wind=WIND_TO_ENGLISH[state['roundWind']],
+        seat_wind=WIND_TO_ENGLISH[state['playerWind']],
+    )
@@ -0,0 +1,246 @@
+import heapq
+from collections import Counter
+from typing import Any, Dict, List, Tuple
+
+import numpy as np
+
+from caluculate import AKA_LIMIT, CLASS_ID_TO_CODE, MIN_CONFIDENCE, get_class_id, get_confidence
+
+# 検出結果配列の列（1行 = 1枠）
+X1, Y1, X2, Y2, CONF, CLS = range(6)
+
+# 最後（または最初）の牌の前の隙間が、牌幅の何倍以上ならツモ牌の隙間とみなすか
+DRAW_GAP_RATIO = 0.3
+
+
+def detections_to_array(dets: List[Dict[str, Any]], threshold=0.0) -> np.ndarray:
+    """
+    検出結果（辞書のリスト）を (n, 6) の配列 [x1, y1, x2, y2, conf, class_id] に変換する
+
+    無効な class_id と threshold 未満の検出は除外する
+    """
+    rows = []
+    for d in dets:
+        cid = get_class_id(d)
+        if cid is None or cid < 0 or cid >= len(CLASS_ID_TO_CODE):
+            continue
+        conf = get_confidence(d)
+        if conf < threshold:
+            continue
+        x1, y1, x2, y2 = d.get("bbox", [0, 0, 0, 0])
+        rows.append((x1, y1, x2, y2, conf, cid))
+    return np.array(rows, dtype=np.float64).reshape(-1, 6)
+
+
+def kept_to_array(kept: List[Tuple[str, float, List[float]]]) -> np.ndarray:
+    """counts_from_detections / search_hand の kept 形式を配列に変換する"""
+    rows = [(*bbox, conf, CLASS_ID_TO_CODE.index(code)) for code, conf, bbox in kept]
+    return np.array(rows, dtype=np.float64).reshape(-1, 6)
+
+
+def row_axis(arr: np.ndarray) -> int:
+    """牌の並び方向（0: 横 / 1: 縦）を中心座標の広がりから判定する"""
+    if len(arr) < 2:
+        return 0
+    cx = (arr[:, X1] + arr[:, X2]) / 2
+    cy = (arr[:, Y1] + arr[:, Y2]) / 2
+    return 0 if np.ptp(cx) >= np.ptp(cy) else 1
+
+
+def suppress_overlaps(arr: np.ndarray, iou_threshold=0.5):
+    """
+    クラスを問わず同じ牌に重なった枠をまとめ、各まとまりで信頼度最大の枠だけを残す
+
+    並び方向の始端で整列してから走査し、各枠自身の終端をヒープで管理して
+    まだ終端に達していない枠とだけ比較する。計算量は O(n log n + n·k)
+    （k は並び方向に同時に重なっている枠の最大数。1列に並んだ牌では小さな定数）。
+
+    Returns:
+        tuple: (残した枠の配列（並び順）, 各まとまりに属する元の行番号の配列のリスト)
+    """
+    if len(arr) == 0:
+        return arr, []
+    lo, hi = (X1, X2) if row_axis(arr) == 0 else (Y1, Y2)
+    order = np.argsort(arr[:, lo], kind="stable")
+    areas = (arr[:, X2] - arr[:, X1]) * (arr[:, Y2] - arr[:, Y1])
+
+    groups: List[List[int]] = []
+    reps: List[int] = []
+    group_of: Dict[int, int] = {}  # 終端に達していない枠 -> まとまり番号
+    ends: List[Tuple[float, int]] = []  # (終端, 枠) のヒープ
+    for i in order:
+        i = int(i)
+        while ends and ends[0][0] <= arr[i, lo]:
+            group_of.pop(heapq.heappop(ends)[1])
+        joined = False
+        if group_of:
+            r = np.fromiter(group_of, dtype=int, count=len(group_of))
+            ix = np.clip(np.minimum(arr[r, X2], arr[i, X2]) - np.maximum(arr[r, X1], arr[i, X1]), 0, None)
+            iy = np.clip(np.minimum(arr[r, Y2], arr[i, Y2]) - np.maximum(arr[r, Y1], arr[i, Y1]), 0, None)
+            inter = ix * iy
+            iou = inter / np.maximum(areas[r] + areas[i] - inter, 1e-9)
+            best = int(np.argmax(iou))
+            if iou[best] >= iou_threshold:
+                g = group_of[int(r[best])]
+                groups[g].append(i)
+                if arr[i, CONF] > arr[reps[g], CONF]:
+                    reps[g] = i
+                joined = True
+        if not joined:
+            groups.append([i])
+            reps.append(i)
+            g = len(groups) - 1
+        group_of[i] = g
+        heapq.heappush(ends, (float(arr[i, hi]), i))
+
+    kept = order_row(arr[reps])
+    return kept, [np.array(g) for g in groups]
+
+
+def _tile_multiset(detections, threshold=MIN_CONFIDENCE):
+    """点数計算で使われる牌（重複除去・しきい値適用後）のクラス構成"""
+    boxes, _ = suppress_overlaps(detections_to_array(detections, threshold=threshold))
+    return Counter(int(c) for c in boxes[:, CLS])
+
+
+def agreement(reference, candidate):
+    """
+    参照結果との牌単位の一致率（画像ごとの一致枚数 / 多い方の枚数 の平均）
+
+    自動調整（autotune.py）の入力サイズの比較と、シャドー評価（model_registry.py）で共通に使う。
+    """
+    scores = []
+    for ref, cand in zip(reference, candidate):
+        a, b = _tile_multiset(ref), _tile_multiset(cand)
+        total = max(sum(a.values()), sum(b.values()))
+        scores.append(sum((a & b).values()) / total if total else 1.0)
+    return float(np.mean(scores)) if scores else 1.0
+
+
+def attach_candidates(dets: List[Dict[str, Any]], top_k=3, iou_threshold=0.6) -> List[Dict[str, Any]]:
+    """
+    同じ牌に重なった枠をまとめ、信頼度の高い枠に上位 top_k クラスを "candidates" として付与する
+
+    既に "candidates" を持つ検出はその候補も引き継ぐ。
+
+    Returns:
+        list: 1牌につき1件の検出結果のリスト（並び順）
+    """
+    valid = [d for d in dets if get_class_id(d) is not None and 0 <= get_class_id(d) < len(CLASS_ID_TO_CODE)]
+    arr = np.array([(*d.get("bbox", [0, 0, 0, 0]), get_confidence(d), get_class_id(d)) for d in valid],
+                   dtype=np.float64).reshape(-1, 6)
+    _, groups = suppress_overlaps(arr, iou_threshold)
+
+    merged = []
+    for g in groups:
+        members = sorted((valid[i] for i in g), key=get_confidence, reverse=True)
+        scored = {}
+        for d in members:
+            for c in d.get("candidates") or [d]:
+                cid, conf = get_class_id(c), get_confidence(c)
+                if cid is not None and conf > scored.get(cid, -1.0):
+                    scored[cid] = conf
+        best = dict(members[0])
+        best["candidates"] = [
+            {"class_id": cid, "confidence": conf}
+            for cid, conf in sorted(scored.items(), key=lambda x: x[1], reverse=True)[:top_k]
+        ]
+        merged.append(best)
+    return merged
+
+
+def order_row(arr: np.ndarray) -> np.ndarray:
+    """枠を並び方向の中心座標で左（上）から順に並べ替える"""
+    if len(arr) == 0:
+        return arr
+    lo, hi = (X1, X2) if row_axis(arr) == 0 else (Y1, Y2)
+    return arr[np.argsort((arr[:, lo] + arr[:, hi]) / 2, kind="stable")]
+
+
+def find_draw_gap(ordered: np.ndarray):
+    """
+    並べ替え済みの枠からツモ牌（和了牌）を切り離している隙間を探す
+
+    Returns:
+        int | None: 隙間の外側にある牌の位置（末尾または先頭）。隙間が無ければ None
+    """
+    if len(ordered) < 3:
+        return None
+    lo, hi = (X1, X2) if row_axis(ordered) == 0 else (Y1, Y2)
+    width = float(np.median(ordered[:, hi] - ordered[:, lo]))
+    gaps = ordered[1:, lo] - ordered[:-1, hi]
+    widest = int(np.argmax(gaps))
+    if gaps[widest] < width * DRAW_GAP_RATIO:
+        return None
+    if widest == len(gaps) - 1:
+        return len(ordered) - 1
+    if widest == 0:
+        return 0
+    return None
+
+
+def select_tiles(arr: np.ndarray, max_tiles=14) -> np.ndarray:
+    """
+    信頼度の高い順に牌種ごとの上限（4枚、赤ドラ込み）と赤ドラの上限（1色 AKA_LIMIT 枚）を守って
+    max_tiles 枚を選び、並び順で返す（hand_search.search_hand と同じ制約）
+    """
+    if len(arr) == 0:
+        return arr
+    kind = arr[:, CLS].astype(int)
+    base = np.array([CLASS_ID_TO_CODE.index(c.replace("0", "5")) for c in CLASS_ID_TO_CODE])[kind]
+    is_aka = np.array([c[0] == "0" for c in CLASS_ID_TO_CODE])[kind]
+    chosen = []
+    per_base = np.zeros(len(CLASS_ID_TO_CODE), dtype=int)
+    per_aka = np.zeros(len(CLASS_ID_TO_CODE), dtype=int)
+    for i in np.argsort(-arr[:, CONF], kind="stable"):
+        if per_base[base[i]] >= 4 or (is_aka[i] and per_aka[base[i]] >= AKA_LIMIT):
+            continue
+        per_base[base[i]] += 1
+        per_aka[base[i]] += is_aka[i]
+        chosen.append(i)
+        if len(chosen) == max_tiles:
+            break
+    return order_row(arr[np.sort(chosen)])
+
+
+def _same_box(a: np.ndarray, b: np.ndarray, iou_threshold=0.5) -> bool:
+    ix = max(0.0, min(a[X2], b[X2]) - max(a[X1], b[X1]))
+    iy = max(0.0, min(a[Y2], b[Y2]) - max(a[Y1], b[Y1]))
+    inter = ix * iy
+    union = (a[X2] - a[X1]) * (a[Y2] - a[Y1]) + (b[X2] - b[X1]) * (b[Y2] - b[Y1]) - inter
+    return inter / max(union, 1e-9) >= iou_threshold
+
+
+def ordered_hand(arr: np.ndarray, context: np.ndarray = None) -> Dict[str, Any]:
+    """
+    選択済みの枠から、並び順の手牌と和了牌を求める
+
+    Args:
+        context: 選択する前の枠。指定した場合、ツモ牌の隙間は選択前の並びで判定する
+                 （選択で牌が抜けた跡を隙間と取り違えないため）。隙間の外側の牌が選択で
+                 除かれていれば隙間なしとして扱う
+
+    Returns:
+        dict: {"tiles": 並び順の牌コード, "win_tile", "win_index", "has_gap",
+               "concealed": 和了牌を除いた牌コード, "kept": [(牌コード, 信頼度, bbox)]}
+    """
+    ordered = order_row(arr)
+    codes = [CLASS_ID_TO_CODE[int(c)] for c in ordered[:, CLS]]
+    gap_index = find_draw_gap(ordered)
+    if context is not None:
+        full = order_row(context)
+        full_gap = find_draw_gap(full)
+        gap_index = None
+        if full_gap is not None and len(ordered):
+            edge = len(ordered) - 1 if full_gap == len(full) - 1 else 0
+            if _same_box(ordered[edge], full[full_gap]):
+                gap_index = edge
+    win_index = gap_index if gap_index is not None else len(codes) - 1
+    return {
+        "tiles": codes,
+        "win_tile": codes[win_index] if codes else None,
+        "win_index": win_index,
+        "has_gap": gap_index is not None,
+        "concealed": codes[:win_index] + codes[win_index + 1:],
+        "kept": [(code, float(row[CONF]), [int(v) for v in row[:4]]) for code, row in zip(codes, ordered)],
+    }
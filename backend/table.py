@@ -0,0 +1,290 @@
+import argparse
+import json
+import os
+import tempfile
+
+import cv2
+import numpy as np
+from PIL import Image
+
+from caluculate import CLASS_ID_TO_CODE, build_hand, score_hand, tiles_list_to_string
+from spatial import CLS, CONF, X1, X2, Y1, Y2, suppress_overlaps
+
+# 分割推論の1タイルの大きさ（検出モデルの入力サイズに合わせる）
+TILE_SIZE = 960
+# 隣接タイルとの重なりの割合（牌1枚が必ずどれかのタイルに丸ごと入る大きさにする）
+TILE_OVERLAP = 0.25
+# 一度に推論へ渡すタイル数（メモリ使用量の上限を決める）
+BATCH_SIZE = 8
+# これより大きい画像は JPEG の縮小デコードで読み込む
+MAX_TABLE_SIDE = 6000
+# 手牌とみなす最小枚数
+MIN_HAND_TILES = 13
+
+SEATS = ["bottom", "right", "top", "left"]
+WINDS = ["east", "south", "west", "north"]
+
+
+def load_table_image(image_path, max_side=MAX_TABLE_SIDE):
+    """
+    卓全体の画像を読み込む。max_side を超える場合は縮小デコード（1/2, 1/4, 1/8）で読み込む
+
+    Returns:
+        numpy.ndarray | None: BGR画像
+    """
+    with Image.open(image_path) as im:
+        width, height = im.size
+    scale = max(width, height) / max_side
+    if scale > 4:
+        flags = cv2.IMREAD_REDUCED_COLOR_8
+    elif scale > 2:
+        flags = cv2.IMREAD_REDUCED_COLOR_4
+    elif scale > 1:
+        flags = cv2.IMREAD_REDUCED_COLOR_2
+    else:
+        flags = cv2.IMREAD_COLOR
+    return cv2.imread(image_path, flags)
+
+
+def iter_windows(height, width, tile_size=TILE_SIZE, overlap=TILE_OVERLAP):
+    """画像を重なりのあるタイルに分割した (x1, y1, x2, y2) を順に返す"""
+    step = max(1, int(tile_size * (1 - overlap)))
+
+    def starts(length):
+        if length <= tile_size:
+            return [0]
+        s = list(range(0, length - tile_size, step))
+        return s + [length - tile_size]
+
+    for y in starts(height):
+        for x in starts(width):
+            yield x, y, min(x + tile_size, width), min(y + tile_size, height)
+
+
+def _boxes_from_result(result):
+    """YOLOの推論結果1件を (xyxy, conf, class_id) の配列にする"""
+    if result.boxes is None or len(result.boxes) == 0:
+        return np.zeros((0, 4)), np.zeros(0), np.zeros(0)
+    return result.boxes.xyxy.cpu().numpy(), result.boxes.conf.cpu().numpy(), result.boxes.cls.cpu().numpy()
+
+
+def _boxes_from_detections(detections):
+    """検出結果のリスト（推論プロセスの応答）を (xyxy, conf, class_id) の配列にする"""
+    arr = np.array([[*d["bbox"], d["confidence"], d["class_id"]] for d in detections],
+                   dtype=np.float64).reshape(-1, 6)
+    return arr[:, :4], arr[:, 4], arr[:, 5]
+
+
+def detect_tiled(image, model=None, tile_size=TILE_SIZE, overlap=TILE_OVERLAP, batch_size=BATCH_SIZE, conf=0.25,
+                 detect_many=None):
+    """
+    大きな画像をタイルに分割してまとめて推論し、継ぎ目をまたいだ検出を統合する
+
+    タイル内側の辺に接する枠は隣のタイルで丸ごと検出されるため捨て、
+    重なり部分で重複した枠はクラスを問わずまとめる。
+    detect_many を渡した場合は model の代わりにそれで推論する
+    （InferenceServer.detect_many と同じ引数で、画像ごとの検出結果のリストを返す関数）。
+
+    Returns:
+        numpy.ndarray: (n, 6) の配列 [x1, y1, x2, y2, conf, class_id]
+    """
+    height, width = image.shape[:2]
+    windows = list(iter_windows(height, width, tile_size, overlap))
+    rows = []
+    for b in range(0, len(windows), batch_size):
+        batch = windows[b:b + batch_size]
+        crops = [image[y1:y2, x1:x2] for x1, y1, x2, y2 in batch]
+        if detect_many is not None:
+            boxes = [_boxes_from_detections(d) for d in detect_many(crops, imgsz=tile_size, conf=conf)]
+        else:
+            boxes = [_boxes_from_result(r) for r in model.predict(source=crops, imgsz=tile_size, conf=conf,
+                                                                  verbose=False)]
+        for (wx1, wy1, wx2, wy2), (xyxy, box_conf, box_cls) in zip(batch, boxes):
+            if len(xyxy) == 0:
+                continue
+            margin = 2
+            inner = np.ones(len(xyxy), dtype=bool)
+            if wx1 > 0:
+                inner &= xyxy[:, 0] > margin
+            if wy1 > 0:
+                inner &= xyxy[:, 1] > margin
+            if wx2 < width:
+                inner &= xyxy[:, 2] < (wx2 - wx1) - margin
+            if wy2 < height:
+                inner &= xyxy[:, 3] < (wy2 - wy1) - margin
+            offset = np.array([wx1, wy1, wx1, wy1])
+            rows.append(np.column_stack([xyxy[inner] + offset, box_conf[inner], box_cls[inner]]))
+
+    arr = np.concatenate(rows) if rows else np.zeros((0, 6))
+    merged, _ = suppress_overlaps(arr)
+    return merged
+
+
+def cluster_rows(arr):
+    """
+    隣り合って1列に並んだ牌をまとめる
+
+    大きさが近く、並び方向の距離が牌1.5枚分以内で横ずれが半牌以内の枠同士を連結し、
+    連結成分ごとの行番号の配列を返す。
+    """
+    n = len(arr)
+    if n == 0:
+        return []
+    w = arr[:, X2] - arr[:, X1]
+    h = arr[:, Y2] - arr[:, Y1]
+    short = np.minimum(w, h)
+    long_ = np.maximum(w, h)
+    cx = (arr[:, X1] + arr[:, X2]) / 2
+    cy = (arr[:, Y1] + arr[:, Y2]) / 2
+
+    s = (short[:, None] + short[None, :]) / 2
+    dx = np.abs(cx[:, None] - cx[None, :])
+    dy = np.abs(cy[:, None] - cy[None, :])
+    ratio = long_[:, None] / long_[None, :]
+    similar = (ratio > 0.7) & (ratio < 1.4)
+    horizontal = (dx <= 1.5 * s) & (dy <= 0.5 * s)
+    vertical = (dy <= 1.5 * s) & (dx <= 0.5 * s)
+    adjacent = similar & (horizontal | vertical)
+
+    parent = list(range(n))
+
+    def find(i):
+        while parent[i] != i:
+            parent[i] = parent[parent[i]]
+            i = parent[i]
+        return i
+
+    for i, j in zip(*np.nonzero(np.triu(adjacent, 1))):
+        parent[find(i)] = find(j)
+
+    groups = {}
+    for i in range(n):
+        groups.setdefault(find(i), []).append(i)
+    return [np.array(g) for g in groups.values()]
+
+
+def split_table(arr, image_shape):
+    """
+    卓の検出結果を各家の手牌とドラ表示牌の列に分ける
+
+    Returns:
+        tuple: ({"bottom" / "right" / "top" / "left": 配列}, ドラ表示牌の配列)
+    """
+    height, width = image_shape[:2]
+    center = np.array([width / 2, height / 2])
+    hands, others = {}, []
+    for g in cluster_rows(arr):
+        rows = arr[g]
+        c = np.array([(rows[:, X1] + rows[:, X2]).mean() / 2, (rows[:, Y1] + rows[:, Y2]).mean() / 2])
+        if len(rows) >= MIN_HAND_TILES:
+            dx, dy = (c - center) / np.array([width, height])
+            if abs(dy) >= abs(dx):
+                seat = "bottom" if dy > 0 else "top"
+            else:
+                seat = "right" if dx > 0 else "left"
+            if seat not in hands or len(rows) > len(hands[seat]):
+                hands[seat] = rows
+        else:
+            others.append((np.linalg.norm(c - center), rows))
+
+    # ドラ表示牌は卓の中央に最も近い短い列
+    dora = min(others, key=lambda x: x[0])[1] if others else np.zeros((0, 6))
+    return hands, dora
+
+
+def _to_detections(rows):
+    return [{
+        "class_id": int(r[CLS]),
+        "name": CLASS_ID_TO_CODE[int(r[CLS])],
+        "confidence": round(float(r[CONF]), 3),
+        "bbox": [int(r[X1]), int(r[Y1]), int(r[X2]), int(r[Y2])]
+    } for r in rows]
+
+
+def recognize_table(image_path, model_path="./models/best_v2.pt", riichi=False, ron=False,
+                    round_wind="east", seat_wind="east", tile_size=TILE_SIZE, batch_size=BATCH_SIZE, model=None,
+                    detect_many=None):
+    """
+    卓全体の写真から4人の手牌とドラ表示牌を認識し、各手牌の点数を計算する
+
+    Args:
+        seat_wind: 手前（bottom）の家の自風。他家は反時計回りに割り当てる
+        model: 読み込み済みのモデル（省略時は model_path から読み込む）
+        detect_many: 推論プロセスで推論する関数（渡した場合はこのプロセスでモデルを読み込まない）
+
+    Returns:
+        dict: {"hands": [{"seat", "seat_wind", "detections", "tiles", "win_tile", "score"}], "dora": [牌コード]}
+    """
+    image = load_table_image(image_path)
+    if image is None:
+        print(f"画像ファイル {image_path} を読み込めません。")
+        return None
+    if model is None and detect_many is None:
+        from detector import load_model
+        model = load_model(model_path)
+
+    arr = detect_tiled(image, model, tile_size=tile_size, batch_size=batch_size, detect_many=detect_many)
+    print(f"🀄 卓全体の検出: {len(arr)}枚")
+    hands, dora_rows = split_table(arr, image.shape)
+    dora_codes = [CLASS_ID_TO_CODE[int(r[CLS])] for r in dora_rows[np.argsort(dora_rows[:, X1])] if r[CONF] >= 0.5]
+    print(f"🀅 ドラ表示牌: {dora_codes}")
+
+    base = WINDS.index(seat_wind.lower())
+    out = []
+    for seat in SEATS:
+        if seat not in hands:
+            continue
+        wind = WINDS[(base + SEATS.index(seat)) % 4]
+        detections = _to_detections(hands[seat])
+        print(f"👤 {seat} ({wind}): {len(detections)}枚")
+        hand = build_hand(detections)
+        score = None
+        if hand:
+            score = score_hand(hand["tiles"], hand["win_tile"], dora=tiles_list_to_string(dora_codes),
+                               riichi=riichi, ron=ron, closed=True, round_wind=round_wind, seat_wind=wind)
+        out.append({
+            "seat": seat,
+            "seat_wind": wind,
+            "detections": detections,
+            "tiles": hand["tiles"] if hand else [],
+            "win_tile": hand["win_tile"] if hand else None,
+            "score": score
+        })
+    return {"hands": out, "dora": dora_codes}
+
+
+def main():
+    parser = argparse.ArgumentParser(description='卓全体の認識・点数計算スクリプト')
+    parser.add_argument('--input', type=str, required=True, help='入力画像のパス')
+    parser.add_argument('--output', type=str, help='出力ディレクトリ（省略時は一時ディレクトリ）')
+    parser.add_argument('--model', type=str, default='./models/best_v2.pt', help='モデルファイルのパス')
+    parser.add_argument('--tile_size', type=int, default=TILE_SIZE, help='分割推論のタイルサイズ')
+    parser.add_argument('--batch_size', type=int, default=BATCH_SIZE, help='一度に推論するタイル数')
+    parser.add_argument('--round_wind', type=str, default='east')
+    parser.add_argument('--seat_wind', type=str, default='east', help='手前の家の自風')
+    parser.add_argument('--riichi', action='store_true')
+    parser.add_argument('--ron', action='store_true')
+    args = parser.parse_args()
+
+    result = recognize_table(args.input, model_path=args.model, riichi=args.riichi, ron=args.ron,
+                             round_wind=args.round_wind, seat_wind=args.seat_wind,
+                             tile_size=args.tile_size, batch_size=args.batch_size)
+    if result is None:
+        return
+
+    output_dir = args.output or tempfile.mkdtemp()
+    os.makedirs(output_dir, exist_ok=True)
+    base_filename = os.path.splitext(os.path.basename(args.input))[0]
+    json_path = os.path.join(output_dir, f"{base_filename}_table_result.json")
+    with open(json_path, "w", encoding="utf-8") as f:
+        json.dump(result, f, ensure_ascii=False, indent=2)
+    print(f"卓全体の認識結果を '{json_path}' に保存しました。")
+
+    for h in result["hands"]:
+        score = h["score"]
+        summary = f"{score['han']}翻 {score['fu']}符 {score['cost']}" if score else "和了形ではありません"
+        print(f"  - {h['seat']} ({h['seat_wind']}): {''.join(h['tiles'])} → {summary}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,39 @@
+import os
+import subprocess
+import sys
+
+import pytest
+
+from consensus import MAX_BURST_FRAMES, MIN_BURST_FRAMES, check_burst_frames, fuse_frames
+
+
+def test_consensus_does_not_import_the_detector():
+    # /api/calculate はフレーム数の確認のためだけに consensus を読み込む
+    backend = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    out = subprocess.run([sys.executable, "-c", "import sys, consensus; print('detector' in sys.modules)"],
+                         cwd=backend, capture_output=True, text=True, check=True)
+    assert out.stdout.strip() == "False"
+
+
+def test_check_burst_frames():
+    for n in (0, 1, MIN_BURST_FRAMES, MAX_BURST_FRAMES):
+        check_burst_frames(["frame"] * n)
+    for frames in (["frame"] * 2, ["frame"] * (MAX_BURST_FRAMES + 1), "frame", {"a": 1}):
+        with pytest.raises(ValueError):
+            check_burst_frames(frames)
+
+
+def _det(code_id, x, conf=0.9, shift=0):
+    return {"class_id": code_id, "confidence": conf, "bbox": [x + shift, 0, x + shift + 40, 60]}
+
+
+def test_fuse_frames_votes_per_tile_across_shifted_frames():
+    frames = [
+        [_det(0, 0), _det(1, 45), _det(2, 90)],
+        [_det(0, 0, shift=7), _det(10, 45, conf=0.6, shift=7), _det(2, 90, shift=7)],
+        [_det(0, 0, shift=-5), _det(1, 45, shift=-5), _det(2, 90, shift=-5)],
+    ]
+    fused = fuse_frames(frames)
+    assert [d["class_id"] for d in fused] == [0, 1, 2]
+    assert all(d["votes"] == 3 for d in fused)
+    assert [c["class_id"] for c in fused[1]["candidates"]] == [1, 10]
@@ -0,0 +1,53 @@
+from caluculate import CLASS_ID_TO_CODE
+from hand_search import _box_candidates, find_waits, is_complete_hand, search_hand
+
+HAND = ["1m", "2m", "3m", "4m", "5m", "6m", "7m", "8m", "9m", "1p", "2p", "3p", "5p", "5p"]
+
+
+def _det(i, *cands):
+    """x 方向に並んだ i 番目の枠。cands は (牌コード, 信頼度)"""
+    return {
+        "class_id": CLASS_ID_TO_CODE.index(cands[0][0]),
+        "confidence": cands[0][1],
+        "bbox": [i * 50, 0, i * 50 + 45, 60],
+        "candidates": [{"class_id": CLASS_ID_TO_CODE.index(code), "confidence": conf} for code, conf in cands],
+    }
+
+
+def test_helpers():
+    assert is_complete_hand(HAND)
+    assert not is_complete_hand(HAND[:13] + ["9s"])
+    assert find_waits(HAND[:13]) == ["5p"]
+
+
+def test_corrects_ambiguous_box_with_second_candidate():
+    dets = [_det(i, (code, 0.95)) for i, code in enumerate(HAND)]
+    # 8m を 8p と読み間違えた枠（2番目の候補が正解）
+    dets[7] = _det(7, ("8p", 0.6), ("8m", 0.35))
+    found = search_hand(dets)
+    assert sorted(code for code, _, _ in found["kept"]) == sorted(HAND)
+    assert found["corrections"] == [{"bbox": dets[7]["bbox"], "from": "8p", "to": "8m", "confidence": 0.35}]
+    assert not found["timed_out"]
+
+
+def test_drops_extra_box():
+    dets = [_det(i, (code, 0.95)) for i, code in enumerate(HAND)] + [_det(14, ("7z", 0.55))]
+    found = search_hand(dets)
+    assert sorted(code for code, _, _ in found["kept"]) == sorted(HAND)
+    assert found["corrections"][0]["to"] is None
+
+
+def test_duplicate_candidates_keep_highest_confidence():
+    d = _det(0, ("1m", 0.3), ("2m", 0.5), ("1m", 0.7))
+    assert _box_candidates(d) == [("1m", 0.7), ("2m", 0.5)]
+
+
+def test_timeout_returns_best_found_so_far():
+    dets = [_det(i, (code, 0.95), ("9s", 0.04)) for i, code in enumerate(HAND)]
+    found = search_hand(dets, time_budget_ms=0)
+    assert found is not None and found["timed_out"]
+    assert sorted(code for code, _, _ in found["kept"]) == sorted(HAND)
+
+
+def test_too_few_boxes():
+    assert search_hand([_det(i, (code, 0.95)) for i, code in enumerate(HAND[:13])]) is None
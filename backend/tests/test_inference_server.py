@@ -0,0 +1,81 @@
+import threading
+
+import numpy as np
+import pytest
+
+from inference_server import InferenceServer, SlotPoolExhausted, _finish
+
+
+@pytest.fixture
+def server():
+    """推論プロセスを起動しないスロットのプール（推論プロセス側の処理はテストで代行する）"""
+    s = InferenceServer("unused.pt", slots=2, max_side=64, batch_size=1)
+    yield s
+    s.stop()
+
+
+def _image(value, shape=(32, 48, 3)):
+    return np.full(shape, value, dtype=np.uint8)
+
+
+def _fake_serve(server, count):
+    """制御キューの要求を count 件受け取り、推論プロセスと同じ手順で結果を返すスレッド"""
+    def run():
+        for _ in range(count):
+            request_id, slot, shape, _, _, _ = server._requests.get(timeout=5)
+            frame = server.frame(slot, shape)
+            _finish(server._replies, server._free, slot, request_id, [{"value": int(frame[0, 0, 0])}])
+    thread = threading.Thread(target=run, daemon=True)
+    thread.start()
+    return thread
+
+
+def test_slot_round_trip_shares_memory(server):
+    slot = server.acquire()
+    image = _image(7)
+    shape = server.write(slot, image)
+
+    view = server.frame(slot, shape)
+    assert np.array_equal(view, image)
+    # 同じスロットの配列はコピーではなく共有メモリそのもの
+    assert np.shares_memory(view, server.frame(slot, shape))
+    view[0, 0, 0] = 99
+    assert server.frame(slot, shape)[0, 0, 0] == 99
+    server.release(slot)
+
+
+def test_acquire_raises_when_all_slots_taken(server):
+    slots = [server.acquire() for _ in range(server.slot_count)]
+    with pytest.raises(SlotPoolExhausted):
+        server.acquire(timeout=0.05)
+    for slot in slots:
+        server.release(slot)
+    assert server.acquire(timeout=0.05) in slots
+
+
+def test_timed_out_slot_stays_reserved_until_served(server):
+    with pytest.raises(TimeoutError):
+        server.detect_many([_image(1), _image(2)], imgsz=64, conf=0.25, timeout=0.05)
+    # 推論プロセスが読み終えるまで、タイムアウトしたスロットは他の要求に渡さない
+    with pytest.raises(SlotPoolExhausted):
+        server.acquire(timeout=0.05)
+
+    _fake_serve(server, 2).join(timeout=5)
+    # 空きに戻ったスロットでは、タイムアウトした要求の古い応答を読み捨てて自分の結果を受け取る
+    _fake_serve(server, 1)
+    assert server.detect_many([_image(3)], imgsz=64, conf=0.25, timeout=5) == [[{"value": 3}]]
+
+
+def test_more_frames_than_slots_are_chunked(server):
+    _fake_serve(server, 5)
+    frames = [_image(v) for v in range(5)]
+    results = server.detect_many(frames, imgsz=64, conf=0.25, timeout=5)
+    assert [r[0]["value"] for r in results] == list(range(5))
+
+
+def test_stop_is_ignored_outside_owner_process(server):
+    owner = server._owner_pid
+    server._owner_pid = owner + 1  # fork したワーカーから呼ばれた場合と同じ
+    server.stop()
+    assert server._shms
+    server._owner_pid = owner
@@ -0,0 +1,99 @@
+import os
+import sys
+import threading
+import time
+import types
+
+import pytest
+
+import model_registry
+from model_registry import ModelRegistry, SerializedModel, model_file, save_registry
+
+
+@pytest.fixture
+def registry_path(tmp_path, monkeypatch):
+    models = tmp_path / "models"
+    models.mkdir()
+    monkeypatch.setattr(model_registry, "MODELS_DIR", str(models))
+    path = str(models / "registry.json")
+    save_registry({"active": "a", "models": {"a": str(models / "a.pt"), "b": str(models / "b.pt")}}, path)
+    return path
+
+
+def test_model_file_rejects_paths_outside_models_dir(registry_path, tmp_path):
+    models = os.path.dirname(registry_path)
+    assert model_file(os.path.join(models, "a.pt")) == os.path.realpath(os.path.join(models, "a.pt"))
+    with pytest.raises(ValueError):
+        model_file(str(tmp_path / "evil.pt"))
+    with pytest.raises(ValueError):
+        model_file(os.path.join(models, "..", "evil.pt"))
+
+
+def test_other_worker_sees_activation(registry_path):
+    worker_a, worker_b = ModelRegistry(registry_path), ModelRegistry(registry_path)
+
+    def change(registry):
+        registry["active"] = "b"
+    with worker_a._lock:
+        worker_a._update(change)
+
+    assert worker_b.status()["active"] == "b"
+    assert worker_b.status()["generation"] == worker_a.status()["generation"]
+
+
+class _FakeModel:
+    def __init__(self, path):
+        self.path = path
+        self.running = 0
+        self.overlapped = False
+
+    def predict(self, **kwargs):
+        self.running += 1
+        self.overlapped |= self.running > 1
+        time.sleep(0.01)
+        self.running -= 1
+        return []
+
+
+def test_predict_is_serialized_per_model():
+    model = _FakeModel("a.pt")
+    wrapped = SerializedModel(model)
+    threads = [threading.Thread(target=wrapped.predict, kwargs={"source": []}) for _ in range(4)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert not model.overlapped and wrapped.path == "a.pt"
+
+
+def test_new_active_model_is_warmed_before_use(registry_path, monkeypatch):
+    models = os.path.dirname(registry_path)
+    for name in ("a.pt", "b.pt"):
+        open(os.path.join(models, name), "wb").close()
+    release = threading.Event()
+
+    def load_model(path, cached=True):
+        if path.endswith("b.pt"):
+            release.wait(timeout=5)
+        return _FakeModel(path)
+    monkeypatch.setitem(sys.modules, "detector", types.SimpleNamespace(load_model=load_model))
+    warmed = []
+    worker_a = ModelRegistry(registry_path)
+    worker_b = ModelRegistry(registry_path, warm=lambda model: warmed.append(model.path) or {"960x1": 1.0})
+    assert worker_b.active()[0] == "a"
+
+    def change(registry):
+        registry["active"] = "b"
+    with worker_a._lock:
+        worker_a._update(change)
+
+    # b の読み込みが終わるまでは a で推論する
+    assert worker_b.active()[0] == "a"
+    release.set()
+    deadline = time.monotonic() + 5
+    while worker_b._loading and time.monotonic() < deadline:
+        time.sleep(0.01)
+    version, model = worker_b.active()
+    assert version == "b" and model.path.endswith("b.pt")
+    assert [os.path.basename(p) for p in warmed] == ["a.pt", "b.pt"]
+    assert worker_b.status()["models"]["b"]["warmup"] == {"960x1": 1.0}
@@ -0,0 +1,56 @@
+import threading
+import time
+
+import pytest
+
+import profiling
+from profiling import ProfilerBusy, load_result, request_finished, request_started, stage, start_profile
+
+
+@pytest.fixture(autouse=True)
+def profile_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(profiling, "PROFILE_DIR", str(tmp_path))
+
+
+def _wait_result(pid, timeout=5):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        result = load_result(pid)
+        if result and not result["running"]:
+            return result
+        time.sleep(0.01)
+    raise AssertionError("計測が終わりません")
+
+
+def slow_request(started, stop):
+    request_started()
+    started.set()
+    try:
+        while not stop.is_set():
+            time.sleep(0.001)
+    finally:
+        request_finished()
+
+
+def test_samples_requests_started_before_the_session():
+    started, stop = threading.Event(), threading.Event()
+    worker = threading.Thread(target=slow_request, args=(started, stop))
+    worker.start()
+    started.wait(timeout=5)
+
+    t0 = time.perf_counter()
+    status = start_profile(0.2, interval_ms=5)
+    # 標本は専用のスレッドで取るので、呼び出した側はすぐに戻る
+    assert time.perf_counter() - t0 < 0.1
+    assert status["running"]
+    with pytest.raises(ProfilerBusy):
+        start_profile(0.2)
+    with stage("work"):
+        time.sleep(0.01)
+
+    result = _wait_result(status["pid"])
+    stop.set()
+    worker.join(timeout=5)
+    assert result["samples"] > 0
+    assert "slow_request" in result["collapsed"]
+    assert result["stages"]["work"]["count"] == 1
@@ -0,0 +1,33 @@
+import json
+
+from replay import ReplayStats, read_log, replay, score_record
+
+HAND = ["1m", "2m", "3m", "4p", "5p", "6p", "7s", "8s", "9s", "2z", "2z", "2z", "5m", "5m"]
+
+
+def _record(**kwargs):
+    return dict({"id": "r1", "tiles": HAND, "win_tile": "5m", "riichi": True}, **kwargs)
+
+
+def test_compares_recorded_fields():
+    result = score_record((1, _record(recorded={"han": 99, "fu": 40})))
+    assert result["mismatch"] == ["han"]
+    assert result["recorded"] == {"han": 99, "fu": 40}
+
+
+def test_non_object_recorded_is_an_error():
+    result = score_record((3, _record(recorded=8000)))
+    assert result["line"] == 3 and result["id"] == "r1"
+    assert "recorded" in result["error"]
+
+
+def test_bad_lines_do_not_stop_the_pool(tmp_path):
+    log = tmp_path / "log.jsonl"
+    lines = [json.dumps(_record()), json.dumps(_record(recorded=8000)), "[1, 2]", "{broken", json.dumps(_record())]
+    log.write_text("\n".join(lines) + "\n", encoding="utf-8")
+    stats = ReplayStats()
+    results = list(replay(read_log(str(log)), workers=2, chunksize=1))
+    for result in results:
+        stats.add(result)
+    assert [r["line"] for r in results] == [1, 2, 3, 4, 5]
+    assert stats.summary()["scored"] == 2 and stats.summary()["errors"] == 3
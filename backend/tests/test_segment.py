@@ -0,0 +1,46 @@
+import numpy as np
+
+from segment import _class_id_for, segment_tile_row
+
+
+def _row(widths, gap=6, height=80, margin=20):
+    """暗い背景に白い牌（幅 widths）を gap 空けて並べた手牌画像"""
+    image = np.zeros((height + 2 * margin, sum(widths) + gap * len(widths) + 2 * margin, 3), dtype=np.uint8)
+    x = margin
+    boxes = []
+    for w in widths:
+        image[margin:margin + height, x:x + w] = 255
+        boxes.append((x, x + w))
+        x += w + gap
+    return image, boxes
+
+
+def test_splits_separated_tiles():
+    image, boxes = _row([60] * 14)
+    slots = segment_tile_row(image)
+    assert len(slots) == 14
+    for (x1, _, x2, _), (bx1, bx2) in zip(slots, boxes):
+        assert abs(x1 - bx1) <= 2 and abs(x2 - bx2) <= 2
+
+
+def test_splits_touching_tiles_by_unit_width():
+    # 2枚ずつくっついた区間は1牌幅で割って分割する
+    image, _ = _row([60] * 10 + [120] * 2)
+    slots = segment_tile_row(image)
+    assert len(slots) == 14
+    widths = [x2 - x1 for x1, _, x2, _ in slots]
+    assert max(widths) - min(widths) <= 3
+
+
+def test_ambiguous_rows_return_none():
+    # 牌数が想定外
+    assert segment_tile_row(_row([60] * 5)[0]) is None
+    # 1牌幅の整数倍にならない区間がある
+    assert segment_tile_row(_row([60] * 12 + [90])[0]) is None
+    # 牌が写っていない
+    assert segment_tile_row(np.zeros((120, 400, 3), dtype=np.uint8)) is None
+
+
+def test_unknown_class_name_has_no_class_id():
+    assert _class_id_for("1m") == 0
+    assert _class_id_for("background") is None
@@ -0,0 +1,81 @@
+import pytest
+
+import session
+from session import SessionStore, apply_delta, new_state, normalize_wind, rescore
+
+HAND = ["1m", "2m", "3m", "4m", "5m", "6m", "7m", "8m", "9m", "1p", "2p", "3p", "5p", "5p"]
+
+
+@pytest.fixture
+def state():
+    return new_state(HAND, 13, ["1z"], {"riichi": True, "roundWind": "east", "playerWind": "南"})
+
+
+def test_winds_are_stored_in_one_form(state):
+    assert state["roundWind"] == "東" and state["playerWind"] == "南"
+    assert normalize_wind("West") == "西"
+    with pytest.raises(ValueError):
+        normalize_wind("center")
+    with pytest.raises(ValueError):
+        new_state(HAND, 13, [], {"roundWind": ["東"]})
+
+
+def test_rescore_after_english_winds(state):
+    new = apply_delta(state, {"riichi": False, "playerWind": "north", "addDora": ["4m"]})
+    assert new["playerWind"] == "北"
+    result = rescore(new)
+    assert result["han"] >= 1
+
+
+def test_apply_delta_replaces_and_leaves_original(state):
+    new = apply_delta(state, {"replaceTiles": [{"index": 0, "tile": "0m"}], "winIndex": 2,
+                              "removeDora": [0, 0], "winType": "ron"})
+    assert new["tiles"][0] == "0m" and state["tiles"][0] == "1m"
+    assert new["win_index"] == 2 and new["dora"] == [] and state["dora"] == ["1z"]
+    assert new["winType"] == "ron"
+
+
+@pytest.mark.parametrize("delta", [
+    ["riichi"],
+    "riichi",
+    {"replaceTiles": {"index": 0, "tile": "1m"}},
+    {"replaceTiles": ["1m"]},
+    {"replaceTiles": [{"index": 14, "tile": "1m"}]},
+    {"replaceTiles": [{"index": True, "tile": "1m"}]},
+    {"replaceTiles": [{"index": 0, "tile": "1x"}]},
+    {"winIndex": -1},
+    {"winType": "draw"},
+    {"roundWind": "center"},
+    {"addDora": "1z"},
+    {"removeDora": [3]},
+])
+def test_apply_delta_rejects_invalid(state, delta):
+    with pytest.raises(ValueError):
+        apply_delta(state, delta)
+
+
+def test_store_purges_expired_sessions(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(session.time, "monotonic", lambda: now[0])
+    store = SessionStore(ttl=10)
+    old = store.create({"n": 1})
+    now[0] += 5
+    fresh = store.create({"n": 2})
+    now[0] += 6
+    # old は最後の参照から 11 秒、fresh は 6 秒
+    assert store.get(old) is None and store.lock(old) is None
+    assert store.get(fresh) == {"n": 2}
+    assert len(store) == 1
+    assert not store.update(old, {"n": 3})
+
+
+def test_store_drops_oldest_over_max_sessions():
+    store = SessionStore(max_sessions=2)
+    first, second = store.create({"n": 1}), store.create({"n": 2})
+    # 参照した second は新しい扱いになり、最も古い first が破棄される
+    store.get(first)
+    store.get(second)
+    third = store.create({"n": 3})
+    assert len(store) == 2
+    assert store.get(first) is None
+    assert store.get(second) == {"n": 2} and store.get(third) == {"n": 3}
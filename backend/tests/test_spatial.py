@@ -0,0 +1,50 @@
+import numpy as np
+
+from caluculate import CLASS_ID_TO_CODE
+from spatial import CLS, CONF, ordered_hand, suppress_overlaps
+
+HAND = ["1m", "2m", "3m", "4m", "5m", "6m", "7m", "8m", "9m", "1p", "2p", "3p", "5p", "5p"]
+
+
+def _row(codes, x0=0, width=40, gap=2, conf=0.9):
+    """x0 から幅 width・間隔 gap で横に並べた枠の配列"""
+    rows = []
+    for i, code in enumerate(codes):
+        x = x0 + i * (width + gap)
+        rows.append((x, 0, x + width, 60, conf, CLASS_ID_TO_CODE.index(code)))
+    return np.array(rows, dtype=np.float64)
+
+
+def test_suppress_overlaps_keeps_most_confident_box_per_tile():
+    arr = _row(HAND[:3])
+    # 2枚目の牌に重なった別クラスの枠（信頼度が高い）と、1枚目に重なった信頼度の低い枠
+    extra = np.array([(43, 1, 83, 61, 0.95, CLASS_ID_TO_CODE.index("2p")),
+                      (1, 0, 41, 60, 0.2, CLASS_ID_TO_CODE.index("7z"))])
+    kept, groups = suppress_overlaps(np.vstack([extra, arr]))
+    assert [CLASS_ID_TO_CODE[int(c)] for c in kept[:, CLS]] == ["1m", "2p", "3m"]
+    assert sorted(len(g) for g in groups) == [1, 2, 2]
+    assert kept[1, CONF] == 0.95
+
+
+def test_suppress_overlaps_empty():
+    kept, groups = suppress_overlaps(np.zeros((0, 6)))
+    assert len(kept) == 0 and groups == []
+
+
+def test_ordered_hand_finds_draw_gap():
+    # 和了牌の 5p だけ離して右端に置く（入力の枠の順序は問わない）
+    arr = np.vstack([_row(HAND[:13]), _row(HAND[13:], x0=13 * 42 + 30)])
+    hand = ordered_hand(arr[::-1])
+    assert hand["tiles"] == HAND
+    assert hand["has_gap"] and hand["win_index"] == 13 and hand["win_tile"] == "5p"
+    assert hand["concealed"] == HAND[:13]
+    assert ordered_hand(arr, context=arr)["has_gap"]
+
+
+def test_pruned_tile_is_not_mistaken_for_draw_gap():
+    # 選択で 13 枚目が除かれると末尾の前に牌1枚分の空きができるが、選択前の並びには隙間が無い
+    full = _row(HAND + ["7z"])
+    kept = np.delete(full, 13, axis=0)
+    assert ordered_hand(kept)["has_gap"]
+    hand = ordered_hand(kept, context=full)
+    assert not hand["has_gap"] and hand["win_index"] == 13
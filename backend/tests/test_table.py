@@ -0,0 +1,77 @@
+import numpy as np
+
+from table import cluster_rows, detect_tiled, iter_windows, split_table
+
+
+def test_iter_windows_covers_image_with_overlap():
+    height, width = 2000, 3000
+    windows = list(iter_windows(height, width, tile_size=960, overlap=0.25))
+    covered = np.zeros((height, width), dtype=bool)
+    for x1, y1, x2, y2 in windows:
+        assert x2 - x1 == 960 and y2 - y1 == 960
+        covered[y1:y2, x1:x2] = True
+    assert covered.all()
+    # 最後のタイルは画像の端にそろえる
+    assert max(x2 for _, _, x2, _ in windows) == width
+    assert max(y2 for _, _, _, y2 in windows) == height
+    # 隣り合うタイルは少なくとも overlap 分重なる
+    xs = sorted({x1 for x1, _, _, _ in windows})
+    assert all(b - a <= 960 * 0.75 for a, b in zip(xs, xs[1:]))
+
+
+def test_iter_windows_small_image_is_one_window():
+    assert list(iter_windows(500, 700, tile_size=960)) == [(0, 0, 700, 500)]
+
+
+def test_detect_tiled_with_inference_server_results():
+    calls = []
+
+    def detect_many(images, imgsz, conf, top_k=1):
+        calls.append((len(images), imgsz))
+        # 各タイルの同じ位置に1枚ずつ検出する
+        return [[{"class_id": 3, "confidence": 0.9, "bbox": [100, 100, 140, 160]}] for _ in images]
+
+    arr = detect_tiled(np.zeros((960, 1500, 3), dtype=np.uint8), detect_many=detect_many)
+    assert calls == [(2, 960)]
+    assert sorted(arr[:, 0].tolist()) == [100, 640]
+    assert (arr[:, 5] == 3).all()
+
+
+def _line(n, x0, y0, w=40, h=56, gap=4, vertical=False, cls=0):
+    rows = []
+    for i in range(n):
+        if vertical:
+            x, y = x0, y0 + i * (w + gap)
+            rows.append((x, y, x + h, y + w, 0.9, cls))
+        else:
+            x, y = x0 + i * (w + gap), y0
+            rows.append((x, y, x + w, y + h, 0.9, cls))
+    return np.array(rows, dtype=np.float64)
+
+
+def test_cluster_rows_separates_lines():
+    bottom = _line(14, 300, 900)
+    right = _line(13, 1100, 200, vertical=True)
+    lone = _line(1, 600, 500)
+    arr = np.vstack([bottom, right, lone])
+    groups = sorted(cluster_rows(arr), key=len)
+    assert [len(g) for g in groups] == [1, 13, 14]
+    assert set(groups[2]) == set(range(14))
+    assert set(groups[1]) == set(range(14, 27))
+    assert cluster_rows(np.zeros((0, 6))) == []
+
+
+def test_cluster_rows_does_not_join_different_sizes():
+    small = _line(3, 100, 100, w=20, h=28)
+    large = _line(3, 100 + 3 * 24, 100, w=40, h=56)
+    assert len(cluster_rows(np.vstack([small, large]))) == 2
+
+
+def test_split_table_assigns_seats_and_dora():
+    bottom = _line(14, 300, 900)
+    top = _line(13, 300, 50)
+    dora = _line(2, 560, 480, cls=5)
+    hands, dora_rows = split_table(np.vstack([bottom, top, dora]), (1000, 1200, 3))
+    assert sorted(hands) == ["bottom", "top"]
+    assert len(hands["bottom"]) == 14 and len(hands["top"]) == 13
+    assert len(dora_rows) == 2 and (dora_rows[:, 5] == 5).all()
@@ -3,6 +3,20 @@ let handTilesImages = [];
 let doraTilesImages = [];
 let cameraStream = null;
 let unifiedImage = null;
+// 撮影したフレーム（canvas）または選択した画像の data URL
+let burstFrames = [];
+// 送信用に縮小した全体画像（切り出し範囲の確定時に1回だけ作る）
+let uploadFrames = [];
+
+// 連写モード（「連写モード」を選んだ場合のみ。同じ構図を数フレーム撮影し、サーバー側で合議して誤認識を減らす）
+const BURST_FRAME_COUNT = 4;
+const BURST_INTERVAL_MS = 120;
+
+// 単一アップロード（全体画像＋切り出し範囲を送り、切り出しはサーバー側で行う）
+// cropRects は画像に対する正規化座標 {x, y, width, height}
+let cropRects = null;
+// 切り出し範囲の長辺の上限（これより大きくしても推論時に縮小される。/api/config で上書き）
+let maxRegionSide = 960;
 
 // DOM要素の取得
 const form = document.getElementById('mahjongForm');
@@ -29,8 +43,27 @@ document.addEventListener('DOMContentLoaded', function() {
     
     // モーダル関連のイベントリスナー
     setupImageModal();
+    
+    // アップロード設定の取得
+    loadUploadConfig();
 });
 
+// サーバーのアップロード設定を取得（失敗した場合は既定値のまま）
+async function loadUploadConfig() {
+    try {
+        const response = await fetch('https://mahjong-rcg-client.onrender.com/api/config');
+        // const response = await fetch('http://localhost:5001/api/config');
+        if (response.ok) {
+            const config = await response.json();
+            if (config.maxRegionSide) {
+                maxRegionSide = config.maxRegionSide;
+            }
+        }
+    } catch (error) {
+        console.warn('⚠️ アップロード設定の取得に失敗しました:', error.message);
+    }
+}
+
 // 統合カメラを開く
 function openUnifiedCamera() {
     if (navigator.mediaDevices && navigator.mediaDevices.getUserMedia) {
@@ -298,20 +331,30 @@ function captureUnifiedPhoto(video, modal) {
     // 既存の画像をクリア
     clearExistingImages();
     
-    const canvas = document.createElement('canvas');
-    const context = canvas.getContext('2d');
-    
-    canvas.width = video.videoWidth;
-    canvas.height = video.videoHeight;
-    context.drawImage(video, 0, 0);
-    
-    const imageData = canvas.toDataURL('image/jpeg', 0.8);
-    unifiedImage = imageData;
-    
-    // カメラ撮影でも画像エディターを表示
-    showImageEditor(imageData);
-    
-    closeCamera(modal);
+    // 連写モードの場合のみ、短い間隔で数フレームを撮影する
+    const frameCount = document.getElementById('burstMode').checked ? BURST_FRAME_COUNT : 1;
+    burstFrames = [];
+    const grabFrame = function() {
+        // フレームは canvas のまま保持し、JPEG へのエンコードは送信用に縮小してから行う
+        const canvas = document.createElement('canvas');
+        canvas.width = video.videoWidth;
+        canvas.height = video.videoHeight;
+        canvas.getContext('2d').drawImage(video, 0, 0);
+        burstFrames.push(canvas);
+        if (burstFrames.length < frameCount) {
+            setTimeout(grabFrame, BURST_INTERVAL_MS);
+            return;
+        }
+        
+        // エディターには1枚目だけを表示する
+        unifiedImage = burstFrames[0].toDataURL('image/jpeg', 0.8);
+        
+        // カメラ撮影でも画像エディターを表示（切り出し範囲は全フレーム共通）
+        showImageEditor(unifiedImage);
+        
+        closeCamera(modal);
+    };
+    grabFrame();
 }
 
 // カメラを閉じる
@@ -340,6 +383,7 @@ function handleUnifiedFileSelect(event) {
         reader.onload = function(e) {
             const imageData = e.target.result;
             unifiedImage = imageData;
+            burstFrames = [imageData];
             showImageEditor(imageData);
         };
         reader.readAsDataURL(file);
@@ -376,6 +420,7 @@ function setupDragAndDrop(areaId, type) {
             reader.onload = function(e) {
                 const imageData = e.target.result;
                 unifiedImage = imageData;
+                burstFrames = [imageData];
                 showImageEditor(imageData);
             };
             reader.readAsDataURL(file);
@@ -681,45 +726,23 @@ function cropImages() {
     const handBox = document.getElementById('handCropBox');
     const doraBox = document.getElementById('doraCropBox');
     
-    const img = new Image();
-    img.onload = function() {
-        const canvas = document.createElement('canvas');
-        const context = canvas.getContext('2d');
-        
-        // 手牌エリアを切り出し
-        const handRect = handBox.getBoundingClientRect();
-        const parentRect = handBox.parentElement.getBoundingClientRect();
-        const handCanvas = document.createElement('canvas');
-        const handContext = handCanvas.getContext('2d');
-        
-        const handX = (handRect.left - parentRect.left) / parentRect.width * img.width;
-        const handY = (handRect.top - parentRect.top) / parentRect.height * img.height;
-        const handW = handRect.width / parentRect.width * img.width;
-        const handH = handRect.height / parentRect.height * img.height;
-        
-        handCanvas.width = handW;
-        handCanvas.height = handH;
-        handContext.drawImage(img, handX, handY, handW, handH, 0, 0, handW, handH);
-        const handImageData = handCanvas.toDataURL('image/jpeg', 0.8);
-        
-        // ドラ表示牌エリアを切り出し
-        const doraRect = doraBox.getBoundingClientRect();
-        const doraCanvas = document.createElement('canvas');
-        const doraContext = doraCanvas.getContext('2d');
-        
-        const doraX = (doraRect.left - parentRect.left) / parentRect.width * img.width;
-        const doraY = (doraRect.top - parentRect.top) / parentRect.height * img.height;
-        const doraW = doraRect.width / parentRect.width * img.width;
-        const doraH = doraRect.height / parentRect.height * img.height;
-        
-        doraCanvas.width = doraW;
-        doraCanvas.height = doraH;
-        doraContext.drawImage(img, doraX, doraY, doraW, doraH, 0, 0, doraW, doraH);
-        const doraImageData = doraCanvas.toDataURL('image/jpeg', 0.8);
-        
-        // 配列をクリアして新しい画像を追加
-        handTilesImages = [handImageData];
-        doraTilesImages = [doraImageData];
+    const parentRect = handBox.parentElement.getBoundingClientRect();
+    
+    // 切り出し範囲を正規化座標で保持（送信時はサーバー側で切り出す）
+    cropRects = {
+        hand: normalizeRect(handBox.getBoundingClientRect(), parentRect),
+        dora: normalizeRect(doraBox.getBoundingClientRect(), parentRect)
+    };
+    
+    if (burstFrames.length === 0) {
+        burstFrames = [editorImage.src];
+    }
+    Promise.all(burstFrames.map(loadFrame)).then(function(frames) {
+        // 送信用の縮小画像をここで1回だけ作り、プレビューは縮小した1枚目から切り出す
+        const scaled = frames.map(frame => downscaleFrame(frame, [cropRects.hand, cropRects.dora]));
+        uploadFrames = scaled.map(canvas => canvas.toDataURL('image/jpeg', 0.8));
+        handTilesImages = [cropRegion(scaled[0], cropRects.hand)];
+        doraTilesImages = [cropRegion(scaled[0], cropRects.dora)];
         
         // プレビューを更新
         updatePreview('handTilesPreview', handTilesImages);
@@ -727,8 +750,70 @@ function cropImages() {
         
         // エディターを非表示
         document.getElementById('imageEditor').style.display = 'none';
+    });
+}
+
+// フレームを描画できる形で返す（撮影した canvas はそのまま、data URL は読み込む）
+function loadFrame(frame) {
+    return frame instanceof HTMLCanvasElement ? Promise.resolve(frame) : loadImage(frame);
+}
+
+// 画像データを読み込む
+function loadImage(src) {
+    return new Promise(function(resolve, reject) {
+        const img = new Image();
+        img.onload = function() { resolve(img); };
+        img.onerror = reject;
+        img.src = src;
+    });
+}
+
+// クロップボックスの範囲を画像に対する正規化座標に変換
+function normalizeRect(rect, parentRect) {
+    return {
+        x: (rect.left - parentRect.left) / parentRect.width,
+        y: (rect.top - parentRect.top) / parentRect.height,
+        width: rect.width / parentRect.width,
+        height: rect.height / parentRect.height
+    };
+}
+
+// 正規化座標の範囲を画像から切り出す（長辺は maxRegionSide まで縮小）
+function cropRegion(img, rect) {
+    const canvas = document.createElement('canvas');
+    const context = canvas.getContext('2d');
+    
+    const x = rect.x * img.width;
+    const y = rect.y * img.height;
+    const w = rect.width * img.width;
+    const h = rect.height * img.height;
+    const scale = Math.min(1, maxRegionSide / Math.max(w, h));
+    
+    canvas.width = w * scale;
+    canvas.height = h * scale;
+    context.drawImage(img, x, y, w, h, 0, 0, canvas.width, canvas.height);
+    return canvas.toDataURL('image/jpeg', 0.8);
+}
+
+// 全体画像を、切り出し範囲の長辺が maxRegionSide に収まる大きさまで縮小した canvas にする
+function downscaleFrame(img, rects) {
+    const regionSide = Math.max(...rects.map(r => Math.max(r.width * img.width, r.height * img.height)));
+    const scale = Math.min(1, maxRegionSide / regionSide);
+    
+    const canvas = document.createElement('canvas');
+    canvas.width = Math.round(img.width * scale);
+    canvas.height = Math.round(img.height * scale);
+    canvas.getContext('2d').drawImage(img, 0, 0, canvas.width, canvas.height);
+    return canvas;
+}
+
+// 単一アップロード用のデータ（切り出し時に縮小済みの全体画像＋切り出し範囲）を作成
+function buildSingleUpload() {
+    return {
+        frames: uploadFrames,
+        handRect: cropRects.hand,
+        doraRect: doraTilesImages.length > 0 ? cropRects.dora : null
     };
-    img.src = editorImage.src;
 }
 
 // 切り出しをキャンセル
@@ -790,6 +875,9 @@ function clearExistingImages() {
     handTilesImages = [];
     doraTilesImages = [];
     unifiedImage = null;
+    burstFrames = [];
+    uploadFrames = [];
+    cropRects = null;
     
     // プレビューをクリア
     updatePreview('handTilesPreview', handTilesImages);
@@ -836,10 +924,14 @@ async function handleFormSubmit(event) {
     calculateBtn.disabled = true;
     
     try {
+        // 画像データ（切り出し範囲がある場合は全体画像を1枚送り、サーバー側で切り出す）
+        const imageData = cropRects && uploadFrames.length > 0
+            ? buildSingleUpload()
+            : { handTiles: handTilesImages, doraTiles: doraTilesImages };
+        
         // フォームデータの取得
         const formData = {
-            handTiles: handTilesImages,
-            doraTiles: doraTilesImages,
+            ...imageData,
             riichi: document.getElementById('riichi').checked,
             winType: document.getElementById('winType').value,
             roundWind: document.getElementById('roundWind').value,